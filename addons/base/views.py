@@ -717,6 +717,10 @@ def addon_view_or_download_file(auth, path, provider, **kwargs):
 
     savepoint_id = transaction.savepoint()
     file_node = BaseFileNode.resolve_class(provider, BaseFileNode.FILE).get_or_create(target, path)
+    created = file_node.pk is None
+    if created and provider != 'osfstorage':
+        # Concurrent first views of the same file would otherwise race to insert it
+        BaseFileNode.bulk_upsert([file_node])
 
     # Note: Cookie is provided for authentication to waterbutler
     # it is overriden to force authentication as the current user
@@ -732,7 +736,7 @@ def addon_view_or_download_file(auth, path, provider, **kwargs):
         # File is either deleted or unable to be found in the provider location
         # Rollback the insertion of the file_node
         transaction.savepoint_rollback(savepoint_id)
-        if not file_node.pk:
+        if created:
             file_node = BaseFileNode.load(path)
 
             if file_node.kind == 'folder':
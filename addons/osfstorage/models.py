@@ -16,7 +16,7 @@ from osf.exceptions import InvalidTagError, NodeStateError, TagNotFoundError
 from framework.auth.core import Auth
 from osf.models.mixins import Loggable
 from osf.models import AbstractNode
-from osf.models.files import File, FileVersion, Folder, TrashedFileNode, BaseFileNode, BaseFileNodeManager
+from osf.models.files import File, FileVersion, Folder, TrashedFile, TrashedFileNode, BaseFileNode, BaseFileNodeManager
 from osf.models.metaschema import FileMetadataSchema
 from osf.utils import permissions
 from website.files import exceptions
@@ -44,6 +44,12 @@ class OsfStorageFileNode(BaseFileNode):
 
     @property
     def materialized_path(self):
+        # Stored on save; nodes written before paths were stored fall back to walking up the tree
+        if self._materialized_path:
+            return self._materialized_path
+        return self.compute_materialized_path()
+
+    def compute_materialized_path(self):
         sql = """
             WITH RECURSIVE materialized_path_cte(parent_id, GEN_PATH) AS (
               SELECT
@@ -75,6 +81,56 @@ class OsfStorageFileNode(BaseFileNode):
                 path = path + '/'
             return path
 
+    def get_expected_materialized_path(self):
+        if self.parent_id is None:
+            return '/'
+        return self.parent.materialized_path + self.name + ('' if self.is_file else '/')
+
+    def update_descendant_paths(self, old_path, new_path):
+        """Rewrite the stored paths of every live node under this folder from ``old_path`` to
+        ``new_path`` in one statement. Descendants whose stored path is missing or does not start
+        with ``old_path`` are left alone to be recomputed on read or by the backfill command.
+        """
+        sql = """
+            WITH RECURSIVE descendants(id) AS (
+              SELECT T.id FROM "{table}" AS T
+              WHERE T.parent_id = %(parent_id)s AND T.type = ANY(%(types)s)
+              UNION ALL
+              SELECT T.id FROM "{table}" AS T
+                JOIN descendants AS D ON T.parent_id = D.id
+              WHERE T.type = ANY(%(types)s)
+            )
+            UPDATE "{table}"
+            SET _materialized_path = %(new_path)s || substr(_materialized_path, %(old_length)s + 1)
+            WHERE id IN (SELECT id FROM descendants) AND left(_materialized_path, %(old_length)s) = %(old_path)s;
+        """.format(table=self._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'parent_id': self.pk,
+                'types': list(OsfStorageFileNode._typedmodels_subtypes),
+                'old_path': old_path,
+                'old_length': len(old_path),
+                'new_path': new_path,
+            })
+            return cursor.rowcount
+
+    def get_lineage(self):
+        """Return this node and its ancestors up to the root, fetched in two queries."""
+        sql = """
+            WITH RECURSIVE lineage(id, parent_id, depth) AS (
+              SELECT T.id, T.parent_id, 0 FROM "{table}" AS T WHERE T.id = %s
+              UNION ALL
+              SELECT T.id, T.parent_id, L.depth + 1 FROM "{table}" AS T
+                JOIN lineage AS L ON T.id = L.parent_id
+            )
+            SELECT id FROM lineage WHERE depth > 0 ORDER BY depth;
+        """.format(table=self._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk])
+            ancestor_ids = [row[0] for row in cursor.fetchall()]
+        ancestors = BaseFileNode.objects.in_bulk(ancestor_ids)
+        return [self] + [ancestors[pk] for pk in ancestor_ids]
+
     @materialized_path.setter
     def materialized_path(self, val):
         # raise Exception('Cannot set materialized path on OSFStorage as it is computed.')
@@ -232,8 +288,16 @@ class OsfStorageFileNode(BaseFileNode):
 
     def save(self):
         self._path = ''
-        self._materialized_path = ''
-        return super(OsfStorageFileNode, self).save()
+        old_path = self._materialized_path
+        rewrite_descendants = False
+        if not self.pk or not old_path or getattr(self, '_materialized_path_state', None) != self.get_materialized_path_state():
+            self._materialized_path = self.get_expected_materialized_path()
+            rewrite_descendants = bool(self.pk and old_path and not self.is_file and old_path != self._materialized_path)
+        ret = super(OsfStorageFileNode, self).save()
+        if rewrite_descendants:
+            self.update_descendant_paths(old_path, self._materialized_path)
+        self._materialized_path_state = self.get_materialized_path_state()
+        return ret
 
 
 class OsfStorageFile(OsfStorageFileNode, File):
@@ -435,6 +499,60 @@ class OsfStorageFolder(OsfStorageFileNode, Folder):
 
         return False
 
+    def _update_descendant_paths_from_tree(self, trashing):
+        """Store the path of every live descendant, computed from this folder's path in one statement.
+        Trashed nodes keep their ``_id`` based ``path`` in ``_path``, as ``OsfStorageFileNode.delete`` does.
+        """
+        sql = """
+            WITH RECURSIVE paths(id, path) AS (
+              SELECT T.id, %(root_path)s || T.name || CASE WHEN T.type = %(folder_type)s THEN '/' ELSE '' END
+              FROM "{table}" AS T
+              WHERE T.parent_id = %(parent_id)s AND T.type = ANY(%(types)s)
+              UNION ALL
+              SELECT T.id, P.path || T.name || CASE WHEN T.type = %(folder_type)s THEN '/' ELSE '' END
+              FROM paths AS P
+                JOIN "{table}" AS T ON T.parent_id = P.id
+              WHERE T.type = ANY(%(types)s)
+            )
+            UPDATE "{table}" AS T
+            SET _materialized_path = P.path,
+              _path = CASE WHEN %(trashing)s THEN '/' || T._id || CASE WHEN T.type = %(folder_type)s THEN '/' ELSE '' END ELSE '' END
+            FROM paths AS P
+            WHERE T.id = P.id;
+        """.format(table=self._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'root_path': self.materialized_path,
+                'parent_id': self.pk,
+                'folder_type': OsfStorageFolder._typedmodels_type,
+                'types': list(OsfStorageFileNode._typedmodels_subtypes),
+                'trashing': trashing,
+            })
+
+    def _trash_descendants(self, user, deleted_on):
+        from website.search import search
+
+        # Paths are computed from the live tree, so snapshot them before anything is recast
+        self._update_descendant_paths_from_tree(trashing=True)
+        subtree = super(OsfStorageFolder, self)._trash_descendants(user, deleted_on)
+        search.delete_files([_id for _, _id, type_, _ in subtree if type_ == OsfStorageFile._typedmodels_type])
+        return subtree
+
+    def _move_descendants_to_target(self):
+        from website.search import search
+
+        moved = super(OsfStorageFolder, self)._move_descendants_to_target()
+        search.update_files(moved)
+        return moved
+
+    def _restore_descendants(self, deleted_on):
+        from website.search import search
+
+        subtree = super(OsfStorageFolder, self)._restore_descendants(deleted_on)
+        self._update_descendant_paths_from_tree(trashing=False)
+        search.update_files([pk for pk, _, type_, _ in subtree if type_ == TrashedFile._typedmodels_type])
+        return subtree
+
     @property
     def is_preprint_primary(self):
         if hasattr(self.target, 'primary_file') and self.target.primary_file:
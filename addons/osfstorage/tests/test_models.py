@@ -12,7 +12,7 @@ from framework.auth import Auth
 from addons.osfstorage.models import OsfStorageFile, OsfStorageFileNode, OsfStorageFolder
 from osf.exceptions import ValidationError
 from osf.utils.fields import EncryptedJSONField
-from osf_tests.factories import ProjectFactory, UserFactory, PreprintFactory, RegionFactory, NodeFactory
+from osf_tests.factories import CommentFactory, ProjectFactory, UserFactory, PreprintFactory, RegionFactory, NodeFactory
 
 from addons.osfstorage.tests import factories
 from addons.osfstorage.tests.utils import StorageTestCase
@@ -21,6 +21,7 @@ from addons.osfstorage.listeners import delete_files_task
 import datetime
 
 from osf import models
+from osf.management.commands.backfill_osfstorage_materialized_paths import backfill_materialized_paths
 from addons.osfstorage import utils
 from addons.osfstorage import settings
 from website.files.exceptions import FileNodeCheckedOutError, FileNodeIsPrimaryFile
@@ -222,6 +223,44 @@ class TestOsfstorageFileNode(StorageTestCase):
                 None
             )
 
+    def test_delete_folder_nested(self):
+        parent = self.node_settings.get_root().append_folder('Cloud')
+        nested = parent.append_folder('Sky')
+        kid = nested.append_file('Carp')
+        guid = kid.get_guid(create=True)
+        comment = CommentFactory(node=self.project, target=guid, user=self.user)
+
+        parent.delete(user=self.user)
+
+        trashed_folder = models.TrashedFileNode.load(nested._id)
+        trashed_file = models.TrashedFileNode.load(kid._id)
+        assert_equal(trashed_folder.kind, 'folder')
+        assert_equal(trashed_file.kind, 'file')
+        assert_equal(trashed_file.deleted_on, parent.deleted_on)
+        assert_equal(trashed_file.deleted_by, self.user)
+        assert_equal(trashed_file.path, '/' + kid._id)
+        assert_equal(trashed_folder.path, '/' + nested._id + '/')
+        assert_equal(trashed_file._materialized_path, '/Cloud/Sky/Carp')
+        comment.reload()
+        assert_is(comment.root_target, None)
+
+    def test_restore_folder_nested(self):
+        parent = self.node_settings.get_root().append_folder('Cloud')
+        nested = parent.append_folder('Sky')
+        kid = nested.append_file('Carp')
+        trashed_earlier = nested.append_file('Koi')
+        trashed_earlier.delete()
+
+        parent.delete()
+        models.TrashedFileNode.load(parent._id).restore()
+
+        restored = OsfStorageFileNode.load(kid._id)
+        assert_equal(restored.kind, 'file')
+        assert_equal(restored._path, '')
+        assert_equal(restored.materialized_path, '/Cloud/Sky/Carp')
+        assert_equal(OsfStorageFileNode.load(nested._id).kind, 'folder')
+        assert_is(OsfStorageFileNode.load(trashed_earlier._id), None)
+
     def test_delete_file(self):
         child = self.node_settings.get_root().append_file('Test')
         field_names = [f.name for f in child._meta.get_fields() if not f.is_relation and f.name not in ['id', 'content_type_pk']]
@@ -295,6 +334,61 @@ class TestOsfstorageFileNode(StorageTestCase):
         child = self.node_settings.get_root().append_folder('Cloud').append_file('Carp')
         assert_equals('/Cloud/Carp', child.materialized_path)
 
+    def test_materialized_path_is_stored(self):
+        child = self.node_settings.get_root().append_folder('Cloud').append_file('Carp')
+        child = OsfStorageFileNode.load(child._id)
+        assert_equals('/Cloud/Carp', child._materialized_path)
+        assert_equals(child.compute_materialized_path(), child.materialized_path)
+
+    def test_materialized_path_rename(self):
+        child = self.node_settings.get_root().append_file('Carp')
+        child.name = 'Koi'
+        child.save()
+        child.reload()
+        assert_equals('/Koi', child.materialized_path)
+
+    def test_materialized_path_move_folder_rewrites_subtree(self):
+        root = self.node_settings.get_root()
+        folder = root.append_folder('Cloud')
+        nested = folder.append_folder('Sky').append_file('Carp')
+        destination = root.append_folder('Pond')
+
+        folder.move_under(destination, name='Lake')
+
+        nested.reload()
+        assert_equals('/Pond/Lake/Sky/Carp', nested._materialized_path)
+        assert_equals(nested.compute_materialized_path(), nested.materialized_path)
+
+    def test_materialized_path_restore_after_parent_rename(self):
+        folder = self.node_settings.get_root().append_folder('Cloud')
+        child = folder.append_file('Carp')
+        child.delete()
+        folder.name = 'Sky'
+        folder.save()
+
+        models.TrashedFileNode.load(child._id).restore()
+        assert_equals('/Sky/Carp', OsfStorageFileNode.load(child._id)._materialized_path)
+
+    def test_materialized_path_falls_back_when_not_stored(self):
+        child = self.node_settings.get_root().append_folder('Cloud').append_file('Carp')
+        OsfStorageFileNode.objects.filter(id=child.id).update(_materialized_path='')
+        assert_equals('/Cloud/Carp', OsfStorageFileNode.load(child._id).materialized_path)
+
+    def test_backfill_materialized_paths(self):
+        child = self.node_settings.get_root().append_folder('Cloud').append_file('Carp')
+        OsfStorageFileNode.objects.filter(id__in=[child.id, child.parent_id]).update(_materialized_path=None)
+
+        assert_equals(2, backfill_materialized_paths(100, check=True))
+        assert_equals(2, backfill_materialized_paths(100))
+        assert_equals(0, backfill_materialized_paths(100, check=True))
+        assert_equals('/Cloud/Carp', OsfStorageFileNode.load(child._id)._materialized_path)
+
+    def test_get_lineage(self):
+        root = self.node_settings.get_root()
+        folder = root.append_folder('Cloud')
+        child = folder.append_file('Carp')
+        assert_equals([child, folder, root], child.get_lineage())
+
     def test_copy(self):
         to_copy = self.node_settings.get_root().append_file('Carp')
         copy_to = self.node_settings.get_root().append_folder('Cloud')
@@ -24,17 +24,15 @@ from addons.osfstorage.tests.utils import make_payload
 from framework.auth import signing
 from website.util import rubeus, api_url_for
 from framework.auth import cas
-from api.caching.utils import storage_usage_cache
 
 from osf import features
-from osf.models import Tag, QuickFilesNode
+from osf.models import Tag, QuickFilesNode, FileVersionSummary, FileVersionUserMetadata
 from osf.models import files as models
 from addons.osfstorage.apps import osf_storage_root
 from addons.osfstorage import utils
 from addons.base.views import make_auth
 from addons.osfstorage import settings as storage_settings
 from api_tests.utils import create_test_file
-from api.caching.settings import STORAGE_USAGE_KEY
 
 from osf_tests.factories import ProjectFactory, ApiOAuth2PersonalTokenFactory, PreprintFactory
 
@@ -171,6 +169,52 @@ class TestGetMetadataHook(HookTestCase):
         assert_equal(res_date_modified, expected_date_modified)
         assert_equal(res_date_created, expected_date_created)
 
+    def test_children_metadata_versions_and_seen(self):
+        root = self.node_settings.get_root()
+        record = root.append_file('file')
+        first, latest = factories.FileVersionFactory(size=1), factories.FileVersionFactory(size=2)
+        record.versions.add(first, latest)
+        record.save()
+        FileVersionUserMetadata.objects.create(user=self.user, file_version=first)
+        # Files from before summaries were maintained are summarized when listed
+        FileVersionSummary.objects.filter(file=record).delete()
+
+        res = self.send_hook(
+            'osfstorage_get_children',
+            {'fid': root._id, 'user_id': self.user._id},
+            {},
+            self.node
+        )
+        assert_equal(len(res.json), 1)
+        assert_equal(res.json[0]['version'], 2)
+        assert_equal(res.json[0]['size'], 2)
+        assert_equal(res.json[0]['latestVersionSeen'], {'user': self.user._id, 'seen': False})
+        assert_true(FileVersionSummary.objects.filter(file=record, latest_version=latest).exists())
+
+        FileVersionUserMetadata.objects.create(user=self.user, file_version=latest)
+        res = self.send_hook(
+            'osfstorage_get_children',
+            {'fid': root._id, 'user_id': self.user._id},
+            {},
+            self.node
+        )
+        assert_equal(res.json[0]['latestVersionSeen'], {'user': self.user._id, 'seen': True})
+
+    @mock.patch('addons.osfstorage.views.STREAM_CHILDREN_CHUNK_SIZE', 2)
+    def test_children_are_streamed_in_chunks(self):
+        root = self.node_settings.get_root()
+        names = ['file{}'.format(i) for i in range(5)]
+        for name in names:
+            root.append_file(name)
+
+        res = self.send_hook(
+            'osfstorage_get_children',
+            {'fid': root._id, 'user_id': self.user._id},
+            {},
+            self.node
+        )
+        assert_equal(sorted(child['name'] for child in res.json), names)
+
     def test_osf_storage_root(self):
         auth = Auth(self.project.creator)
         result = osf_storage_root(self.node_settings.config, self.node_settings, auth)
@@ -436,27 +480,26 @@ class TestUploadFileHook(HookTestCase):
     # def test_upload_update_deleted(self):
     #     pass
 
-    def test_add_file_updates_cache(self):
+    def test_add_file_updates_storage_usage(self):
         name = 'ლ(ಠ益ಠლ).unicode'
         parent = self.node_settings.get_root()
-        key = STORAGE_USAGE_KEY.format(target_id=self.node._id)
-        assert storage_usage_cache.get(key) is None
+        assert self.node.storage_usage == 0
 
         with override_flag(features.STORAGE_USAGE, active=True):
             self.send_upload_hook(parent, payload=self.make_payload(name=name))
-        assert storage_usage_cache.get(key) == 123
+        assert self.node.storage_usage == 123
 
-        # Don't update the cache for duplicate uploads
+        # Duplicate uploads don't add a version
         with override_flag(features.STORAGE_USAGE, active=True):
             self.send_upload_hook(parent, payload=self.make_payload(name=name))
-        assert storage_usage_cache.get(key) == 123
+        assert self.node.storage_usage == 123
 
-        # Do update the cache for new versions
+        # New versions count
         payload = self.make_payload(name=name)
         payload['metadata']['name'] = 'new hash'
         with override_flag(features.STORAGE_USAGE, active=True):
             self.send_upload_hook(parent, payload=payload)
-        assert storage_usage_cache.get(key) == 246
+        assert self.node.storage_usage == 246
 
 
 @pytest.mark.django_db
@@ -974,9 +1017,7 @@ class TestDeleteHookNode(DeleteHook):
 @pytest.mark.django_db
 class TestDeleteHookProjectOnly(DeleteHook):
 
-    def test_delete_reduces_cache_size(self):
-        key = STORAGE_USAGE_KEY.format(target_id=self.node._id)
-
+    def test_delete_reduces_storage_usage(self):
         file = create_record_with_version('new file', self.node_settings, size=123)
         assert self.node.storage_usage == 123
 
@@ -986,7 +1027,6 @@ class TestDeleteHookProjectOnly(DeleteHook):
         assert_equal(resp.status_code, 200)
         assert_equal(resp.json, {'status': 'success'})
 
-        assert storage_usage_cache.get(key) == 0
         assert_is(self.node.storage_usage, 0)
 
 
@@ -1283,9 +1323,8 @@ class TestMoveHookProjectsOnly(TestMoveHook):
                 target=self.node,
                 method='post_json',)
 
-        # Cache should stay untouched because net storage usage hasn't changed
-        key = STORAGE_USAGE_KEY.format(target_id=self.project._id)
-        assert storage_usage_cache.get(key) is None
+        # Net storage usage hasn't changed
+        assert self.project.storage_usage == 123
 
         assert_equal(res.status_code, 200)
 
@@ -1320,12 +1359,9 @@ class TestMoveHookProjectsOnly(TestMoveHook):
                 target=self.node,
                 method='post_json',)
 
-        # both caches are updated
-        source_key = STORAGE_USAGE_KEY.format(target_id=self.project._id)
-        assert storage_usage_cache.get(source_key) == 0
-
-        destination = STORAGE_USAGE_KEY.format(target_id=other_target._id)
-        assert storage_usage_cache.get(destination) == 123
+        # both targets are updated
+        assert self.project.storage_usage == 0
+        assert other_target.storage_usage == 123
 
         assert_equal(res.status_code, 200)
 
@@ -1395,12 +1431,9 @@ class TestCopyHook(HookTestCase):
                 target=self.node,
                 method='post_json',)
 
-        # both caches are updated
-        source_key = STORAGE_USAGE_KEY.format(target_id=self.project._id)
-        assert storage_usage_cache.get(source_key) == 123
-
-        destination = STORAGE_USAGE_KEY.format(target_id=other_target._id)
-        assert storage_usage_cache.get(destination) == 123
+        # the copy counts towards the destination only
+        assert self.project.storage_usage == 123
+        assert other_target.storage_usage == 123
 
         assert_equal(res.status_code, 201)
 
@@ -8,16 +8,15 @@ from django.db import IntegrityError
 from django.db import connection
 from django.db import transaction
 
-from flask import request
+from flask import request, Response
 
 from framework.auth import Auth
 from framework.sessions import get_session
 from framework.exceptions import HTTPError
 from framework.auth.decorators import must_be_signed, must_be_logged_in
 
-from api.caching.tasks import update_storage_usage
 from osf.exceptions import InvalidTagError, TagNotFoundError
-from osf.models import FileVersion, OSFUser
+from osf.models import FileVersion, FileVersionSummary, OSFUser
 from osf.utils.requests import check_select_for_update
 from website.project.decorators import (
     must_not_be_registration, must_have_permission
@@ -33,6 +32,68 @@ from addons.osfstorage import settings as osf_storage_settings
 
 logger = logging.getLogger(__name__)
 
+# Serialized children fetched from the server-side cursor and written out at a time by
+# osfstorage_get_children
+STREAM_CHILDREN_CHUNK_SIZE = 500
+
+# One JSON object per child of a folder. Version metadata comes from FileVersionSummary and the
+# seen flags and download counts are joined for all children at once, rather than looked up by
+# lateral subqueries for each child.
+GET_CHILDREN_SQL = """
+    SELECT (CASE
+        WHEN F.type = 'osf.osfstoragefile' THEN
+            json_build_object(
+                'id', F._id
+                , 'path', '/' || F._id
+                , 'name', F.name
+                , 'kind', 'file'
+                , 'size', LATEST_VERSION.size
+                , 'downloads',  COALESCE(DOWNLOAD_COUNT.total, 0)
+                , 'version', COALESCE(SUMMARY.version_count, 0)
+                , 'contentType', LATEST_VERSION.content_type
+                , 'modified', LATEST_VERSION.created
+                , 'created', EARLIEST_VERSION.created
+                , 'checkout', CASE WHEN F.checkout_id IS NULL THEN NULL ELSE (
+                    SELECT _id FROM osf_guid
+                    WHERE object_id = F.checkout_id
+                    AND content_type_id = %(user_content_type_id)s
+                    LIMIT 1
+                ) END
+                , 'md5', LATEST_VERSION.metadata ->> 'md5'
+                , 'sha256', LATEST_VERSION.metadata ->> 'sha256'
+                , 'latestVersionSeen', CASE WHEN SEEN.file_id IS NULL THEN NULL ELSE json_build_object(
+                    'user', %(user_id)s
+                    , 'seen', SUMMARY.latest_version_id = ANY(SEEN.version_ids)
+                ) END
+            )
+        ELSE
+            json_build_object(
+                'id', F._id
+                , 'path', '/' || F._id || '/'
+                , 'name', F.name
+                , 'kind', 'folder'
+            )
+        END
+    )::text
+    FROM osf_basefilenode AS F
+    LEFT JOIN osf_fileversionsummary AS SUMMARY ON SUMMARY.file_id = F.id
+    LEFT JOIN osf_fileversion AS LATEST_VERSION ON LATEST_VERSION.id = SUMMARY.latest_version_id
+    LEFT JOIN osf_fileversion AS EARLIEST_VERSION ON EARLIEST_VERSION.id = SUMMARY.earliest_version_id
+    LEFT JOIN osf_pagecounter AS DOWNLOAD_COUNT ON DOWNLOAD_COUNT._id = 'download:' || %(target_id)s || ':' || F._id
+    LEFT JOIN (
+        -- The versions of each child the user has seen, for all children at once
+        SELECT osf_basefilenode_versions.basefilenode_id AS file_id, array_agg(osf_fileversionusermetadata.file_version_id) AS version_ids
+        FROM osf_fileversionusermetadata
+          INNER JOIN osf_basefilenode_versions ON osf_fileversionusermetadata.file_version_id = osf_basefilenode_versions.fileversion_id
+          INNER JOIN osf_basefilenode ON osf_basefilenode.id = osf_basefilenode_versions.basefilenode_id
+        WHERE osf_fileversionusermetadata.user_id = %(user_pk)s
+        AND osf_basefilenode.parent_id = %(parent_id)s
+        GROUP BY osf_basefilenode_versions.basefilenode_id
+    ) SEEN ON SEEN.file_id = F.id
+    WHERE F.parent_id = %(parent_id)s
+    AND (NOT F.type IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder'))
+"""
+
 
 def make_error(code, message_short=None, message_long=None):
     data = {}
@@ -123,16 +184,12 @@ def osfstorage_get_revisions(file_node, payload, target, **kwargs):
 
 @decorators.waterbutler_opt_hook
 def osfstorage_copy_hook(source, destination, name=None, **kwargs):
-    ret = source.copy_under(destination, name=name).serialize(), httplib.CREATED
-    update_storage_usage(destination.target)
-    return ret
+    return source.copy_under(destination, name=name).serialize(), httplib.CREATED
 
 @decorators.waterbutler_opt_hook
 def osfstorage_move_hook(source, destination, name=None, **kwargs):
-    source_target = source.target
-
     try:
-        ret = source.move_under(destination, name=name).serialize(), httplib.OK
+        return source.move_under(destination, name=name).serialize(), httplib.OK
     except exceptions.FileNodeCheckedOutError:
         raise HTTPError(httplib.METHOD_NOT_ALLOWED, data={
             'message_long': 'Cannot move file as it is checked out.'
@@ -142,23 +199,10 @@ def osfstorage_move_hook(source, destination, name=None, **kwargs):
             'message_long': 'Cannot move file as it is the primary file of preprint.'
         })
 
-    # once the move is complete recalculate storage for both targets if it's a inter-target move.
-    if source_target != destination.target:
-        update_storage_usage(destination.target)
-        update_storage_usage(source_target)
-
-    return ret
-
 @must_be_signed
 @decorators.autoload_filenode(default_root=True)
 def osfstorage_get_lineage(file_node, **kwargs):
-    lineage = []
-
-    while file_node:
-        lineage.append(file_node.serialize())
-        file_node = file_node.parent
-
-    return {'data': lineage}
+    return {'data': [node.serialize() for node in file_node.get_lineage()]}
 
 
 @must_be_signed
@@ -179,102 +223,39 @@ def osfstorage_get_children(file_node, **kwargs):
     user_id = request.args.get('user_id')
     user_content_type_id = ContentType.objects.get_for_model(OSFUser).id
     user_pk = OSFUser.objects.filter(guids___id=user_id, guids___id__isnull=False).values_list('pk', flat=True).first()
-    with connection.cursor() as cursor:
-        # Read the documentation on FileVersion's fields before reading this code
-        cursor.execute("""
-            SELECT json_agg(CASE
-                WHEN F.type = 'osf.osfstoragefile' THEN
-                    json_build_object(
-                        'id', F._id
-                        , 'path', '/' || F._id
-                        , 'name', F.name
-                        , 'kind', 'file'
-                        , 'size', LATEST_VERSION.size
-                        , 'downloads',  COALESCE(DOWNLOAD_COUNT, 0)
-                        , 'version', (SELECT COUNT(*) FROM osf_basefilenode_versions WHERE osf_basefilenode_versions.basefilenode_id = F.id)
-                        , 'contentType', LATEST_VERSION.content_type
-                        , 'modified', LATEST_VERSION.created
-                        , 'created', EARLIEST_VERSION.created
-                        , 'checkout', CHECKOUT_GUID
-                        , 'md5', LATEST_VERSION.metadata ->> 'md5'
-                        , 'sha256', LATEST_VERSION.metadata ->> 'sha256'
-                        , 'latestVersionSeen', SEEN_LATEST_VERSION.case
-                    )
-                ELSE
-                    json_build_object(
-                        'id', F._id
-                        , 'path', '/' || F._id || '/'
-                        , 'name', F.name
-                        , 'kind', 'folder'
-                    )
-                END
-            )
-            FROM osf_basefilenode AS F
-            LEFT JOIN LATERAL (
-                SELECT * FROM osf_fileversion
-                JOIN osf_basefilenode_versions ON osf_fileversion.id = osf_basefilenode_versions.fileversion_id
-                WHERE osf_basefilenode_versions.basefilenode_id = F.id
-                ORDER BY created DESC
-                LIMIT 1
-            ) LATEST_VERSION ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT * FROM osf_fileversion
-                JOIN osf_basefilenode_versions ON osf_fileversion.id = osf_basefilenode_versions.fileversion_id
-                WHERE osf_basefilenode_versions.basefilenode_id = F.id
-                ORDER BY created ASC
-                LIMIT 1
-            ) EARLIEST_VERSION ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT _id from osf_guid
-                WHERE object_id = F.checkout_id
-                AND content_type_id = %s
-                LIMIT 1
-            ) CHECKOUT_GUID ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT P.total AS DOWNLOAD_COUNT FROM osf_pagecounter AS P
-                WHERE P._id = 'download:' || %s || ':' || F._id
-                LIMIT 1
-            ) DOWNLOAD_COUNT ON TRUE
-            LEFT JOIN LATERAL (
-              SELECT EXISTS(
-                SELECT (1) FROM osf_fileversionusermetadata
-                  INNER JOIN osf_fileversion ON osf_fileversionusermetadata.file_version_id = osf_fileversion.id
-                  INNER JOIN osf_basefilenode_versions ON osf_fileversion.id = osf_basefilenode_versions.fileversion_id
-                  WHERE osf_fileversionusermetadata.user_id = %s
-                  AND osf_basefilenode_versions.basefilenode_id = F.id
-                LIMIT 1
-              )
-            ) SEEN_FILE ON TRUE
-            LEFT JOIN LATERAL (
-                SELECT CASE WHEN SEEN_FILE.exists
-                THEN
-                    CASE WHEN EXISTS(
-                      SELECT (1) FROM osf_fileversionusermetadata
-                      WHERE osf_fileversionusermetadata.file_version_id = LATEST_VERSION.fileversion_id
-                      AND osf_fileversionusermetadata.user_id = %s
-                      LIMIT 1
-                    )
-                    THEN
-                      json_build_object('user', %s, 'seen', TRUE)
-                    ELSE
-                      json_build_object('user', %s, 'seen', FALSE)
-                    END
-                ELSE
-                  NULL
-                END
-            ) SEEN_LATEST_VERSION ON TRUE
-            WHERE parent_id = %s
-            AND (NOT F.type IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder'))
-        """, [
-            user_content_type_id,
-            file_node.target._id,
-            user_pk,
-            user_pk,
-            user_id,
-            user_id,
-            file_node.id
-        ])
-        return cursor.fetchone()[0] or []
+    # Summaries are maintained as versions change; files from before they existed get one here
+    FileVersionSummary.refresh(parent_id=file_node.id)
+    params = {
+        'user_content_type_id': user_content_type_id,
+        'target_id': file_node.target._id,
+        'user_pk': user_pk,
+        'user_id': user_id,
+        'parent_id': file_node.id,
+    }
+
+    # Children are already serialized by Postgres; stream them out instead of decoding and
+    # encoding every one of them again, which dominates the response time for large folders.
+    # They are read through a server-side cursor a chunk at a time, in a transaction of its own
+    # since the request's has been committed by the time the response is written.
+    def stream():
+        with transaction.atomic():
+            cursor = connection.chunked_cursor()
+            try:
+                # Read the documentation on FileVersion's fields before reading this code
+                cursor.execute(GET_CHILDREN_SQL, params)
+                yield '['
+                separator = ''
+                while True:
+                    rows = cursor.fetchmany(STREAM_CHILDREN_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    yield separator + ','.join(row[0] for row in rows)
+                    separator = ','
+                yield ']'
+            finally:
+                cursor.close()
+
+    return Response(stream(), mimetype='application/json')
 
 
 @must_be_signed
@@ -335,12 +316,7 @@ def osfstorage_create_child(file_node, payload, **kwargs):
             ))
         except KeyError:
             raise HTTPError(httplib.BAD_REQUEST)
-        current_version = file_node.get_version()
         new_version = file_node.create_version(user, location, metadata)
-
-        if not current_version or not current_version.is_duplicate(new_version):
-            update_storage_usage(file_node.target)
-
         version_id = new_version._id
         archive_exists = new_version.archive is not None
     else:
@@ -378,7 +354,6 @@ def osfstorage_delete(file_node, payload, target, **kwargs):
             'message_long': 'Cannot delete file as it is the primary file of preprint.'
         })
 
-    update_storage_usage(file_node.target)
     return {'status': 'success'}
 
 
@@ -94,6 +94,15 @@ def build_wiki_url(node, label, base, end):
     return '/{pid}/wiki/{wname}/'.format(pid=node._id, wname=label)
 
 
+# Bump to discard every cached WikiVersion.html after changing the markdown extensions or WIKI_WHITELIST
+WIKI_RENDER_VERSION = 1
+
+
+def get_render_key(node):
+    """Everything besides the content that rendered HTML depends on: wiki links point at ``node``."""
+    return '{}:{}'.format(WIKI_RENDER_VERSION, node._id)
+
+
 class WikiVersionNodeManager(models.Manager):
 
     def get_for_node(self, node, name=None, version=None, id=None):
@@ -123,13 +132,28 @@ class WikiVersion(ObjectIDMixin, BaseModel):
     wiki_page = models.ForeignKey('WikiPage', null=True, blank=True, on_delete=models.CASCADE, related_name='versions')
     content = models.TextField(default='', blank=True)
     identifier = models.IntegerField(default=1)
+    # Output of html() for the node in rendered_key, see get_render_key
+    rendered_html = models.TextField(null=True, blank=True)
+    rendered_key = models.CharField(max_length=32, null=True, blank=True)
 
     @property
     def is_current(self):
         return not self.wiki_page.deleted and self.id == self.wiki_page.versions.order_by('-created').first().id
 
     def html(self, node):
-        """The cleaned HTML of the page"""
+        """The cleaned HTML of the page. Versions are immutable, so this is rendered once per node
+        and stored on the version.
+        """
+        key = get_render_key(node)
+        if self.rendered_html is None or self.rendered_key != key:
+            self.rendered_html = self.render_html(node)
+            self.rendered_key = key
+            if self.pk:
+                # Bypass save(), which would reindex the node and check for spam again
+                WikiVersion.objects.filter(pk=self.pk).update(rendered_html=self.rendered_html, rendered_key=key)
+        return self.rendered_html
+
+    def render_html(self, node):
         html_output = build_html_output(self.content, node=node)
         try:
             cleaner = Cleaner(
@@ -227,6 +251,9 @@ class WikiVersion(ObjectIDMixin, BaseModel):
         clone = self.clone()
         clone.wiki_page = wiki_page
         clone.user = user
+        # Links point at the original node; rendered again for the copy on first read
+        clone.rendered_html = None
+        clone.rendered_key = None
         clone.save()
         return clone
 
@@ -299,6 +326,8 @@ class WikiPage(GuidMixin, BaseModel):
         :param content: Latest content for wiki
         """
         version = WikiVersion(user=user, wiki_page=self, content=content, identifier=self.current_version_number + 1)
+        # Render before the insert so the HTML is stored with the version
+        version.html(self.node)
         version.save()
 
         self.node.add_log(
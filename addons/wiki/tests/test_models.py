@@ -1,9 +1,10 @@
+import mock
 import pytest
 import pytz
 import datetime
 from addons.wiki.exceptions import NameMaximumLengthError
 
-from addons.wiki.models import WikiPage, WikiVersion
+from addons.wiki.models import WikiPage, WikiVersion, get_render_key
 from addons.wiki.tests.factories import WikiFactory, WikiVersionFactory
 from osf_tests.factories import NodeFactory, UserFactory, ProjectFactory
 from tests.base import OsfTestCase, fake
@@ -48,6 +49,45 @@ class TestWikiPageModel:
         page.save()
         assert ver1.is_current is False
 
+    def test_html_is_stored_with_new_versions(self):
+        user = UserFactory()
+        node = NodeFactory()
+        page = WikiPage(page_name='foo', node=node)
+        page.save()
+        version = page.update(user=user, content='[[bar]]')
+
+        stored = WikiVersion.objects.get(pk=version.pk)
+        assert stored.rendered_key == get_render_key(node)
+        assert '/{}/wiki/bar/'.format(node._id) in stored.rendered_html
+        with mock.patch('addons.wiki.models.build_html_output') as mock_render:
+            assert stored.html(node) == version.html(node)
+            assert stored.raw_text(node) == 'bar'
+        assert not mock_render.called
+
+    def test_html_is_rendered_again_for_another_node(self):
+        user = UserFactory()
+        node = NodeFactory()
+        other = NodeFactory()
+        page = WikiPage(page_name='foo', node=node)
+        page.save()
+        version = page.update(user=user, content='[[bar]]')
+
+        assert '/{}/wiki/bar/'.format(other._id) in version.html(other)
+        assert WikiVersion.objects.get(pk=version.pk).rendered_key == get_render_key(other)
+
+    def test_clone_does_not_copy_rendered_html(self):
+        user = UserFactory()
+        node = NodeFactory()
+        fork = NodeFactory()
+        page = WikiPage(page_name='foo', node=node)
+        page.save()
+        version = page.update(user=user, content='[[bar]]')
+        fork_page = WikiPage.objects.create(page_name='foo', node=fork)
+
+        clone = version.clone_version(fork_page, user)
+        assert clone.rendered_html is None
+        assert '/{}/wiki/bar/'.format(fork._id) in clone.html(fork)
+
 
 class TestWikiPage(OsfTestCase):
 
@@ -1,5 +1,7 @@
+import collections
 import datetime
 import functools
+import logging
 import operator
 import re
 
@@ -21,6 +23,11 @@ from rest_framework.filters import OrderingFilter
 from osf.models import Subject, Preprint
 from osf.models.base import GuidMixin
 
+logger = logging.getLogger(__name__)
+
+# Number of times each (view name, field name) filter was applied in Python rather than SQL
+python_filter_counts = collections.Counter()
+
 
 def lowercase(lower):
     if hasattr(lower, '__call__'):
@@ -336,6 +343,13 @@ class ListFilterMixin(FilterMixin):
 
     Serializers that want to restrict which fields are used for filtering need to have a variable called
     filterable_fields which is a frozenset of strings representing the field names as they appear in the serialization.
+
+    Fields that are not model fields, like SerializerMethodFields, can be filtered in the database by
+    mapping them to an ORM expression in the serializer's ``filter_expressions``, e.g.
+    ``{'size': Subquery(...)}``. The expression is annotated onto the queryset and filtered like a
+    column; a callable is called with the view to build it. Views can instead list fields in
+    ``python_filter_fields`` to load the whole queryset and filter it in Python. Python filtering is
+    counted in ``python_filter_counts`` and materializing a queryset for it is logged.
     """
     FILTERS = {
         'eq': operator.eq,
@@ -361,18 +375,51 @@ class ListFilterMixin(FilterMixin):
         else:
             return default_queryset
 
+    def get_filter_expression(self, field_name):
+        expression = getattr(self.serializer_class, 'filter_expressions', {}).get(field_name)
+        if callable(expression):
+            expression = expression(self)
+        return expression
+
+    def annotate_filter_expression(self, queryset, field_name, operations):
+        """Annotate ``queryset`` with the registered expression for ``field_name``, if any, and point
+        ``operations`` at the annotation.
+        """
+        expression = self.get_filter_expression(field_name)
+        if expression is None:
+            return queryset
+        alias = 'filter_{}'.format(field_name)
+        for operation in operations:
+            operation['source_field_name'] = alias
+        if alias in queryset.query.annotations:
+            return queryset
+        return queryset.annotate(**{alias: expression})
+
+    def materialize_for_python_filtering(self, queryset, field_names):
+        logger.warning('Loading {} to filter on {} in Python'.format(getattr(self, 'view_name', type(self).__name__), ', '.join(sorted(field_names))))
+        return list(queryset)
+
     def param_queryset(self, query_params, default_queryset):
         """filters default queryset based on query parameters"""
         filters = self.parse_query_params(query_params)
         queryset = default_queryset
         query_parts = []
 
+        if filters and not isinstance(queryset, list):
+            python_fields = set(getattr(self, 'python_filter_fields', ())).intersection(
+                field_name for field_names in filters.values() for field_name in field_names
+            )
+            if python_fields:
+                queryset = self.materialize_for_python_filtering(queryset, python_fields)
+
         if filters:
             for key, field_names in filters.items():
 
                 sub_query_parts = []
                 for field_name, data in field_names.items():
                     operations = data if isinstance(data, list) else [data]
+                    if not isinstance(queryset, list):
+                        queryset = self.annotate_filter_expression(queryset, field_name, operations)
                     if isinstance(queryset, list):
                         for operation in operations:
                             queryset = self.get_filtered_queryset(field_name, operation, queryset)
@@ -449,6 +496,7 @@ class ListFilterMixin(FilterMixin):
         """filters default queryset based on the serializer field type"""
         field = self.serializer_class._declared_fields[field_name]
         source_field_name = params['source_field_name']
+        python_filter_counts[(getattr(self, 'view_name', type(self).__name__), field_name)] += 1
 
         if isinstance(field, ser.SerializerMethodField):
             return_val = [
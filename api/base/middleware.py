@@ -1,13 +1,15 @@
 import gc
-from io import StringIO
-import cProfile
-import pstats
+import json
+import logging
+import random
 import threading
 
 from django.conf import settings
+from django.db import connection
 from django.utils.deprecation import MiddlewareMixin
 from raven.contrib.django.raven_compat.models import sentry_exception_handler
 import corsheaders.middleware
+import waffle
 
 from framework.postcommit_tasks.handlers import (
     postcommit_after_request,
@@ -20,6 +22,12 @@ from framework.celery_tasks.handlers import (
 )
 from .api_globals import api_globals
 from api.base import settings as api_settings
+from api.base.query_budget import QueryBudgetExceeded, QueryRecorder, get_query_recorder
+from api.base.sampling_profiler import get_profiler
+from osf import features
+from osf.utils import guid_map
+
+logger = logging.getLogger(__name__)
 
 
 class CeleryTaskMiddleware(MiddlewareMixin):
@@ -60,6 +68,58 @@ class DjangoGlobalMiddleware(MiddlewareMixin):
         return response
 
 
+class QueryBudgetMiddleware(MiddlewareMixin):
+    """
+    Record the SQL queries made while handling a request when QUERY_BUDGET_ENABLED is set.
+
+    Adds X-Query-Count, X-Query-Duplicates and X-Query-Time headers, logs a summary including
+    repeated query fingerprints, the most expensive serializer fields and the hit rate of the
+    guid identity map, and enforces the ``query_budget`` (and ``query_budget_per_result``)
+    declared on the view class, if any.
+    """
+    def process_request(self, request):
+        if settings.QUERY_BUDGET_ENABLED:
+            recorder = QueryRecorder(connection)
+            recorder.start()
+            api_globals.query_recorder = recorder
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        recorder = get_query_recorder()
+        if recorder:
+            view_class = getattr(callback, 'cls', None)
+            recorder.view_name = getattr(view_class, 'view_name', None) or getattr(callback, '__name__', None)
+            recorder.budget = getattr(view_class, 'query_budget', None)
+            recorder.budget_per_result = getattr(view_class, 'query_budget_per_result', 0)
+
+    def process_exception(self, request, exception):
+        recorder = get_query_recorder()
+        if recorder:
+            recorder.stop()
+            api_globals.query_recorder = None
+        return None
+
+    def process_response(self, request, response):
+        recorder = get_query_recorder()
+        if not recorder:
+            return response
+        api_globals.query_recorder = None
+        recorder.stop()
+        summary = recorder.summary(duplicate_threshold=settings.QUERY_BUDGET_DUPLICATE_THRESHOLD)
+        response['X-Query-Count'] = str(summary['queries'])
+        response['X-Query-Duplicates'] = str(sum(count for _, count in summary['duplicates']))
+        response['X-Query-Time'] = '{:.3f}'.format(summary['query_time'])
+        summary['path'] = request.path
+        summary['guid_map'] = guid_map.get_stats()
+        if recorder.over_budget():
+            message = '{} made {} queries, over its budget of {}'.format(summary['view'], summary['queries'], summary['budget'])
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded('{}: {}'.format(message, json.dumps(summary)))
+            logger.warning(message, extra={'query_budget': summary})
+        else:
+            logger.info(json.dumps(summary))
+        return response
+
+
 class CorsMiddleware(corsheaders.middleware.CorsMiddleware):
     """
     Augment CORS origin white list with the Institution model's domains.
@@ -108,34 +168,36 @@ class PostcommitTaskMiddleware(MiddlewareMixin):
         return response
 
 
-# Adapted from http://www.djangosnippets.org/snippets/186/
-# Original author: udfalkso
-# Modified by: Shwagroo Team and Gun.io
-# Modified by: COS
-class ProfileMiddleware(MiddlewareMixin):
+class SamplingProfilerMiddleware(MiddlewareMixin):
     """
-    Displays hotshot profiling for any view.
-    http://yoursite.com/yourview/?prof
-    Add the "prof" key to query string by appending ?prof (or &prof=)
-    and you'll see the profiling results in your browser.
-    It's set up to only be available in django's debug mode, is available for superuser otherwise,
-    but you really shouldn't add this middleware to any production configuration.
+    Sample the stacks of a fraction of requests while the sampling_profiler switch is on.
+
+    The fraction is SAMPLING_PROFILER_RATES[view_name], falling back to SAMPLING_PROFILER_RATE.
+    Output is written to SAMPLING_PROFILER_DIR; see api.base.sampling_profiler.
     """
-    def process_request(self, request):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET:
-            self.prof = cProfile.Profile()
+    def __init__(self, get_response=None):
+        super(SamplingProfilerMiddleware, self).__init__(get_response)
+        # Middleware is loaded by the main thread, the only one that can install signal handlers
+        get_profiler().install()
 
     def process_view(self, request, callback, callback_args, callback_kwargs):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET:
-            self.prof.enable()
+        if not waffle.switch_is_active(features.SAMPLING_PROFILER):
+            return
+        view_class = getattr(callback, 'cls', None)
+        view_name = getattr(view_class, 'view_name', None) or getattr(callback, '__name__', 'unknown')
+        rate = settings.SAMPLING_PROFILER_RATES.get(view_name, settings.SAMPLING_PROFILER_RATE)
+        if random.random() < rate:
+            get_profiler().start_request(view_name)
+            request._sampling_profiled = True
 
-    def process_response(self, request, response):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET:
-            self.prof.disable()
-
-            s = StringIO.StringIO()
-            ps = pstats.Stats(self.prof, stream=s).sort_stats('cumtime')
-            ps.print_stats()
-            response.content = s.getvalue()
+    def process_exception(self, request, exception):
+        if getattr(request, '_sampling_profiled', False):
+            get_profiler().end_request()
+            request._sampling_profiled = False
+        return None
 
+    def process_response(self, request, response):
+        if getattr(request, '_sampling_profiled', False):
+            get_profiler().end_request()
+            request._sampling_profiled = False
         return response
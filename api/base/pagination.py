@@ -1,8 +1,14 @@
+import base64
+import datetime
+import json
+
 from django.utils import six
 from collections import OrderedDict
 from django.core.urlresolvers import reverse
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.paginator import InvalidPage, Paginator as DjangoPaginator
-from django.db.models import QuerySet
+from django.db import connections
+from django.db.models import Q, QuerySet
 
 from rest_framework import pagination
 from rest_framework.exceptions import NotFound
@@ -10,25 +16,102 @@ from rest_framework.response import Response
 from rest_framework.utils.urls import (
     replace_query_param, remove_query_param,
 )
+from api.base.exceptions import InvalidQueryStringError
+from api.base.query_budget import get_query_recorder
 from api.base.serializers import is_anonymized
 from api.base.settings import MAX_PAGE_SIZE
 from api.base.utils import absolute_reverse
 
 from osf.models import AbstractNode, Comment, Preprint, Guid
+from osf.utils import guid_map
 from website.search.elastic_search import DOC_TYPE_TO_MODEL
 
 
+TOTAL_EXACT = 'exact'
+TOTAL_APPROXIMATE = 'approximate'
+
+
+def flip_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+
+def get_keyset_term(field, value):
+    """Return a Q matching the values of ``field`` that sort after ``value``, or None if none do.
+
+    Postgres sorts NULLs after every other value, so they come last in ascending order and
+    first in descending order.
+    """
+    name = field.lstrip('-')
+    if field.startswith('-'):
+        if value is None:
+            return Q(**{'{}__isnull'.format(name): False})
+        return Q(**{'{}__lt'.format(name): value})
+    if value is None:
+        return None
+    return Q(**{'{}__gt'.format(name): value}) | Q(**{'{}__isnull'.format(name): True})
+
+
+def get_keyset_filter(ordering, position):
+    """Return a Q matching the rows that come after ``position`` (the values of the ``ordering``
+    fields for one row) in ``ordering``, i.e. (a, b) > (x, y) expanded as a > x OR (a = x AND b > y).
+    """
+    keyset = None
+    for index, field in enumerate(ordering):
+        term = get_keyset_term(field, position[index])
+        if term is None:
+            continue
+        for previous_field, value in zip(ordering[:index], position[:index]):
+            # field=None is translated to IS NULL
+            term &= Q(**{previous_field.lstrip('-'): value})
+        keyset = term if keyset is None else keyset | term
+    # Nothing comes after a row that is NULL in every field
+    return keyset if keyset is not None else Q(pk__in=[])
+
+
+def get_approximate_count(queryset):
+    """Return the planner's estimate of the number of rows in ``queryset`` without running it."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) {}'.format(sql), params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CursorPage(object):
+    """A page of results fetched by keyset rather than by offset. ``total`` is None if not requested."""
+
+    def __init__(self, object_list, per_page, cursor, next_cursor, previous_cursor, total=None):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+
+
 class JSONAPIPagination(pagination.PageNumberPagination):
     """
     Custom paginator that formats responses in a JSON-API compatible format.
 
     Properly handles pagination of embedded objects.
 
+    Views that set ``cursor_ordering`` (indexed fields ending with a unique, non-null one) also
+    support keyset pagination: passing ``page[cursor]`` (empty for the first page) pages through
+    results with ``WHERE (fields) > (last row)`` instead of OFFSET, so deep pages cost the same as
+    the first and links stay stable as rows are inserted. Totals are omitted in this mode unless
+    ``page[total]`` is ``exact`` or ``approximate`` (the query planner's estimate).
     """
 
     page_size_query_param = 'page[size]'
     max_page_size = MAX_PAGE_SIZE
 
+    cursor_query_param = 'page[cursor]'
+    total_query_param = 'page[total]'
+    invalid_cursor_message = 'Invalid cursor.'
+    cursor_page = None
+
     def page_number_query(self, url, page_number):
         """
         Builds uri and adds page param.
@@ -68,7 +151,106 @@ class JSONAPIPagination(pagination.PageNumberPagination):
         page_number = self.page.next_page_number()
         return self.page_number_query(url, page_number)
 
+    def encode_cursor(self, position, reverse=False):
+        position = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in position] if position is not None else None
+        return base64.urlsafe_b64encode(json.dumps({'p': position, 'r': reverse}).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor, ordering):
+        """Return (position, reverse) for ``cursor``; an empty cursor is the start of the results."""
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(str(cursor)).decode('utf-8'))
+            position, reverse = data['p'], bool(data['r'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if position is not None and (not isinstance(position, list) or len(position) != len(ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_cursor_total(self, queryset, request):
+        total = request.query_params.get(self.total_query_param)
+        if not total:
+            return None
+        if total == TOTAL_EXACT:
+            return queryset.count()
+        if total == TOTAL_APPROXIMATE:
+            return get_approximate_count(queryset)
+        raise InvalidQueryStringError(
+            detail='{} must be one of {}, {}'.format(self.total_query_param, TOTAL_EXACT, TOTAL_APPROXIMATE),
+            parameter=self.total_query_param,
+        )
+
+    def paginate_queryset_by_cursor(self, queryset, request, ordering):
+        if request.query_params.get('sort'):
+            raise InvalidQueryStringError(detail='sort cannot be combined with {}'.format(self.cursor_query_param), parameter='sort')
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params[self.cursor_query_param]
+        position, reverse = self.decode_cursor(cursor, ordering)
+        ordering = list(ordering)
+
+        # Reverse cursors page backwards by walking the ordering the other way from ``position``
+        effective_ordering = flip_ordering(ordering) if reverse else ordering
+        page_queryset = queryset.order_by(*effective_ordering)
+        try:
+            if position is not None:
+                page_queryset = page_queryset.filter(get_keyset_filter(effective_ordering, position))
+            # Cursor values are converted to the fields' types when the query is compiled
+            results = list(page_queryset[:page_size + 1])
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        def get_position(obj):
+            return [getattr(obj, field.lstrip('-')) for field in ordering]
+
+        # The extra row fetched shows whether there is more in the direction of travel; having
+        # started from a row means there is more in the other direction
+        more_after, more_before = (position is not None, has_more) if reverse else (has_more, position is not None)
+        next_cursor = previous_cursor = None
+        if results and more_after:
+            next_cursor = self.encode_cursor(get_position(results[-1]))
+        if results and more_before:
+            previous_cursor = self.encode_cursor(get_position(results[0]), reverse=True)
+
+        self.cursor_page = CursorPage(
+            results, page_size, cursor, next_cursor, previous_cursor,
+            total=self.get_cursor_total(queryset, request),
+        )
+        return results
+
+    def cursor_query(self, url, cursor):
+        url = remove_query_param(self.request.build_absolute_uri(url), '_')
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_cursor_links(self, url):
+        page = self.cursor_page
+        return OrderedDict([
+            ('self', self.cursor_query(url, page.cursor)),
+            ('first', self.cursor_query(url, '')),
+            ('last', self.cursor_query(url, self.encode_cursor(None, reverse=True))),
+            ('prev', self.cursor_query(url, page.previous_cursor) if page.previous_cursor else None),
+            ('next', self.cursor_query(url, page.next_cursor) if page.next_cursor else None),
+        ])
+
+    def get_cursor_meta(self):
+        meta = OrderedDict()
+        if self.cursor_page.total is not None:
+            meta['total'] = self.cursor_page.total
+        meta['per_page'] = self.cursor_page.per_page
+        return meta
+
     def get_response_dict_deprecated(self, data, url):
+        if self.cursor_page is not None:
+            links = self.get_cursor_links(url)
+            del links['self']
+            links['meta'] = self.get_cursor_meta()
+            return OrderedDict([('data', data), ('links', links)])
         return OrderedDict([
             ('data', data),
             (
@@ -88,6 +270,12 @@ class JSONAPIPagination(pagination.PageNumberPagination):
         ])
 
     def get_response_dict(self, data, url):
+        if self.cursor_page is not None:
+            return OrderedDict([
+                ('data', data),
+                ('meta', self.get_cursor_meta()),
+                ('links', self.get_cursor_links(url)),
+            ])
         return OrderedDict([
             ('data', data),
             (
@@ -162,10 +350,19 @@ class JSONAPIPagination(pagination.PageNumberPagination):
                 self.display_page_controls = True
 
             self.request = request
-            return list(self.page)
-
+            results = list(self.page)
         else:
-            return super(JSONAPIPagination, self).paginate_queryset(queryset, request, view=None)
+            cursor_ordering = getattr(view, 'cursor_ordering', None)
+            if cursor_ordering and self.cursor_query_param in request.query_params:
+                results = self.paginate_queryset_by_cursor(queryset, request, cursor_ordering)
+            else:
+                results = super(JSONAPIPagination, self).paginate_queryset(queryset, request, view=None)
+            recorder = get_query_recorder()
+            if recorder:
+                recorder.results = len(results)
+        # Serializers resolve the guids of the page and load the same objects by guid again
+        guid_map.prefetch(results)
+        return results
 
 
 class MaxSizePagination(JSONAPIPagination):
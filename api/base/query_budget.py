@@ -0,0 +1,130 @@
+"""Per-request SQL query accounting for API views.
+
+When ``QUERY_BUDGET_ENABLED`` is set, ``api.base.middleware.QueryBudgetMiddleware`` installs a
+``QueryRecorder`` for each request. The recorder counts queries, groups them by fingerprint (the
+SQL with literals stripped) to surface N+1 patterns, and attributes queries to the serializer
+fields that issued them. Views can declare a ``query_budget``, plus a
+``query_budget_per_result`` allowance for each result on the page for list views; requests
+that go over it are logged, or raise ``QueryBudgetExceeded`` if ``QUERY_BUDGET_RAISE`` is set
+(as in tests).
+"""
+import itertools
+import re
+import time
+from collections import Counter
+
+from api.base.api_globals import api_globals
+
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """Normalize ``sql`` so queries that differ only in their parameters compare equal."""
+    sql = STRING_LITERAL_RE.sub('?', sql)
+    sql = NUMBER_LITERAL_RE.sub('?', sql)
+    return IN_LIST_RE.sub('(...)', sql)
+
+
+def get_query_recorder():
+    return getattr(api_globals, 'query_recorder', None)
+
+
+class QueryRecorder(object):
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.view_name = None
+        self.budget = None
+        self.budget_per_result = 0
+        # Set by the paginator to the number of results on the page
+        self.results = 0
+        self.field_stats = {}
+        self._start = None
+        self._force_debug_cursor = None
+
+    def start(self):
+        self._force_debug_cursor = self.connection.force_debug_cursor
+        self.connection.force_debug_cursor = True
+        self._start = len(self.connection.queries_log)
+        self._started_at = time.time()
+
+    def stop(self):
+        self.connection.force_debug_cursor = self._force_debug_cursor
+        self.elapsed = time.time() - self._started_at
+
+    @property
+    def queries(self):
+        return list(itertools.islice(self.connection.queries_log, self._start, None))
+
+    def mark(self):
+        return len(self.connection.queries_log), time.time()
+
+    def record_field(self, label, mark):
+        """Attribute queries and time since ``mark`` to ``label``."""
+        count, started_at = mark
+        stats = self.field_stats.setdefault(label, [0, 0, 0.0])
+        stats[0] += 1
+        stats[1] += len(self.connection.queries_log) - count
+        stats[2] += time.time() - started_at
+
+    def get_duplicates(self, threshold=2):
+        """Return [(fingerprint, count)] for every fingerprint executed at least ``threshold`` times."""
+        counts = Counter(fingerprint(query['sql']) for query in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+    def summary(self, duplicate_threshold=2, max_fields=10):
+        queries = self.queries
+        fields = sorted(self.field_stats.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            'view': self.view_name,
+            'budget': self.get_budget(),
+            'results': self.results,
+            'queries': len(queries),
+            'query_time': sum(float(query['time']) for query in queries),
+            'time': self.elapsed,
+            'duplicates': self.get_duplicates(duplicate_threshold),
+            'fields': [
+                {'field': label, 'calls': calls, 'queries': count, 'time': elapsed}
+                for label, (calls, count, elapsed) in fields[:max_fields] if count
+            ],
+        }
+
+    def get_budget(self):
+        if self.budget is None:
+            return None
+        return self.budget + self.budget_per_result * self.results
+
+    def over_budget(self):
+        budget = self.get_budget()
+        return budget is not None and len(self.queries) > budget
+
+
+class FieldQueryRecorder(object):
+    """Attribute the queries made while serializing each field of an object to that field.
+
+    ``start`` closes the previous field, so a loop over fields only needs a call at the top of
+    each iteration and ``stop`` after the loop. Does nothing if no recorder is active.
+    """
+
+    def __init__(self, serializer_name):
+        self.recorder = get_query_recorder()
+        self.serializer_name = serializer_name
+        self.label = None
+        self.mark = None
+
+    def start(self, field_name):
+        self.stop()
+        if self.recorder:
+            self.label = '{}.{}'.format(self.serializer_name, field_name)
+            self.mark = self.recorder.mark()
+
+    def stop(self):
+        if self.label:
+            self.recorder.record_field(self.label, self.mark)
+            self.label = None
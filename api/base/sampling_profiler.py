@@ -0,0 +1,173 @@
+"""Statistical sampling profiler for API requests.
+
+While at least one sampled request is active, an ``ITIMER_PROF`` interval timer sends the process
+``SIGPROF`` every ``SAMPLING_PROFILER_INTERVAL`` seconds of CPU time. The handler records the stack
+that was interrupted if it belongs to a sampled request, plus the stacks of other real threads
+serving sampled requests. Under gevent every request runs in a greenlet of the main thread, and the
+interrupted stack is the one of whichever greenlet was running, so this profiles CPU time per
+request greenlet; greenlets waiting on I/O are not sampled. The timer is disarmed when no sampled
+request is active.
+
+Stacks are aggregated per view and merged by a timer thread, ``SAMPLING_PROFILER_FLUSH_INTERVAL``
+seconds after the first new stack, into ``<SAMPLING_PROFILER_DIR>/<view name>.<pid>.folded`` in the
+collapsed format read by flamegraph.pl and speedscope (one ``frame;frame;frame count`` line per
+unique stack). Each process writes its own files; concatenate them to combine workers.
+
+Signal handlers can only be installed from the main thread, so ``install`` is called when the
+middleware is loaded; if that fails the profiler stays off.
+"""
+import collections
+import logging
+import os
+import re
+import signal
+import sys
+import threading
+
+from six.moves import _thread
+
+logger = logging.getLogger(__name__)
+
+UNSAFE_FILENAME_RE = re.compile(r'[^\w.-]')
+
+
+def fold_stack(frame):
+    """Return the collapsed representation of ``frame``'s stack, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{} ({}:{})'.format(code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def read_folded(path):
+    stacks = collections.Counter()
+    if os.path.exists(path):
+        with open(path) as fp:
+            for line in fp:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+    return stacks
+
+
+class SamplingProfiler(object):
+
+    def __init__(self, interval, output_dir, flush_interval):
+        self.interval = interval
+        self.output_dir = output_dir
+        self.flush_interval = flush_interval
+        # Guards ``active`` and the interval timer against other requests, never taken by the signal
+        # handler, which may interrupt a holder of the lock
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.installed = False
+        # thread or greenlet id -> view name
+        self.active = {}
+        self.stacks = collections.defaultdict(collections.Counter)
+        self.samples = 0
+        self._flush_timer = None
+
+    def install(self):
+        """Install the SIGPROF handler. Returns False if that isn't possible from this thread."""
+        if self.installed:
+            return True
+        try:
+            signal.signal(signal.SIGPROF, self._handle_signal)
+        except ValueError:
+            logger.warning('The sampling profiler must be installed from the main thread; it is disabled')
+            return False
+        # Restart system calls interrupted by the timer instead of failing them with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        self.installed = True
+        return True
+
+    def start_request(self, view_name):
+        if not self.installed:
+            return
+        with self.lock:
+            self.active[_thread.get_ident()] = view_name
+            if len(self.active) == 1:
+                signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def end_request(self):
+        if not self.installed:
+            return
+        with self.lock:
+            self.active.pop(_thread.get_ident(), None)
+            if not self.active:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+            if self.stacks and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self._run_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _handle_signal(self, signum, frame):
+        try:
+            self.sample(frame)
+        except Exception:
+            # Logging takes locks that the interrupted code may hold
+            pass
+
+    def sample(self, frame):
+        """Record ``frame``, the interrupted stack, and the stacks of other threads serving sampled requests."""
+        active = self.active
+        if not active:
+            return
+        current = _thread.get_ident()
+        frames = None
+        for ident, view_name in list(active.items()):
+            if ident == current:
+                sampled = frame
+            else:
+                if frames is None:
+                    frames = sys._current_frames()
+                sampled = frames.get(ident)
+            if sampled is not None:
+                self.stacks[view_name][fold_stack(sampled)] += 1
+                self.samples += 1
+
+    def get_path(self, view_name):
+        return os.path.join(self.output_dir, '{}.{}.folded'.format(UNSAFE_FILENAME_RE.sub('_', view_name), os.getpid()))
+
+    def _run_flush(self):
+        with self.lock:
+            self._flush_timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Sampling profiler failed to write its stacks')
+
+    def flush(self):
+        """Merge the stacks sampled since the last flush into the per-view files."""
+        # Swapped without the lock, which the signal handler doesn't take; a sample recorded
+        # into the old dict during the swap may be lost
+        stacks, self.stacks = self.stacks, collections.defaultdict(collections.Counter)
+        if not stacks:
+            return
+        with self.flush_lock:
+            if not os.path.isdir(self.output_dir):
+                os.makedirs(self.output_dir)
+            for view_name, counts in stacks.items():
+                path = self.get_path(view_name)
+                merged = read_folded(path)
+                merged.update(counts)
+                with open(path, 'w') as fp:
+                    for stack, count in merged.most_common():
+                        fp.write('{} {}\n'.format(stack, count))
+
+
+_profiler = None
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        from django.conf import settings
+        _profiler = SamplingProfiler(
+            settings.SAMPLING_PROFILER_INTERVAL,
+            settings.SAMPLING_PROFILER_DIR,
+            settings.SAMPLING_PROFILER_FLUSH_INTERVAL,
+        )
+    return _profiler
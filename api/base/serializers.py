@@ -18,6 +18,7 @@ from osf.utils import permissions as osf_permissions
 from osf.utils import sanitize
 from osf.utils import functional
 from api.base import exceptions as api_exceptions
+from api.base.query_budget import FieldQueryRecorder
 from api.base.settings import BULK_SETTINGS
 from framework.auth import core as auth_core
 from osf.models import AbstractNode, MaintenanceState, Preprint
@@ -653,7 +654,7 @@ class RelationshipField(ser.HyperlinkedIdentityField):
         """
         meta = {}
         for key in meta_data or {}:
-            if key == 'count' or key == 'unread':
+            if key in ('count', 'unread', 'storage_usage'):
                 show_related_counts = self.context['request'].query_params.get('related_counts', False)
                 if self.context['request'].parser_context.get('kwargs'):
                     if self.context['request'].parser_context['kwargs'].get('is_embedded'):
@@ -1164,6 +1165,15 @@ class JSONAPIListSerializer(ser.ListSerializer):
                 self.child.to_esi_representation(item, envelope=None) for item in data
             ]
         else:
+            data = list(data)
+            # Let embeds that can be resolved for the whole page at once do so before any item is serialized
+            for embed in self.context.get('embed', {}).values():
+                prefetch = getattr(embed, 'prefetch', None)
+                if prefetch and data:
+                    prefetch(data)
+            prefetch_page = getattr(self.child, 'prefetch_page', None)
+            if prefetch_page and data:
+                prefetch_page(data)
             ret = [
                 self.child.to_representation(item, envelope=envelope) for item in data
             ]
@@ -1380,7 +1390,9 @@ class JSONAPISerializer(BaseAPISerializer):
                 ),
             )
 
+        field_recorder = FieldQueryRecorder(type(self).__name__)
         for field in fields:
+            field_recorder.start(field.field_name)
             nested_field = self.get_unwrapped_field(field)
             try:
                 if hasattr(field, 'child_relation'):
@@ -1447,6 +1459,7 @@ class JSONAPISerializer(BaseAPISerializer):
                     data['links'] = representation
                 else:
                     data['attributes'][field.field_name] = representation
+        field_recorder.stop()
 
         if not data['relationships']:
             del data['relationships']
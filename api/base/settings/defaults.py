@@ -191,6 +191,28 @@ REST_FRAMEWORK = {
     },
 }
 
+# Record SQL queries per request (see api.base.query_budget). Adds overhead, so off by default.
+QUERY_BUDGET_ENABLED = False
+# Raise instead of logging when a view goes over its query_budget
+QUERY_BUDGET_RAISE = False
+# Report query fingerprints executed at least this many times in one request
+QUERY_BUDGET_DUPLICATE_THRESHOLD = 3
+
+# Sampling profiler, enabled at runtime by the sampling_profiler waffle switch
+# Fraction of requests to profile, overridable per view_name in SAMPLING_PROFILER_RATES
+SAMPLING_PROFILER_RATE = 0.01
+SAMPLING_PROFILER_RATES = {}
+# Seconds of CPU time between stack samples
+SAMPLING_PROFILER_INTERVAL = 0.005
+# Seconds between writes of the aggregated stacks to SAMPLING_PROFILER_DIR
+SAMPLING_PROFILER_FLUSH_INTERVAL = 60
+SAMPLING_PROFILER_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Storage used by api.base.throttling.BaseThrottle subclasses that don't set their own backend:
+# 'history' keeps a timestamp per request, 'counter' keeps THROTTLE_BUCKETS counters per client
+THROTTLE_BACKEND = 'history'
+THROTTLE_BUCKETS = 10
+
 # Settings related to CORS Headers addon: allow API to receive authenticated requests from OSF
 # CORS plugin only matches based on "netloc" part of URL, so as workaround we add that to the list
 CORS_ORIGIN_ALLOW_ALL = False
@@ -208,9 +230,8 @@ MIDDLEWARE = (
     'api.base.middleware.DjangoGlobalMiddleware',
     'api.base.middleware.CeleryTaskMiddleware',
     'api.base.middleware.PostcommitTaskMiddleware',
-    # A profiling middleware. ONLY FOR DEV USE
-    # Uncomment and add "prof" to url params to recieve a profile for that url
-    # 'api.base.middleware.ProfileMiddleware',
+    'api.base.middleware.QueryBudgetMiddleware',
+    'api.base.middleware.SamplingProfilerMiddleware',
 
     # 'django.contrib.sessions.middleware.SessionMiddleware',
     'api.base.middleware.CorsMiddleware',
@@ -309,6 +330,7 @@ ELASTICSEARCH_METRICS_DATE_FORMAT = '%Y'
 
 WAFFLE_CACHE_NAME = 'waffle_cache'
 STORAGE_USAGE_CACHE_NAME = 'storage_usage'
+CITATION_CACHE_NAME = 'citations'
 
 
 CACHES = {
@@ -322,4 +344,12 @@ CACHES = {
     WAFFLE_CACHE_NAME: {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     },
+    # Own table, so that culling it never evicts entries of the caches above
+    CITATION_CACHE_NAME: {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'osf_citation_cache_table',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
@@ -7,13 +7,24 @@ from api.base import settings
 logger = logging.getLogger(__name__)
 
 
+HISTORY_BACKEND = 'history'
+COUNTER_BACKEND = 'counter'
+
+
 class BaseThrottle(SimpleRateThrottle):
 
+    # Either HISTORY_BACKEND (a list of request timestamps per client, DRF's default) or
+    # COUNTER_BACKEND (a fixed number of per-bucket counters). None uses settings.THROTTLE_BACKEND.
+    backend = None
+
     def get_ident(self, request):
         if request.META.get('HTTP_X_THROTTLE_TOKEN'):
             return request.META['HTTP_X_THROTTLE_TOKEN']
         return super(BaseThrottle, self).get_ident(request)
 
+    def get_backend(self):
+        return self.backend or settings.THROTTLE_BACKEND
+
     def allow_request(self, request, view):
         """
         Implement the check to see if the request should be throttled.
@@ -29,6 +40,9 @@ class BaseThrottle(SimpleRateThrottle):
         if self.key is None:
             return True
 
+        if self.get_backend() == COUNTER_BACKEND:
+            return self.allow_request_counter()
+
         self.history = self.cache.get(self.key, [])
         self.now = self.timer()
 
@@ -40,6 +54,56 @@ class BaseThrottle(SimpleRateThrottle):
             return self.throttle_failure()
         return self.throttle_success()
 
+    def get_bucket_width(self):
+        return float(self.duration) / settings.THROTTLE_BUCKETS
+
+    def get_bucket_keys(self):
+        """Return the cache keys of the buckets covering the current window, oldest first."""
+        current = int(self.now // self.bucket_width)
+        return ['{}:{}'.format(self.key, bucket) for bucket in range(current - settings.THROTTLE_BUCKETS + 1, current + 1)]
+
+    def allow_request_counter(self):
+        """Sliding window approximated by THROTTLE_BUCKETS fixed-width counters.
+
+        Each request costs one get_many and one incr, however many requests the client has
+        made. The window slides one bucket at a time, so a client can occasionally get up to
+        one bucket's worth of extra requests through at the edge of the window.
+        """
+        self.now = self.timer()
+        self.bucket_width = self.get_bucket_width()
+        keys = self.get_bucket_keys()
+        current_key = keys[-1]
+        counts = self.cache.get_many(keys[:-1])
+        self.bucket_counts = [counts.get(key, 0) for key in keys[:-1]]
+        previous = sum(self.bucket_counts)
+        if previous >= self.num_requests:
+            return self.throttle_failure()
+
+        # incr is atomic on shared caches; add only creates the counter if it is missing
+        self.cache.add(current_key, 0, int(self.duration + self.bucket_width) + 1)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Counter expired between the add and the incr
+            self.cache.set(current_key, 1, int(self.duration + self.bucket_width) + 1)
+            current = 1
+        if previous + current > self.num_requests:
+            # Don't count rejected requests against the client
+            self.cache.decr(current_key)
+            self.bucket_counts.append(current - 1)
+            return self.throttle_failure()
+        return True
+
+    def wait(self):
+        if self.get_backend() != COUNTER_BACKEND:
+            return super(BaseThrottle, self).wait()
+        # Time until the oldest bucket holding requests leaves the window
+        until_next_bucket = self.bucket_width - (self.now % self.bucket_width)
+        for index, count in enumerate(self.bucket_counts):
+            if count:
+                return until_next_bucket + index * self.bucket_width
+        return until_next_bucket
+
 
 class NonCookieAuthThrottle(BaseThrottle, AnonRateThrottle):
 
@@ -21,6 +21,7 @@ urlpatterns = [
                 url(r'^chronos/', include('api.chronos.urls', namespace='chronos')),
                 url(r'^meetings/', include('api.meetings.urls', namespace='meetings')),
                 url(r'^metrics/', include('api.metrics.urls', namespace='metrics')),
+                url(r'^postcommit_stats/$', views.postcommit_stats, name='postcommit_stats'),
             ],
         ),
     ),
@@ -7,7 +7,7 @@ from hashids import Hashids
 
 from django.utils.http import urlquote
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import OuterRef, Exists, Q, QuerySet, F
+from django.db.models import Q, QuerySet, F
 from rest_framework.exceptions import NotFound
 from rest_framework.reverse import reverse
 
@@ -17,8 +17,10 @@ from api.base.settings import HASHIDS_SALT
 from framework.auth import Auth
 from framework.auth.cas import CasResponse
 from framework.auth.oauth_scopes import ComposedScopes, normalize_scopes
-from osf.models import OSFUser, Contributor, Node, Registration
+from osf.models import OSFUser, Node, Registration
 from osf.models.base import GuidMixin
+from osf.utils import guid_map
+from osf.utils.node_permissions import get_readable_node_ids
 from osf.utils.requests import check_select_for_update
 from website import settings as website_settings
 from website import util as website_util  # noqa
@@ -103,6 +105,8 @@ def get_object_or_error(model_or_qs, query_or_pk=None, request=None, display_nam
         if issubclass(model_cls, GuidMixin):
             # if it's a subclass of GuidMixin we know it's primary_identifier_name
             query = {'guids___id': query_or_pk}
+            if not select_for_update:
+                obj = guid_map.get_instance(model_cls, query_or_pk)
         else:
             if hasattr(model_cls, 'primary_identifier_name'):
                 # primary_identifier_name gives us the natural key for the model
@@ -129,6 +133,8 @@ def get_object_or_error(model_or_qs, query_or_pk=None, request=None, display_nam
                 obj = model_cls.objects.get(query) if not select_for_update else model_cls.objects.filter(query).select_for_update().get()
         except ObjectDoesNotExist:
             raise NotFound
+        if isinstance(obj, GuidMixin) and isinstance(query_or_pk, basestring):
+            guid_map.remember(obj, query_or_pk)
 
     # For objects that have been disabled (is_active is False), return a 410.
     # The User model is an exception because we still want to allow
@@ -155,8 +161,8 @@ def default_node_permission_queryset(user, model_cls):
     assert model_cls in {Node, Registration}
     if user is None or user.is_anonymous:
         return model_cls.objects.filter(is_public=True)
-    sub_qs = Contributor.objects.filter(node=OuterRef('pk'), user__id=user.id, read=True)
-    return model_cls.objects.annotate(contrib=Exists(sub_qs)).filter(Q(contrib=True) | Q(is_public=True))
+    readable_node_ids = get_readable_node_ids(user.id, include_implicit=False)
+    return model_cls.objects.filter(Q(id__in=readable_node_ids) | Q(is_public=True))
 
 def default_node_list_permission_queryset(user, model_cls):
     # **DO NOT** change the order of the querysets below.
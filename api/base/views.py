@@ -1,16 +1,16 @@
 from collections import defaultdict
+import json
+import logging
 from distutils.version import StrictVersion
 
-from django_bulk_update.helper import bulk_update
 from django.conf import settings as django_settings
 from django.db import transaction
 from django.db.models import F, Q
 from django.http import JsonResponse
-from django.contrib.contenttypes.models import ContentType
 from rest_framework import generics
 from rest_framework import permissions as drf_permissions
 from rest_framework import status
-from rest_framework.decorators import api_view, throttle_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.exceptions import ValidationError, NotFound
 from rest_framework.mixins import ListModelMixin
 from rest_framework.response import Response
@@ -21,6 +21,7 @@ from api.base.exceptions import RelationshipPostMakesNoChanges, InvalidFilterVal
 from api.base.filters import ListFilterMixin
 from api.base.parsers import JSONAPIRelationshipParser
 from api.base.parsers import JSONAPIRelationshipParserForRegularJSON
+from api.base.query_budget import get_query_recorder
 from api.base.requests import EmbeddedRequest
 from api.base.serializers import (
     get_meta_type,
@@ -38,11 +39,15 @@ from api.nodes.permissions import ReadOnlyIfRegistration
 from api.nodes.permissions import ExcludeWithdrawals
 from api.users.serializers import UserSerializer
 from framework.auth.oauth_scopes import CoreScopes
+from framework.postcommit_tasks import handlers as postcommit_handlers
 from osf.models import Contributor, MaintenanceState, BaseFileNode
 from osf.utils.permissions import PERMISSIONS
 from waffle.models import Flag, Switch, Sample
 from waffle import flag_is_active, sample_is_active
 
+logger = logging.getLogger(__name__)
+
+
 class JSONAPIBaseView(generics.GenericAPIView):
 
     def __init__(self, **kwargs):
@@ -51,10 +56,91 @@ class JSONAPIBaseView(generics.GenericAPIView):
         self.view_fqn = ':'.join([self.view_category, self.view_name])
         super(JSONAPIBaseView, self).__init__(**kwargs)
 
+    def _get_embed_cache(self):
+        if not hasattr(self.request._request, '_embed_cache'):
+            self.request._request._embed_cache = {}
+        return self.request._request._embed_cache
+
+    def _get_embed_stats(self, field_name):
+        """Per-request counters for ``field_name``: sub-views run one item at a time ('views'),
+        batched queries ('batches'), items resolved by them ('batched') and, when the query
+        budget recorder is active, the queries spent resolving the embed ('queries').
+        """
+        if not hasattr(self.request._request, '_embed_stats'):
+            self.request._request._embed_stats = {}
+        return self.request._request._embed_stats.setdefault(field_name, {'views': 0, 'batches': 0, 'batched': 0, 'queries': 0})
+
+    def _record_embed_queries(self, stats, mark):
+        recorder = get_query_recorder()
+        if recorder and mark:
+            stats['queries'] += recorder.mark()[0] - mark[0]
+
+    def _get_embedded_view(self, v, view_args, view_kwargs, item):
+        request = EmbeddedRequest(self.request)
+        request.parents.setdefault(type(item), {})[item._id] = item
+
+        view_kwargs.update({
+            'request': request,
+            'is_embedded': True,
+        })
+
+        # Setup a view ourselves to avoid all the junk DRF throws in
+        # v is a function that hides everything v.cls is the actual view class
+        view = v.cls()
+        view.args = view_args
+        view.kwargs = view_kwargs
+        view.request = request
+        view.request.parser_context['kwargs'] = view_kwargs
+        view.format_kwarg = view.get_format_suffix(**view_kwargs)
+        return view
+
+    def _get_embed_serializer(self, view, cache):
+        # Cache serializers. to_representation of a serializer should NOT augment it's fields so resetting the context
+        # should be sufficient for reuse
+        if not view.get_serializer_class() in cache:
+            cache[view.get_serializer_class()] = view.get_serializer_class()(many=isinstance(view, ListModelMixin), context=view.get_serializer_context())
+        return cache[view.get_serializer_class()]
+
+    def _render_embedded(self, view, item, cache, queryset=None):
+        """Serialize ``item``, or a page of ``queryset`` if ``view`` is a list view. ``queryset``
+        defaults to the view's own filtered queryset.
+        """
+        ser = self._get_embed_serializer(view, cache)
+        request = view.request
+
+        try:
+            ser._context = view.get_serializer_context()
+
+            if not isinstance(view, ListModelMixin):
+                ret = ser.to_representation(item)
+            else:
+                if queryset is None:
+                    queryset = view.filter_queryset(view.get_queryset())
+                page = view.paginate_queryset(getattr(queryset, '_results_cache', None) or queryset)
+
+                ret = ser.to_representation(page or queryset)
+
+                if page is not None:
+                    request.parser_context['view'] = view
+                    request.parser_context['kwargs'].pop('request')
+                    view.paginator.request = request
+                    ret = view.paginator.get_paginated_response(ret).data
+        except Exception as e:
+            with transaction.atomic():
+                ret = view.handle_exception(e).data
+
+        # Allow request to be gc'd
+        ser._context = None
+        return ret
+
     def _get_embed_partial(self, field_name, field):
         """Create a partial function to fetch the values of an embedded field. A basic
         example is to include a Node's children in a single response.
 
+        The partial has a ``prefetch`` attribute, called by JSONAPIListSerializer with every
+        item of the page before any of them are serialized, which resolves the embed for all
+        of them at once when the embedded view supports it (see ``_prefetch_embeds``).
+
         :param str field_name: Name of field of the view's serializer_class to load
         results for
         :return function object -> dict:
@@ -68,27 +154,8 @@ class JSONAPIBaseView(generics.GenericAPIView):
             if not v:
                 return None
 
-            request = EmbeddedRequest(self.request)
-
-            if not hasattr(request._request, '_embed_cache'):
-                request._request._embed_cache = {}
-            cache = request._request._embed_cache
-
-            request.parents.setdefault(type(item), {})[item._id] = item
-
-            view_kwargs.update({
-                'request': request,
-                'is_embedded': True,
-            })
-
-            # Setup a view ourselves to avoid all the junk DRF throws in
-            # v is a function that hides everything v.cls is the actual view class
-            view = v.cls()
-            view.args = view_args
-            view.kwargs = view_kwargs
-            view.request = request
-            view.request.parser_context['kwargs'] = view_kwargs
-            view.format_kwarg = view.get_format_suffix(**view_kwargs)
+            cache = self._get_embed_cache()
+            view = self._get_embedded_view(v, view_args, view_kwargs, item)
 
             if not isinstance(view, ListModelMixin):
                 try:
@@ -103,42 +170,86 @@ class JSONAPIBaseView(generics.GenericAPIView):
                 # We already have the result for this embed, return it
                 return cache[_cache_key]
 
-            # Cache serializers. to_representation of a serializer should NOT augment it's fields so resetting the context
-            # should be sufficient for reuse
-            if not view.get_serializer_class() in cache:
-                cache[view.get_serializer_class()] = view.get_serializer_class()(many=isinstance(view, ListModelMixin), context=view.get_serializer_context())
-            ser = cache[view.get_serializer_class()]
-
-            try:
-                ser._context = view.get_serializer_context()
-
-                if not isinstance(view, ListModelMixin):
-                    ret = ser.to_representation(item)
-                else:
-                    queryset = view.filter_queryset(view.get_queryset())
-                    page = view.paginate_queryset(getattr(queryset, '_results_cache', None) or queryset)
-
-                    ret = ser.to_representation(page or queryset)
-
-                    if page is not None:
-                        request.parser_context['view'] = view
-                        request.parser_context['kwargs'].pop('request')
-                        view.paginator.request = request
-                        ret = view.paginator.get_paginated_response(ret).data
-            except Exception as e:
-                with transaction.atomic():
-                    ret = view.handle_exception(e).data
-
-            # Allow request to be gc'd
-            ser._context = None
+            stats = self._get_embed_stats(field_name)
+            recorder = get_query_recorder()
+            mark = recorder.mark() if recorder else None
+            ret = self._render_embedded(view, item, cache)
+            stats['views'] += 1
+            self._record_embed_queries(stats, mark)
 
             # Cache our final result
             cache[_cache_key] = ret
 
             return ret
 
+        def prefetch(items):
+            self._prefetch_embeds(field_name, field, items)
+
+        partial.prefetch = prefetch
         return partial
 
+    def _prefetch_embeds(self, field_name, field, items):
+        """Resolve ``field_name`` for all of ``items`` with one query per embedded view class and
+        store the results where ``_get_embed_partial`` will find them.
+
+        Only list views that declare ``embed_batch_key``, the name of the foreign key from the
+        objects they list to the item they list them for, take part. Such views implement
+        ``get_embed_batch_parent``, which returns that item after running the view's permission
+        checks, and ``get_embed_batch_queryset``, which returns the objects for a list of parents.
+        Items that fail the checks are left to the per-item path so that errors are rendered the
+        same way as before.
+        """
+        if not hasattr(field, 'resolve'):
+            # Not embeddable; the serializer reports it
+            return
+        cache = self._get_embed_cache()
+        plans = defaultdict(dict)
+        for item in items:
+            try:
+                v, view_args, view_kwargs = field.resolve(item, field_name, self.request)
+            except Exception:
+                continue
+            if not v or not getattr(v.cls, 'embed_batch_key', None):
+                continue
+            view = self._get_embedded_view(v, view_args, view_kwargs, item)
+            cache_key = (v.cls, field_name, view.get_serializer_class(), (type(item), item.id))
+            if cache_key in cache:
+                continue
+            try:
+                parent = view.get_embed_batch_parent()
+            except Exception:
+                continue
+            plans[v.cls][parent.pk] = (parent, view, item, cache_key)
+
+        if not plans:
+            return
+
+        stats = self._get_embed_stats(field_name)
+        recorder = get_query_recorder()
+        mark = recorder.mark() if recorder else None
+        for view_class, views in plans.items():
+            key = view_class.embed_batch_key
+            batch_view = next(iter(views.values()))[1]
+            queryset = batch_view.get_embed_batch_queryset([parent for parent, _, _, _ in views.values()])
+            groups = defaultdict(list)
+            for obj in batch_view.filter_queryset(queryset):
+                parent_pk = getattr(obj, obj._meta.get_field(key).attname)
+                # Saves a query per object when the serializer follows the relation back to the parent
+                setattr(obj, key, views[parent_pk][0])
+                groups[parent_pk].append(obj)
+            for parent_pk, (parent, view, item, cache_key) in views.items():
+                cache[cache_key] = self._render_embedded(view, item, cache, queryset=groups[parent_pk])
+            stats['batches'] += 1
+            stats['batched'] += len(views)
+        self._record_embed_queries(stats, mark)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(JSONAPIBaseView, self).finalize_response(request, response, *args, **kwargs)
+        embed_stats = getattr(request._request, '_embed_stats', None)
+        if embed_stats:
+            logger.info('Embeds for {}: {}'.format(self.view_fqn, json.dumps(embed_stats, sort_keys=True)))
+        return response
+
     def get_serializer_context(self):
         """Inject request into the serializer context. Additionally, inject partial functions
         (request, object -> embed items) if the query string contains embeds.  Allows
@@ -449,6 +560,13 @@ def status_check(request, format=None, **kwargs):
     })
 
 
+@api_view(('GET',))
+@permission_classes((drf_permissions.IsAdminUser, ))
+def postcommit_stats(request, format=None, **kwargs):
+    """Per-function timing and overflow counters for postcommit tasks run by this process."""
+    return Response(postcommit_handlers.postcommit_stats.as_dict())
+
+
 def error_404(request, format=None, *args, **kwargs):
     return JsonResponse(
         {'errors': [{'detail': 'Not found.'}]},
@@ -607,16 +725,11 @@ class WaterButlerMixin(object):
 
     def bulk_get_file_nodes_from_wb_resp(self, files_list):
         """Takes a list of file data from wb response, touches/updates metadata for each, and returns list of file objects.
-        This function mirrors all the actions of get_file_node_from_wb_resp except the create and updates are done in bulk.
-        The bulk_update and bulk_create do not call the base class update and create so the actions of those functions are
-        done here where needed
+        Existing file nodes are looked up with one query and all of them are saved with one upsert,
+        so neither depends on the size of the folder.
         """
         node = self.get_node(check_object_permissions=False)
-        content_type = ContentType.objects.get_for_model(node)
-
-        objs_to_create = defaultdict(lambda: [])
-        file_objs = []
-
+        entries = []
         for item in files_list:
             attrs = item['attributes']
             base_class = BaseFileNode.resolve_class(
@@ -624,38 +737,16 @@ class WaterButlerMixin(object):
                 BaseFileNode.FOLDER if attrs['kind'] == 'folder'
                 else BaseFileNode.FILE,
             )
+            entries.append((base_class, attrs['path']))
 
-            # mirrors BaseFileNode get_or_create
-            try:
-                file_obj = base_class.objects.get(target_object_id=node.id, target_content_type=content_type, _path='/' + attrs['path'].lstrip('/'))
-            except base_class.DoesNotExist:
-                # create method on BaseFileNode appends provider, bulk_create bypasses this step so it is added here
-                file_obj = base_class(target=node, _path='/' + attrs['path'].lstrip('/'), provider=base_class._provider)
-                objs_to_create[base_class].append(file_obj)
-            else:
-                file_objs.append(file_obj)
-
-            file_obj.update(None, attrs, user=self.request.user, save=False)
-
-        bulk_update(file_objs)
-
-        for base_class in objs_to_create:
-            base_class.objects.bulk_create(objs_to_create[base_class])
-            file_objs += objs_to_create[base_class]
-
-        return file_objs
+        file_objs = BaseFileNode.bulk_get_or_create(node, entries)
+        for item, file_obj in zip(files_list, file_objs):
+            file_obj.update(None, item['attributes'], user=self.request.user, save=False)
+        return BaseFileNode.bulk_upsert(file_objs)
 
     def get_file_node_from_wb_resp(self, item):
         """Takes file data from wb response, touches/updates metadata for it, and returns file object"""
-        attrs = item['attributes']
-        file_node = BaseFileNode.resolve_class(
-            attrs['provider'],
-            BaseFileNode.FOLDER if attrs['kind'] == 'folder'
-            else BaseFileNode.FILE,
-        ).get_or_create(self.get_node(check_object_permissions=False), attrs['path'])
-
-        file_node.update(None, attrs, user=self.request.user)
-        return file_node
+        return self.bulk_get_file_nodes_from_wb_resp([item])[0]
 
     def fetch_from_waterbutler(self):
         node = self.get_resource(check_object_permissions=False)
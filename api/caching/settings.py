@@ -1,4 +1,5 @@
 NEVER_TIMEOUT = None  # for django caches setting None as a timeout value means the cache never times out.
 FIVE_MIN_TIMEOUT = 60 * 5
+ONE_WEEK_TIMEOUT = 60 * 60 * 24 * 7
 
-STORAGE_USAGE_KEY = 'storage_usage:{target_id}'
+CITATION_KEY = 'citation:{style}:{guid}:{modified}:{digest}'
@@ -1,14 +1,14 @@
+import json
 import urlparse
 
 import requests
 import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
-from django.apps import apps
-from api.caching.utils import storage_usage_cache
-from django.db import models
-from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task, postcommit_queue
 
-from api.caching import settings as cache_settings
 from framework.celery_tasks import app
 from website import settings
 
@@ -20,102 +20,235 @@ def get_varnish_servers():
     return settings.VARNISH_SERVERS
 
 
-def get_bannable_urls(instance):
+def get_bannable_paths(instance):
+    """Return the API paths that should be banned when ``instance`` changes, and the API hostname.
+    Each path is treated as a prefix, i.e. banned as ``<path>.*``.
+    """
     from osf.models import Comment
-    bannable_urls = []
-    parsed_absolute_url = {}
 
     if not hasattr(instance, 'absolute_api_v2_url'):
         logger.warning('Tried to ban {}:{} but it didn\'t have a absolute_api_v2_url method'.format(instance.__class__, instance))
         return [], ''
 
+    parsed_absolute_url = urlparse.urlparse(instance.absolute_api_v2_url)
+    bannable_paths = [parsed_absolute_url.path]
+    if isinstance(instance, Comment):
+        try:
+            bannable_paths.append(urlparse.urlparse(instance.target.referent.absolute_api_v2_url).path)
+        except AttributeError:
+            # some referents don't have an absolute_api_v2_url
+            # I'm looking at you NodeWikiPage
+            # Note: NodeWikiPage has been deprecated. Is this an issue with WikiPage/WikiVersion?
+            pass
+        try:
+            bannable_paths.append(urlparse.urlparse(instance.root_target.referent.absolute_api_v2_url).path)
+        except AttributeError:
+            # some root_targets don't have an absolute_api_v2_url
+            pass
+    return bannable_paths, parsed_absolute_url.hostname
+
+
+def get_bannable_urls(instance):
+    bannable_urls = []
+    bannable_paths, hostname = get_bannable_paths(instance)
     for host in get_varnish_servers():
-        # add instance url
         varnish_parsed_url = urlparse.urlparse(host)
-        parsed_absolute_url = urlparse.urlparse(instance.absolute_api_v2_url)
-        url_string = '{scheme}://{netloc}{path}.*'.format(
-            scheme=varnish_parsed_url.scheme,
-            netloc=varnish_parsed_url.netloc,
-            path=parsed_absolute_url.path,
+        for path in bannable_paths:
+            bannable_urls.append(get_ban_pattern(varnish_parsed_url, path))
+    return bannable_urls, hostname
+
+
+def get_ban_pattern(varnish_parsed_url, path):
+    return '{scheme}://{netloc}{path}.*'.format(
+        scheme=varnish_parsed_url.scheme,
+        netloc=varnish_parsed_url.netloc,
+        path=path,
+    )
+
+
+def merge_ban_paths(paths):
+    """Collapse ``paths`` to the smallest set of prefixes that bans the same URLs.
+
+    Every path is banned as ``<path>.*``, so any path that starts with another path in the set
+    is already covered by it.
+    """
+    merged = []
+    for path in sorted(set(paths)):
+        if not merged or not path.startswith(merged[-1]):
+            merged.append(path)
+    return merged
+
+
+class BanStats(object):
+    """Process-wide counters for Varnish bans."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requested = 0  # ban paths collected, before merging
+        self.sent = 0  # BAN requests issued, after merging (per Varnish server)
+        self.merged = 0  # ban paths remaining after merging
+        self.failed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record_batch(self, requested, merged):
+        with self._lock:
+            self.requested += requested
+            self.merged += merged
+
+    def record_ban(self, ok, elapsed):
+        with self._lock:
+            self.sent += 1
+            if not ok:
+                self.failed += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'requested': self.requested,
+                'merged': self.merged,
+                'merge_ratio': float(self.merged) / self.requested if self.requested else 1.0,
+                'sent': self.sent,
+                'failed': self.failed,
+                'mean_latency_ms': 1000 * self.total_seconds / self.sent if self.sent else 0.0,
+                'max_latency_ms': 1000 * self.max_seconds,
+            }
+
+ban_stats = BanStats()
+
+_varnish_sessions = {}
+_ban_pool = None
+_ban_lock = threading.Lock()
+
+
+def get_varnish_session(netloc):
+    """Return a persistent requests Session for a Varnish server so BANs reuse connections."""
+    with _ban_lock:
+        session = _varnish_sessions.get(netloc)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings.VARNISH_BAN_CONCURRENCY)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _varnish_sessions[netloc] = session
+        return session
+
+
+def get_ban_pool():
+    global _ban_pool
+    with _ban_lock:
+        if _ban_pool is None:
+            _ban_pool = ThreadPool(settings.VARNISH_BAN_CONCURRENCY)
+        return _ban_pool
+
+
+def _send_ban(args):
+    url_to_ban, netloc, hostname = args
+    start = time.time()
+    ok = False
+    try:
+        response = get_varnish_session(netloc).request(
+            'BAN', url_to_ban, timeout=settings.VARNISH_BAN_TIMEOUT, headers=dict(
+                Host=hostname,
+            ),
         )
-        bannable_urls.append(url_string)
-        if isinstance(instance, Comment):
-            try:
-                parsed_target_url = urlparse.urlparse(instance.target.referent.absolute_api_v2_url)
-            except AttributeError:
-                # some referents don't have an absolute_api_v2_url
-                # I'm looking at you NodeWikiPage
-                # Note: NodeWikiPage has been deprecated. Is this an issue with WikiPage/WikiVersion?
-                pass
-            else:
-                url_string = '{scheme}://{netloc}{path}.*'.format(
-                    scheme=varnish_parsed_url.scheme,
-                    netloc=varnish_parsed_url.netloc,
-                    path=parsed_target_url.path,
-                )
-                bannable_urls.append(url_string)
-
-            try:
-                parsed_root_target_url = urlparse.urlparse(instance.root_target.referent.absolute_api_v2_url)
-            except AttributeError:
-                # some root_targets don't have an absolute_api_v2_url
-                pass
-            else:
-                url_string = '{scheme}://{netloc}{path}.*'.format(
-                    scheme=varnish_parsed_url.scheme,
-                    netloc=varnish_parsed_url.netloc,
-                    path=parsed_root_target_url.path,
-                )
-                bannable_urls.append(url_string)
-
-    return bannable_urls, parsed_absolute_url.hostname
+    except Exception as ex:
+        logger.error('Banning {} failed: {}'.format(
+            url_to_ban,
+            ex,
+        ))
+    else:
+        ok = response.ok
+        if not ok:
+            logger.error('Banning {} failed: {}'.format(
+                url_to_ban,
+                response.text,
+            ))
+        else:
+            logger.info('Banning {} succeeded'.format(
+                url_to_ban,
+            ))
+    ban_stats.record_ban(ok, time.time() - start)
+    return ok
+
+
+def send_bans(paths_by_hostname):
+    """Merge and send bans to every Varnish server concurrently.
+
+    :param dict paths_by_hostname: API hostname -> iterable of path prefixes to ban
+    :return: number of BAN requests sent
+    """
+    jobs = []
+    for hostname, paths in paths_by_hostname.items():
+        paths = list(paths)
+        merged = merge_ban_paths(paths)
+        ban_stats.record_batch(len(paths), len(merged))
+        for host in get_varnish_servers():
+            varnish_parsed_url = urlparse.urlparse(host)
+            jobs.extend(
+                (get_ban_pattern(varnish_parsed_url, path), varnish_parsed_url.netloc, hostname)
+                for path in merged
+            )
+    if len(jobs) == 1:
+        _send_ban(jobs[0])
+    elif jobs:
+        get_ban_pool().map(_send_ban, jobs)
+    return len(jobs)
+
+
+class BanCoalescer(object):
+    """Collects ban paths produced during a request or task and sends them once, after commit."""
+
+    def __init__(self):
+        self.paths_by_hostname = {}
+
+    def add(self, instance):
+        paths, hostname = get_bannable_paths(instance)
+        if paths:
+            self.paths_by_hostname.setdefault(hostname, set()).update(paths)
+
+    def flush(self):
+        paths_by_hostname, self.paths_by_hostname = self.paths_by_hostname, {}
+        if not paths_by_hostname:
+            return 0
+        sent = send_bans(paths_by_hostname)
+        stats = ban_stats.as_dict()
+        logger.info('Sent {} Varnish bans; totals for this process: {}'.format(sent, json.dumps(stats, sort_keys=True)), extra={'ban_stats': stats})
+        return sent
+
+
+def get_ban_coalescer():
+    """Return the coalescer already queued for this request, if any."""
+    for task in postcommit_queue().values():
+        if getattr(task, 'func', None) is flush_bans:
+            return task.args[0]
+    return BanCoalescer()
+
+
+def flush_bans(coalescer):
+    coalescer.flush()
+
+
+def enqueue_ban(instance):
+    """Ban ``instance``'s API URLs from Varnish after the current request commits.
+    All bans enqueued during a request are merged and sent together.
+    """
+    if not settings.ENABLE_VARNISH:
+        return
+    coalescer = get_ban_coalescer()
+    coalescer.add(instance)
+    enqueue_postcommit_task(flush_bans, (coalescer, ), {}, celery=False, once_per_request=True)
 
 
 @app.task(max_retries=5, default_retry_delay=60)
 def ban_url(instance):
-    # TODO: Refactor; Pull url generation into postcommit_task handling so we only ban urls once per request
-    timeout = 0.3  # 300ms timeout for bans
     if settings.ENABLE_VARNISH:
-        bannable_urls, hostname = get_bannable_urls(instance)
-
-        for url_to_ban in set(bannable_urls):
-            try:
-                response = requests.request(
-                    'BAN', url_to_ban, timeout=timeout, headers=dict(
-                        Host=hostname,
-                    ),
-                )
-            except Exception as ex:
-                logger.error('Banning {} failed: {}'.format(
-                    url_to_ban,
-                    ex.message,
-                ))
-            else:
-                if not response.ok:
-                    logger.error('Banning {} failed: {}'.format(
-                        url_to_ban,
-                        response.text,
-                    ))
-                else:
-                    logger.info('Banning {} succeeded'.format(
-                        url_to_ban,
-                    ))
-
-
-@app.task(max_retries=5, default_retry_delay=10)
-def update_storage_usage_cache(target_id):
-    AbstractNode = apps.get_model('osf.AbstractNode')
-
-    storage_usage_total = AbstractNode.objects.get(
-        guids___id=target_id,
-    ).files.aggregate(sum=models.Sum('versions__size'))['sum'] or 0
-
-    key = cache_settings.STORAGE_USAGE_KEY.format(target_id=target_id)
-    storage_usage_cache.set(key, storage_usage_total, cache_settings.FIVE_MIN_TIMEOUT)
-
-
-def update_storage_usage(target):
-    Preprint = apps.get_model('osf.preprint')
-
-    if not isinstance(target, Preprint) and not target.is_quickfiles:
-        enqueue_postcommit_task(update_storage_usage_cache, (target._id,), {}, celery=True)
+        coalescer = BanCoalescer()
+        coalescer.add(instance)
+        coalescer.flush()
+
@@ -0,0 +1,105 @@
+from __future__ import unicode_literals
+
+import threading
+
+import mock
+import pytest
+from six.moves import BaseHTTPServer
+
+from api.caching import tasks
+
+
+class StubVarnishHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_BAN(self):
+        self.server.bans.append((self.path, self.headers.get('Host')))
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def varnish():
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StubVarnishHandler)
+    server.bans = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    with mock.patch('website.settings.VARNISH_SERVERS', ['http://127.0.0.1:{}'.format(server.server_port)]):
+        with mock.patch('website.settings.ENABLE_VARNISH', True):
+            yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FakeResource(object):
+
+    def __init__(self, path):
+        self.absolute_api_v2_url = 'http://api.osf.io{}'.format(path)
+
+
+class TestMergeBanPaths:
+
+    def test_nested_paths_are_merged(self):
+        assert tasks.merge_ban_paths([
+            '/v2/nodes/abcde/comments/',
+            '/v2/nodes/abcde/',
+            '/v2/nodes/fghij/',
+            '/v2/nodes/abcde/',
+        ]) == ['/v2/nodes/abcde/', '/v2/nodes/fghij/']
+
+    def test_empty(self):
+        assert tasks.merge_ban_paths([]) == []
+
+
+class TestBanCoalescer:
+
+    def test_flush_sends_merged_bans(self, varnish):
+        tasks.ban_stats.reset()
+        coalescer = tasks.BanCoalescer()
+        coalescer.add(FakeResource('/v2/nodes/abcde/'))
+        coalescer.add(FakeResource('/v2/nodes/abcde/files/'))
+        coalescer.add(FakeResource('/v2/users/klmno/'))
+
+        assert coalescer.flush() == 2
+        assert sorted(varnish.bans) == [
+            ('/v2/nodes/abcde/.*', 'api.osf.io'),
+            ('/v2/users/klmno/.*', 'api.osf.io'),
+        ]
+        stats = tasks.ban_stats.as_dict()
+        assert stats['requested'] == 3
+        assert stats['merged'] == 2
+        assert stats['sent'] == 2
+        assert stats['failed'] == 0
+
+    def test_flush_logs_stats(self, varnish):
+        tasks.ban_stats.reset()
+        coalescer = tasks.BanCoalescer()
+        coalescer.add(FakeResource('/v2/nodes/abcde/'))
+        with mock.patch('api.caching.tasks.logger.info') as mock_info:
+            coalescer.flush()
+            coalescer.flush()
+        stats_calls = [call for call in mock_info.call_args_list if 'ban_stats' in call[1].get('extra', {})]
+        assert len(stats_calls) == 1
+        stats = stats_calls[0][1]['extra']['ban_stats']
+        assert stats['sent'] == 1
+        assert stats['requested'] == 1
+
+    def test_flush_empties_coalescer(self, varnish):
+        coalescer = tasks.BanCoalescer()
+        coalescer.add(FakeResource('/v2/nodes/abcde/'))
+        coalescer.flush()
+        assert coalescer.flush() == 0
+        assert len(varnish.bans) == 1
+
+    def test_ban_url_task(self, varnish):
+        tasks.ban_url(FakeResource('/v2/nodes/abcde/'))
+        assert varnish.bans == [('/v2/nodes/abcde/.*', 'api.osf.io')]
+
+    def test_failed_ban_is_counted(self):
+        tasks.ban_stats.reset()
+        with mock.patch('website.settings.VARNISH_SERVERS', ['http://127.0.0.1:1']):
+            tasks.send_bans({'api.osf.io': ['/v2/nodes/abcde/']})
+        assert tasks.ban_stats.as_dict()['failed'] == 1
@@ -1,4 +1,61 @@
+import base64
+import datetime
+
 from django.core.cache import caches
 from django.conf import settings
+from django.db import connections, router
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.six.moves import cPickle as pickle
+
+citation_cache = caches[settings.CITATION_CACHE_NAME]
+
+
+def db_cache_get_many(cache, keys):
+    """Like ``cache.get_many`` for a DatabaseCache, but with one query rather than one per key."""
+    db_keys = {}
+    for key in keys:
+        db_key = cache.make_key(key)
+        cache.validate_key(db_key)
+        db_keys[db_key] = key
+    if not db_keys:
+        return {}
+    connection = connections[router.db_for_read(cache.cache_model_class)]
+    sql = 'SELECT cache_key, value FROM {} WHERE cache_key = ANY(%s) AND expires > %s'.format(connection.ops.quote_name(cache._table))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(db_keys), timezone.now()])
+        rows = cursor.fetchall()
+    return {db_keys[db_key]: pickle.loads(base64.b64decode(force_bytes(value))) for db_key, value in rows}
+
 
-storage_usage_cache = caches[settings.STORAGE_USAGE_CACHE_NAME]
+def db_cache_set_many(cache, data, timeout):
+    """Like ``cache.set_many`` for a DatabaseCache, but with a single upsert rather than a
+    transaction per key. Culls the table as ``set`` does once it holds more than MAX_ENTRIES.
+    """
+    if not data:
+        return
+    db_keys, values = [], []
+    for key, value in data.items():
+        db_key = cache.make_key(key)
+        cache.validate_key(db_key)
+        db_keys.append(db_key)
+        values.append(base64.b64encode(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+    db = router.db_for_write(cache.cache_model_class)
+    connection = connections[db]
+    table = connection.ops.quote_name(cache._table)
+    now = timezone.now()
+    sql = """
+        INSERT INTO {table} (cache_key, value, expires)
+        SELECT K.cache_key, K.value, %(expires)s
+        FROM unnest(%(keys)s::varchar[], %(values)s::text[]) AS K (cache_key, value)
+        ON CONFLICT (cache_key) DO UPDATE SET value = EXCLUDED.value, expires = EXCLUDED.expires;
+    """.format(table=table)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {
+            'keys': db_keys,
+            'values': values,
+            'expires': now + datetime.timedelta(seconds=timeout),
+        })
+        cursor.execute('SELECT COUNT(*) FROM {}'.format(table))
+        if cursor.fetchone()[0] > cache._max_entries:
+            cache._cull(db, cursor, now)
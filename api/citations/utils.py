@@ -1,15 +1,23 @@
+import collections
+import hashlib
+import json
 import os
 import re
+import threading
 import httplib as http
 
 from citeproc import CitationStylesStyle, CitationStylesBibliography
 from citeproc import Citation, CitationItem
 from citeproc import formatter
 from citeproc.source.json import CiteProcJSON
+from django.contrib.contenttypes.models import ContentType
 
+from api.caching.settings import CITATION_KEY, ONE_WEEK_TIMEOUT
+from api.caching.utils import citation_cache, db_cache_get_many, db_cache_set_many
 from framework.exceptions import HTTPError
 from framework.auth import utils
 from osf.models.citation import CitationStyle
+from osf.models.identifiers import Identifier
 from website.settings import CITATION_STYLES_PATH, BASE_PATH, CUSTOM_CITATIONS
 
 
@@ -42,28 +50,137 @@ def process_name(node, user):
     }
 
 
-def render_citation(node, style='apa'):
-    """Given a node, return a citation"""
-    reformat_styles = ['apa', 'chicago-author-date', 'modern-language-association']
-    csl = node.csl
-    data = [csl, ]
+# Number of parsed CSL styles kept by each process
+STYLE_CACHE_SIZE = 32
 
-    bib_source = CiteProcJSON(data)
 
+def load_style(style):
+    """Parse the CSL file for ``style``, or for its parent if ``style`` is a dependent style."""
     custom = CUSTOM_CITATIONS.get(style, False)
     path = os.path.join(BASE_PATH, 'static', custom) if custom else os.path.join(CITATION_STYLES_PATH, style)
 
     try:
-        bib_style = CitationStylesStyle(path, validate=False)
+        return CitationStylesStyle(path, validate=False)
     except ValueError:
         citation_style = CitationStyle.load(style)
         if citation_style is not None and citation_style.has_parent_style:
             parent_style = citation_style.parent_style
             parent_path = os.path.join(CITATION_STYLES_PATH, parent_style)
-            bib_style = CitationStylesStyle(parent_path, validate=False)
+            return CitationStylesStyle(parent_path, validate=False)
         else:
             raise ValueError('Unable to find a dependent or independent parent style related to {}.csl'.format(style))
 
+
+class StyleCache(object):
+    """Least recently used cache of parsed CSL styles.
+
+    ``get`` returns the style along with a lock that must be held while rendering with it, since
+    citeproc stores per-bibliography state, such as the formatter, on the style.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.styles = collections.OrderedDict()
+
+    def get(self, style):
+        with self.lock:
+            entry = self.styles.pop(style, None)
+            if entry is not None:
+                self.styles[style] = entry
+                return entry
+        # Parse outside of the lock; two threads missing at once both parse and the last one wins
+        entry = (load_style(style), threading.Lock())
+        with self.lock:
+            self.styles[style] = entry
+            while len(self.styles) > self.size:
+                self.styles.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.styles.clear()
+
+
+style_cache = StyleCache(STYLE_CACHE_SIZE)
+
+
+def get_citation_versions(nodes):
+    """Return {node _id: version} for ``nodes``, where the version changes whenever the node's CSL may.
+
+    Besides the node's own fields, the CSL depends on its visible contributors' names, which are
+    covered by the contributors' modification dates, its latest log date and its DOI. These are
+    looked up with two queries per contributor model rather than building the CSL of each node.
+    Objects without contributors of their own are versioned by their CSL.
+    """
+    versions = {}
+    by_model = collections.defaultdict(list)
+    for node in nodes:
+        contributor_set = getattr(node, 'contributor_set', None)
+        if contributor_set is None:
+            versions[node._id] = [node.modified.isoformat(), node.csl]
+            continue
+        last_logged = getattr(node, 'last_logged', None)
+        versions[node._id] = [node.modified.isoformat(), last_logged.isoformat() if last_logged else None, getattr(node, 'provider_id', None)]
+        by_model[contributor_set.model].append(node)
+
+    for model, group in by_model.items():
+        fk = model._meta.order_with_respect_to
+        guids = {node.id: node._id for node in group}
+        contributors = model.objects.filter(
+            visible=True, **{'{}__in'.format(fk.attname): list(guids)}
+        ).order_by(fk.attname, '_order').values_list(fk.attname, 'user_id', 'user__modified')
+        for node_id, user_id, user_modified in contributors:
+            versions[guids[node_id]].append([user_id, user_modified.isoformat()])
+        dois = Identifier.objects.filter(
+            content_type=ContentType.objects.get_for_model(group[0]), object_id__in=list(guids), category='doi',
+        ).values_list('object_id', 'value')
+        for node_id, doi in dois:
+            versions[guids[node_id]].append(doi)
+    return {guid: hashlib.md5(json.dumps(version, sort_keys=True)).hexdigest() for guid, version in versions.items()}
+
+
+def get_citation_cache_key(node, style, version):
+    return CITATION_KEY.format(style=style, guid=node._id, modified=node.modified.isoformat(), digest=version)
+
+
+def render_citation(node, style='apa'):
+    """Given a node, return a citation"""
+    return render_citations([node], style=style)[node._id]
+
+
+def render_citations(nodes, style='apa'):
+    """Return {node _id: citation} for ``nodes`` in ``style``.
+
+    Citations are cached by node, modification date, citation version (see
+    ``get_citation_versions``) and style, and are read and written with one query each. Only the
+    misses build their CSL, and they are all rendered with one parsed copy of the style. Each node
+    still gets its own bibliography so that its citation does not depend on the other nodes (e.g.
+    through year suffixes).
+    """
+    versions = get_citation_versions(nodes)
+    keys = {node._id: get_citation_cache_key(node, style, versions[node._id]) for node in nodes}
+    cached = db_cache_get_many(citation_cache, keys.values())
+    citations = {guid: cached[key] for guid, key in keys.items() if key in cached}
+
+    missing = [node for node in nodes if node._id not in citations]
+    if missing:
+        bib_style, lock = style_cache.get(style)
+        rendered = {}
+        with lock:
+            for node in missing:
+                rendered[node._id] = format_citation(node, style, node.csl, bib_style)
+        db_cache_set_many(citation_cache, {keys[guid]: citation for guid, citation in rendered.items()}, ONE_WEEK_TIMEOUT)
+        citations.update(rendered)
+    return citations
+
+
+def format_citation(node, style, csl, bib_style):
+    reformat_styles = ['apa', 'chicago-author-date', 'modern-language-association']
+    data = [csl, ]
+
+    bib_source = CiteProcJSON(data)
+
     bibliography = CitationStylesBibliography(bib_style, bib_source, formatter.plain)
 
     citation = Citation([CitationItem(node._id)])
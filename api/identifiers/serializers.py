@@ -1,3 +1,4 @@
+from django.db.models import Case, CharField, F, Value, When
 from rest_framework import serializers as ser
 from rest_framework import exceptions
 
@@ -18,6 +19,10 @@ class RegistrationIdentifierSerializer(JSONAPISerializer):
     category = ser.SerializerMethodField()
 
     filterable_fields = frozenset(['category'])
+    filter_expressions = {
+        # Mirrors get_category
+        'category': Case(When(category='legacy_doi', then=Value('doi')), default=F('category'), output_field=CharField()),
+    }
 
     value = ser.CharField(read_only=True)
 
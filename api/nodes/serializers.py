@@ -35,7 +35,7 @@ from osf.exceptions import NodeStateError
 from osf.models import (
     Comment, DraftRegistration, Institution,
     RegistrationSchema, AbstractNode, PrivateLink,
-    RegistrationProvider,
+    RegistrationProvider, NodeStorageUsage,
 )
 from osf.models.external import ExternalAccount
 from osf.models.licenses import NodeLicense
@@ -384,6 +384,7 @@ class NodeSerializer(TaxonomizableSerializerMixin, JSONAPISerializer):
     files = RelationshipField(
         related_view='nodes:node-storage-providers',
         related_view_kwargs={'node_id': '<_id>'},
+        related_meta={'storage_usage': 'get_storage_usage'},
     )
 
     settings = RelationshipField(
@@ -615,6 +616,21 @@ class NodeSerializer(TaxonomizableSerializerMixin, JSONAPISerializer):
     def get_contrib_count(self, obj):
         return len(obj.contributors)
 
+    def prefetch_page(self, nodes):
+        self.context['storage_usage_node_ids'] = [node.id for node in nodes]
+
+    def get_storage_usage(self, obj):
+        """Bytes used by the node's OsfStorage files, looked up for the whole page on first use."""
+        if obj.is_quickfiles:
+            return None
+        totals = self.context.get('storage_usage_totals', {})
+        if obj.id not in totals:
+            node_ids = self.context.get('storage_usage_node_ids') or []
+            if obj.id not in node_ids:
+                node_ids = [obj.id]
+            totals = self.context['storage_usage_totals'] = NodeStorageUsage.get_totals(node_ids)
+        return totals[obj.id]
+
     def get_registration_count(self, obj):
         auth = get_user_auth(self.context['request'])
         registrations = [node for node in obj.registrations_all if node.can_view(auth)]
@@ -114,9 +114,9 @@ from framework.exceptions import HTTPError
 from framework.auth.oauth_scopes import CoreScopes
 from osf.models import AbstractNode
 from osf.models import (Node, PrivateLink, Institution, Comment, DraftRegistration, Registration, )
-from osf.models import OSFUser
+from osf.models import Contributor, OSFUser
 from osf.models import NodeRelation, Guid
-from osf.models import BaseFileNode
+from osf.models import BaseFileNode, NodeLogFeedEntry
 from osf.models.files import File, Folder
 from addons.osfstorage.models import Region
 from osf.utils.permissions import ADMIN
@@ -210,6 +210,11 @@ class NodeList(JSONAPIBaseView, bulk_views.BulkUpdateJSONAPIView, bulk_views.Bul
     view_name = 'node-list'
 
     ordering = ('-modified', )  # default ordering
+    cursor_ordering = ('-modified', '-id')
+    # Authentication, the count, page and prefetch queries, then the per-node lookups that
+    # aren't annotated by optimize_node_queryset (preprint, region, license)
+    query_budget = 25
+    query_budget_per_result = 6
 
     # overrides NodesFilterMixin
     def get_default_queryset(self):
@@ -386,9 +391,18 @@ class NodeContributorsList(BaseContributorList, bulk_views.BulkUpdateJSONAPIView
     view_name = 'node-contributors'
     ordering = ('_order',)  # default ordering
 
+    # Embedded contributors for a page of nodes are fetched in one query, see JSONAPIBaseView._prefetch_embeds
+    embed_batch_key = 'node'
+
     def get_resource(self):
         return self.get_node()
 
+    def get_embed_batch_parent(self):
+        return self.get_node()
+
+    def get_embed_batch_queryset(self, nodes):
+        return Contributor.objects.filter(node__in=nodes).include('user__guids')
+
     # overrides ListBulkCreateJSONAPIView, BulkUpdateJSONAPIView, BulkDeleteJSONAPIView
     def get_serializer_class(self):
         """
@@ -1021,6 +1035,9 @@ class NodeFilesList(JSONAPIBaseView, generics.ListAPIView, WaterButlerMixin, Lis
     )
 
     ordering = ('_materialized_path',)  # default ordering
+    # The files listed are the children of one folder, so their names sort like their
+    # materialized paths, which may be NULL
+    cursor_ordering = ('name', 'id')
 
     required_read_scopes = [CoreScopes.NODE_FILE_READ]
     required_write_scopes = [CoreScopes.NODE_FILE_WRITE]
@@ -1346,6 +1363,13 @@ class NodeLogList(JSONAPIBaseView, generics.ListAPIView, NodeMixin, ListFilterMi
 
     ordering = ('-date', )
 
+    @property
+    def cursor_ordering(self):
+        # Feed queries are ordered by the date copied onto the feed, see get_aggregate_logs_queryset
+        if NodeLogFeedEntry.is_enabled():
+            return ('-feed_date', '-id')
+        return ('-date', '-id')
+
     permission_classes = (
         drf_permissions.IsAuthenticatedOrReadOnly,
         ContributorOrPublic,
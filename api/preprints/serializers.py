@@ -4,7 +4,7 @@ from rest_framework import serializers as ser
 from rest_framework.fields import empty
 from rest_framework.exceptions import ValidationError as DRFValidationError
 
-from api.base.exceptions import Conflict, JSONAPIException
+from api.base.exceptions import Conflict, InvalidQueryStringError, JSONAPIException
 from api.base.serializers import (
     JSONAPISerializer, IDField, TypeField, HideIfNotWithdrawal, NoneIfWithdrawal,
     LinksField, RelationshipField, VersionedDateTimeField, JSONAPIListField,
@@ -24,6 +24,7 @@ from api.nodes.serializers import (
     NodeTagField,
 )
 from api.base.metrics import MetricsSerializerMixin
+from api.citations.utils import render_citations
 from api.taxonomies.serializers import TaxonomizableSerializerMixin
 from framework.exceptions import PermissionsError
 from website.project import signals as project_signals
@@ -198,6 +199,24 @@ class PreprintSerializer(TaxonomizableSerializerMixin, MetricsSerializerMixin, J
                 user_perms.append(p)
         return user_perms
 
+    def prefetch_page(self, preprints):
+        # ?citation=<style> adds each preprint's citation to its meta, rendered for the whole page at once
+        style = self.context['request'].query_params.get('citation')
+        if style:
+            try:
+                self.context['citations'] = render_citations(preprints, style=style)
+            except ValueError:  # style requested could not be found
+                raise InvalidQueryStringError('{} is not a known style.'.format(style), parameter='citation')
+
+    # Overrides MetricsSerializerMixin
+    def get_meta(self, obj):
+        meta = super(PreprintSerializer, self).get_meta(obj)
+        citations = self.context.get('citations')
+        if citations is not None:
+            meta = meta or {}
+            meta['citation'] = citations[obj._id]
+        return meta
+
     def get_preprint_doi_url(self, obj):
         doi = None
         doi_identifier = obj.get_identifier('doi')
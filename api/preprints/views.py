@@ -104,6 +104,7 @@ class PreprintList(MetricsViewMixin, JSONAPIBaseView, generics.ListCreateAPIView
 
     ordering = ('-created')
     ordering_fields = ('created', 'date_last_transitioned')
+    cursor_ordering = ('-created', '-id')
     view_category = 'preprints'
     view_name = 'preprint-list'
     metric_map = {
@@ -354,6 +355,9 @@ class PreprintContributorsList(NodeContributorsList, PreprintMixin):
     view_name = 'preprint-contributors'
     serializer_class = PreprintContributorsSerializer
 
+    # Not batched when embedded, overrides NodeContributorsList
+    embed_batch_key = None
+
     def get_default_queryset(self):
         preprint = self.get_preprint()
         return preprint.preprintcontributor_set.all().include('user__guids')
@@ -4,6 +4,7 @@ import re
 
 import pytz
 from dateutil import parser
+from django.db.models.functions import Upper
 from django.utils import timezone
 
 from nose.tools import *  # noqa:
@@ -13,6 +14,8 @@ from rest_framework import serializers as ser
 from unittest import TestCase
 
 from tests.base import ApiTestCase
+from osf.models import OSFUser
+from osf_tests.factories import UserFactory
 
 from api.base.filters import ListFilterMixin
 import api.base.filters as filters
@@ -84,6 +87,24 @@ class FakeListView(ListFilterMixin):
     serializer_class = FakeSerializer
 
 
+class FakeExpressionSerializer(ser.Serializer):
+
+    filterable_fields = ('shouted_name', )
+    filter_expressions = {
+        'shouted_name': Upper('fullname'),
+    }
+
+    shouted_name = ser.SerializerMethodField()
+
+    def get_shouted_name(self, obj):
+        return obj.fullname.upper()
+
+
+class FakeExpressionListView(ListFilterMixin):
+
+    serializer_class = FakeExpressionSerializer
+
+
 class TestFilterMixin(ApiTestCase):
 
     def setUp(self):
@@ -158,6 +179,28 @@ class TestFilterMixin(ApiTestCase):
         assert_equal(parsed_field['value'], False)
         assert_equal(parsed_field['op'], 'eq')
 
+    def test_get_filtered_queryset_counts_python_filtering(self):
+        before = filters.python_filter_counts[('FakeListView', 'int_field')]
+        params = {
+            'value': 42,
+            'op': 'eq',
+            'source_field_name': 'int_field'
+        }
+        self.view.get_filtered_queryset('int_field', params, [FakeRecord()])
+        assert_equal(filters.python_filter_counts[('FakeListView', 'int_field')], before + 1)
+
+    def test_param_queryset_uses_filter_expression(self):
+        user = UserFactory(fullname='Shouty McShoutface')
+        UserFactory(fullname='Quiet Person')
+        view = FakeExpressionListView()
+        before = sum(filters.python_filter_counts.values())
+
+        queryset = view.param_queryset({'filter[shouted_name]': 'SHOUTY MCSHOUTFACE'}, OSFUser.objects.all())
+
+        assert_not_is_instance(queryset, list)
+        assert_equal(list(queryset), [user])
+        assert_equal(sum(filters.python_filter_counts.values()), before)
+
     def test_parse_query_params_generalizes_dates(self):
         query_params = {
             'filter[date_field]': '2014-12-12'
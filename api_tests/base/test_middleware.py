@@ -3,13 +3,16 @@ from django.http import HttpResponse
 
 from urlparse import urlparse
 import mock
+import pytest
 from nose.tools import *  # noqa:
 from rest_framework.test import APIRequestFactory
 from django.test.utils import override_settings
 
 from website.util import api_v2_url
 from api.base import settings
-from api.base.middleware import CorsMiddleware
+from api.base.middleware import CorsMiddleware, QueryBudgetMiddleware
+from api.base.query_budget import QueryBudgetExceeded, fingerprint, get_query_recorder
+from osf.models import OSFUser
 from tests.base import ApiTestCase
 from osf_tests import factories
 
@@ -113,3 +116,78 @@ class TestCorsMiddleware(MiddlewareTestCase):
         self.middleware.process_request(request)
         self.middleware.process_response(request, response)
         assert_equal(response['Access-Control-Allow-Origin'], domain.geturl())
+
+
+def make_budget_view(budget, queries):
+    def view(request):
+        for user_id in queries:
+            OSFUser.objects.filter(id=user_id).exists()
+        return HttpResponse()
+    view.cls = type('BudgetView', (object, ), {'query_budget': budget, 'view_name': 'budget-view'})
+    return view
+
+
+@pytest.mark.django_db
+class TestQueryBudgetMiddleware:
+
+    @pytest.fixture(autouse=True)
+    def query_budget_enabled(self, settings):
+        settings.QUERY_BUDGET_ENABLED = True
+        settings.QUERY_BUDGET_RAISE = True
+
+    @pytest.fixture()
+    def user_ids(self):
+        return [factories.UserFactory().id for _ in range(3)]
+
+    def get_response(self, view):
+        middleware = QueryBudgetMiddleware()
+        request = APIRequestFactory().get(api_v2_url('users/'))
+        middleware.process_request(request)
+        middleware.process_view(request, view, (), {})
+        return middleware.process_response(request, view(request))
+
+    def test_headers(self, user_ids):
+        response = self.get_response(make_budget_view(10, user_ids))
+        assert response['X-Query-Count'] == '3'
+        assert response['X-Query-Duplicates'] == '3'
+        assert float(response['X-Query-Time']) >= 0
+
+    def test_over_budget_raises(self, user_ids):
+        with pytest.raises(QueryBudgetExceeded):
+            self.get_response(make_budget_view(2, user_ids))
+
+    def test_over_budget_logs_when_not_raising(self, settings, user_ids):
+        settings.QUERY_BUDGET_RAISE = False
+        with mock.patch('api.base.middleware.logger.warning') as mock_warning:
+            self.get_response(make_budget_view(2, user_ids))
+        assert mock_warning.call_count == 1
+        assert mock_warning.call_args[1]['extra']['query_budget']['view'] == 'budget-view'
+
+    def test_budget_per_result(self, user_ids):
+        view = make_budget_view(1, user_ids)
+        view.cls.query_budget_per_result = 1
+
+        def paginated_view(request):
+            get_query_recorder().results = 2
+            return view(request)
+        paginated_view.cls = view.cls
+        response = self.get_response(paginated_view)
+        assert response['X-Query-Count'] == '3'
+
+        view.cls.query_budget_per_result = 0
+        with pytest.raises(QueryBudgetExceeded):
+            self.get_response(paginated_view)
+
+    def test_disabled(self, settings, user_ids):
+        settings.QUERY_BUDGET_ENABLED = False
+        response = self.get_response(make_budget_view(0, user_ids))
+        assert 'X-Query-Count' not in response
+
+
+class TestQueryFingerprint:
+
+    def test_literals_are_stripped(self):
+        assert fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'it''s'") == 'SELECT * FROM t WHERE id = ? AND name = ?'
+
+    def test_in_lists_are_collapsed(self):
+        assert fingerprint('SELECT * FROM t WHERE id IN (1, 2, 3)') == fingerprint('SELECT * FROM t WHERE id IN (4, 5)')
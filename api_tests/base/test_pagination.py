@@ -5,7 +5,7 @@ from osf_tests import factories
 from tests.base import ApiTestCase
 
 from api.base import settings
-from api.base.pagination import MaxSizePagination
+from api.base.pagination import JSONAPIPagination, MaxSizePagination
 
 
 class TestMaxPagination(ApiTestCase):
@@ -54,3 +54,78 @@ class TestJSONAPIPagination(ApiTestCase):
         assert_not_in('meta', links)
         assert_in('total', meta)
         assert_in('per_page', meta)
+
+
+class TestCursorPagination(ApiTestCase):
+
+    def setUp(self):
+        super(TestCursorPagination, self).setUp()
+        self.user = factories.AuthUserFactory()
+        self.projects = [factories.ProjectFactory(creator=self.user) for _ in range(0, 7)]
+        self.url = '/{}nodes/?version=2.1&page[size]=3&page[cursor]='.format(settings.API_BASE)
+
+    def get_all(self, url, link='next'):
+        ids = []
+        while url:
+            res = self.app.get(url, auth=self.user)
+            assert_equal(res.status_code, 200)
+            ids.extend(node['id'] for node in res.json['data'])
+            url = res.json['links'][link]
+        return ids
+
+    def test_pages_in_cursor_ordering(self):
+        expected = [project._id for project in sorted(self.projects, key=lambda project: (project.modified, project.id), reverse=True)]
+        assert_equal(self.get_all(self.url), expected)
+
+    def test_total_is_omitted_unless_requested(self):
+        res = self.app.get(self.url, auth=self.user)
+        assert_not_in('total', res.json['meta'])
+        assert_equal(res.json['meta']['per_page'], 3)
+        assert_is_none(res.json['links']['prev'])
+
+        res = self.app.get(self.url + '&page[total]=exact', auth=self.user)
+        assert_equal(res.json['meta']['total'], 7)
+
+        res = self.app.get(self.url + '&page[total]=approximate', auth=self.user)
+        assert_in('total', res.json['meta'])
+
+    def test_prev_and_last_links(self):
+        res = self.app.get(self.url, auth=self.user)
+        second = self.app.get(res.json['links']['next'], auth=self.user)
+        previous = self.app.get(second.json['links']['prev'], auth=self.user)
+        assert_equal(previous.json['data'], res.json['data'])
+
+        backwards = self.get_all(res.json['links']['last'], link='prev')
+        assert_equal(len(backwards), 7)
+
+    def test_stable_under_inserts(self):
+        res = self.app.get(self.url, auth=self.user)
+        seen = [node['id'] for node in res.json['data']]
+        factories.ProjectFactory(creator=self.user)
+        rest = self.get_all(res.json['links']['next'])
+        assert_equal(len(seen + rest), 7)
+        assert_false(set(seen) & set(rest))
+
+    def test_invalid_cursor(self):
+        res = self.app.get(self.url + 'garbage', auth=self.user, expect_errors=True)
+        assert_equal(res.status_code, 404)
+
+    def test_cursor_with_invalid_values(self):
+        encode_cursor = JSONAPIPagination().encode_cursor
+        for position in (['not a date', 1], [self.projects[0].modified.isoformat(), 'not an id'], [{}, []]):
+            res = self.app.get(self.url + encode_cursor(position), auth=self.user, expect_errors=True)
+            assert_equal(res.status_code, 404)
+
+    def test_cursor_with_null_values(self):
+        encode_cursor = JSONAPIPagination().encode_cursor
+        res = self.app.get(self.url + encode_cursor([None, None]), auth=self.user)
+        assert_equal(res.status_code, 200)
+        assert_equal(len(res.json['data']), 3)
+
+        res = self.app.get(self.url + encode_cursor([None, None], reverse=True), auth=self.user)
+        assert_equal(res.status_code, 200)
+        assert_equal(res.json['data'], [])
+
+    def test_sort_not_allowed_with_cursor(self):
+        res = self.app.get(self.url + '&sort=title', auth=self.user, expect_errors=True)
+        assert_equal(res.status_code, 400)
@@ -0,0 +1,139 @@
+import signal
+import sys
+import threading
+
+import mock
+import pytest
+from django.http import HttpResponse
+from six.moves import _thread
+from rest_framework.test import APIRequestFactory
+from waffle.testutils import override_switch
+
+from api.base.middleware import SamplingProfilerMiddleware
+from api.base.sampling_profiler import SamplingProfiler, fold_stack, read_folded
+from osf.features import SAMPLING_PROFILER
+
+
+def inner_function():
+    return fold_stack(sys._getframe())
+
+
+def outer_function():
+    return inner_function()
+
+
+@pytest.fixture()
+def profiler(tmpdir):
+    return SamplingProfiler(interval=0.001, output_dir=str(tmpdir), flush_interval=3600)
+
+
+class TestSamplingProfiler:
+
+    def test_fold_stack_is_outermost_first(self):
+        frames = outer_function().split(';')
+        assert frames[-1].startswith('inner_function (')
+        assert frames[-2].startswith('outer_function (')
+
+    def test_samples_only_active_requests(self, profiler):
+        profiler.sample(sys._getframe())
+        assert profiler.samples == 0
+
+        profiler.active[_thread.get_ident()] = 'node-list'
+        profiler.sample(sys._getframe())
+        assert profiler.samples == 1
+        assert list(profiler.stacks['node-list']) == [fold_stack(sys._getframe())]
+
+    def test_samples_other_threads(self, profiler):
+        started, done = threading.Event(), threading.Event()
+
+        def serve():
+            started.set()
+            done.wait()
+        thread = threading.Thread(target=serve)
+        thread.start()
+        started.wait()
+        try:
+            profiler.active[thread.ident] = 'node-list'
+            profiler.sample(sys._getframe())
+        finally:
+            done.set()
+            thread.join()
+        assert profiler.samples == 1
+        assert 'serve (' in list(profiler.stacks['node-list'])[0]
+
+    @mock.patch('api.base.sampling_profiler.signal.setitimer')
+    def test_timer_runs_only_while_requests_are_active(self, mock_setitimer, profiler):
+        profiler.installed = True
+        profiler.start_request('node-list')
+        mock_setitimer.assert_called_once_with(signal.ITIMER_PROF, 0.001, 0.001)
+
+        profiler.end_request()
+        mock_setitimer.assert_called_with(signal.ITIMER_PROF, 0)
+        assert profiler._flush_timer is None
+
+    @mock.patch('api.base.sampling_profiler.signal.setitimer')
+    def test_flush_is_scheduled_off_the_request(self, mock_setitimer, profiler):
+        profiler.installed = True
+        profiler.start_request('node-list')
+        profiler.stacks['node-list']['a;b'] += 1
+        with mock.patch.object(profiler, 'flush') as mock_flush:
+            profiler.end_request()
+            assert not mock_flush.called
+            profiler._flush_timer.cancel()
+            profiler._run_flush()
+        assert mock_flush.call_count == 1
+        assert profiler._flush_timer is None
+
+    def test_flush_merges_with_existing_output(self, profiler):
+        profiler.stacks['node-list']['a;b'] += 2
+        profiler.flush()
+        profiler.stacks['node-list']['a;b'] += 1
+        profiler.stacks['node-list']['a;c'] += 1
+        profiler.flush()
+
+        assert read_folded(profiler.get_path('node-list')) == {'a;b': 3, 'a;c': 1}
+        assert not profiler.stacks
+
+    def test_view_names_are_safe_filenames(self, profiler):
+        assert '/' not in profiler.get_path('../etc/passwd').replace(profiler.output_dir + '/', '')
+
+
+@pytest.mark.django_db
+class TestSamplingProfilerMiddleware:
+
+    @pytest.fixture()
+    def view(self):
+        def view(request):
+            return HttpResponse()
+        view.cls = type('ProfiledView', (object, ), {'view_name': 'profiled-view'})
+        return view
+
+    def get_response(self, view):
+        middleware = SamplingProfilerMiddleware()
+        request = APIRequestFactory().get('/v2/')
+        middleware.process_view(request, view, (), {})
+        return request, middleware.process_response(request, view(request))
+
+    @mock.patch('api.base.middleware.get_profiler')
+    def test_switch_off(self, mock_get_profiler, view, settings):
+        settings.SAMPLING_PROFILER_RATE = 1
+        with override_switch(SAMPLING_PROFILER, active=False):
+            self.get_response(view)
+        assert not mock_get_profiler.called
+
+    @mock.patch('api.base.middleware.get_profiler')
+    def test_sampled_request(self, mock_get_profiler, view, settings):
+        settings.SAMPLING_PROFILER_RATE = 0
+        settings.SAMPLING_PROFILER_RATES = {'profiled-view': 1}
+        with override_switch(SAMPLING_PROFILER, active=True):
+            request, _ = self.get_response(view)
+        mock_get_profiler.return_value.start_request.assert_called_once_with('profiled-view')
+        assert mock_get_profiler.return_value.end_request.call_count == 1
+        assert request._sampling_profiled is False
+
+    @mock.patch('api.base.middleware.get_profiler')
+    def test_unsampled_request(self, mock_get_profiler, view, settings):
+        settings.SAMPLING_PROFILER_RATE = 0
+        with override_switch(SAMPLING_PROFILER, active=True):
+            self.get_response(view)
+        assert not mock_get_profiler.called
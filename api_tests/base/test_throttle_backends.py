@@ -0,0 +1,61 @@
+import mock
+import pytest
+from django.core.cache import cache
+
+from api.base.throttling import COUNTER_BACKEND, TestUserRateThrottle
+
+
+class CounterThrottle(TestUserRateThrottle):
+
+    backend = COUNTER_BACKEND
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture()
+def request_for_user():
+    return mock.Mock(META={'REMOTE_ADDR': '127.0.0.1'}, user=mock.Mock(pk=1, is_authenticated=True))
+
+
+def make_throttle(now):
+    throttle = CounterThrottle()
+    throttle.timer = lambda: now
+    return throttle
+
+
+class TestCounterThrottle:
+
+    def test_allows_up_to_rate(self, request_for_user):
+        # test-user is 2/hour
+        assert make_throttle(1000).allow_request(request_for_user, None)
+        assert make_throttle(1001).allow_request(request_for_user, None)
+        throttle = make_throttle(1002)
+        assert not throttle.allow_request(request_for_user, None)
+        assert 0 < throttle.wait() <= 3600
+
+    def test_rejected_requests_are_not_counted(self, request_for_user):
+        for now in (1000, 1001, 1002, 1003):
+            make_throttle(now).allow_request(request_for_user, None)
+        throttle = make_throttle(1004)
+        assert not throttle.allow_request(request_for_user, None)
+        assert sum(throttle.bucket_counts) == 2
+
+    def test_window_slides(self, request_for_user):
+        assert make_throttle(1000).allow_request(request_for_user, None)
+        assert make_throttle(1001).allow_request(request_for_user, None)
+        assert not make_throttle(1002).allow_request(request_for_user, None)
+        # Once the buckets holding the first requests leave the hour-long window, requests are allowed again
+        assert make_throttle(1000 + 3600 + 360).allow_request(request_for_user, None)
+
+    def test_bypass_token(self, request_for_user):
+        request_for_user.META['HTTP_X_THROTTLE_TOKEN'] = 'test-token'
+        for now in range(5):
+            assert make_throttle(now).allow_request(request_for_user, None)
+
+    @mock.patch('api.base.settings.THROTTLE_BACKEND', COUNTER_BACKEND)
+    def test_backend_from_settings(self, request_for_user):
+        throttle = TestUserRateThrottle()
+        assert throttle.get_backend() == COUNTER_BACKEND
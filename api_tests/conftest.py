@@ -12,3 +12,10 @@ def app():
 @pytest.fixture(autouse=True, scope='session')
 def app_init():
     init_app(routes=False, set_backends=False)
+
+
+@pytest.fixture()
+def query_budget(settings):
+    """Record the queries made for API requests, failing those that go over their view's budget."""
+    settings.QUERY_BUDGET_ENABLED = True
+    settings.QUERY_BUDGET_RAISE = True
@@ -1,7 +1,11 @@
 import functools
+import json
+
+import mock
 import pytest
 
 from api.base.settings.defaults import API_BASE
+from api.nodes.views import NodeContributorsList
 from framework.auth.core import Auth
 from osf_tests.factories import (
     ProjectFactory,
@@ -155,3 +159,50 @@ class TestNodeEmbeds:
         res = app.get(url, auth=write_contrib_one.auth)
         assert res.status_code == 200
         assert res.json['data']['embeds']['contributors']['meta']['total_bibliographic'] == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.enable_quickfiles_creation
+class TestNodeListEmbedContributors:
+
+    @pytest.fixture()
+    def contrib(self):
+        return AuthUserFactory()
+
+    @pytest.fixture()
+    def nodes(self, user, contrib):
+        nodes = [ProjectFactory(creator=user, is_public=True) for _ in range(3)]
+        nodes[0].add_contributor(contrib, ['read', 'write'], auth=Auth(user), save=True)
+        nodes[2].add_contributor(contrib, ['read'], visible=False, auth=Auth(user), save=True)
+        return nodes
+
+    @pytest.fixture()
+    def url(self, nodes):
+        return '/{}nodes/?embed=contributors&filter[id]={}'.format(API_BASE, ','.join(node._id for node in nodes))
+
+    def test_contributors_are_batched(self, app, user, contrib, nodes, url):
+        with mock.patch('api.base.views.logger') as mock_logger:
+            res = app.get(url, auth=user.auth)
+        assert res.status_code == 200
+
+        embedded = {
+            node['id']: [contributor['id'] for contributor in node['embeds']['contributors']['data']]
+            for node in res.json['data']
+        }
+        assert embedded == {
+            nodes[0]._id: ['{}-{}'.format(nodes[0]._id, user._id), '{}-{}'.format(nodes[0]._id, contrib._id)],
+            nodes[1]._id: ['{}-{}'.format(nodes[1]._id, user._id)],
+            nodes[2]._id: ['{}-{}'.format(nodes[2]._id, user._id), '{}-{}'.format(nodes[2]._id, contrib._id)],
+        }
+
+        message = mock_logger.info.call_args[0][0]
+        stats = json.loads(message.split(': ', 1)[1])
+        assert stats['contributors']['batches'] == 1
+        assert stats['contributors']['batched'] == 3
+        assert stats['contributors']['views'] == 0
+
+    def test_batched_matches_per_item(self, app, user, nodes, url):
+        batched = app.get(url, auth=user.auth).json
+        with mock.patch.object(NodeContributorsList, 'embed_batch_key', None):
+            per_item = app.get(url, auth=user.auth).json
+        assert batched == per_item
@@ -13,6 +13,7 @@ from addons.github.tests.factories import GitHubAccountFactory
 from api.base.settings.defaults import API_BASE
 from api.base.utils import waterbutler_api_url_for
 from api_tests import utils as api_utils
+from osf.models import BaseFileNode
 from tests.base import ApiTestCase
 from osf_tests.factories import (
     ProjectFactory,
@@ -285,6 +286,29 @@ class TestNodeFilesList(ApiTestCase):
         assert_equal(res.json['data'][0]['attributes']['name'], 'NewFile')
         assert_equal(res.json['data'][0]['attributes']['provider'], 'github')
 
+    @responses.activate
+    def test_node_files_list_upserts_file_nodes(self):
+        files = [
+            {'name': 'one', 'path': '/one', 'materialized': '/one'},
+            {'name': 'two', 'path': '/two', 'materialized': '/two'},
+            {'name': 'sub', 'path': '/sub/', 'materialized': '/sub/', 'kind': 'folder'},
+        ]
+        self._prepare_mock_wb_response(provider='github', files=files)
+        self.add_github()
+        url = '/{}nodes/{}/files/github/'.format(API_BASE, self.project._id)
+
+        res = self.app.get(url, auth=self.user.auth)
+        ids = sorted(item['id'] for item in res.json['data'])
+        assert_equal(len(ids), 3)
+
+        files[0]['name'] = 'renamed'
+        responses.reset()
+        self._prepare_mock_wb_response(provider='github', files=files)
+        res = self.app.get(url, auth=self.user.auth)
+        assert_equal(sorted(item['id'] for item in res.json['data']), ids)
+        assert_in('renamed', [item['attributes']['name'] for item in res.json['data']])
+        assert_equal(BaseFileNode.objects.filter(provider='github', target_object_id=self.project.id).count(), 3)
+
     @responses.activate
     def test_returns_folder_metadata_not_children(self):
         folder = GithubFolder(
@@ -1,10 +1,13 @@
+import mock
 import pytest
 
 from django.utils import timezone
 from api.base.settings.defaults import API_BASE, MAX_PAGE_SIZE
+from api.nodes.views import NodeList
 from api_tests.nodes.filters.test_filters import NodesListFilteringMixin, NodesListDateFilteringMixin
+from api_tests.utils import get_query_count
 from framework.auth.core import Auth
-from osf.models import AbstractNode, Node, NodeLog
+from osf.models import AbstractNode, Node, NodeLog, NodeStorageUsage
 from osf.utils.sanitize import strip_html
 from osf.utils import permissions
 from osf_tests.factories import (
@@ -19,6 +22,7 @@ from osf_tests.factories import (
     RegionFactory
 )
 from addons.osfstorage.settings import DEFAULT_REGION_ID
+from addons.osfstorage.tests.factories import FileVersionFactory
 from rest_framework import exceptions
 from tests.utils import assert_items_equal
 from website.views import find_bookmark_collection
@@ -148,6 +152,44 @@ class TestNodeList:
         assert res.status_code == 200
         assert res.json['data'][0]['embeds']['region']['data']['id'] == DEFAULT_REGION_ID
 
+    def test_node_list_storage_usage_meta(self, app, user, url, public_project):
+        other_project = ProjectFactory(is_public=True, creator=user)
+        root = public_project.get_addon('osfstorage').get_root()
+        test_file = root.append_file('file')
+        test_file.versions.add(FileVersionFactory(size=100, region=public_project.osfstorage_region))
+        test_file.save()
+
+        res = app.get(url, auth=user.auth)
+        assert 'storage_usage' not in res.json['data'][0]['relationships']['files']['links']['related']['meta']
+
+        with mock.patch.object(NodeStorageUsage, 'get_totals', wraps=NodeStorageUsage.get_totals) as mock_get_totals:
+            res = app.get('{}?related_counts=files'.format(url), auth=user.auth)
+        assert res.status_code == 200
+        assert mock_get_totals.call_count == 1
+        usage = {
+            each['id']: each['relationships']['files']['links']['related']['meta']['storage_usage']
+            for each in res.json['data']
+        }
+        assert usage[public_project._id] == 100
+        assert usage[other_project._id] == 0
+
+
+@pytest.mark.django_db
+class TestNodeListQueryBudget:
+
+    @pytest.fixture()
+    def projects(self, user):
+        return [ProjectFactory(is_public=True, creator=user) for _ in range(10)]
+
+    def test_within_budget_at_two_page_sizes(self, app, user, projects, query_budget):
+        counts = {}
+        for page_size in (2, 10):
+            res = app.get('/{}nodes/?page[size]={}'.format(API_BASE, page_size), auth=user.auth)
+            assert len(res.json['data']) == page_size
+            counts[page_size] = get_query_count(res)
+            assert counts[page_size] <= NodeList.query_budget + NodeList.query_budget_per_result * page_size
+        assert counts[10] - counts[2] <= NodeList.query_budget_per_result * 8
+
 
 @pytest.mark.django_db
 @pytest.mark.enable_quickfiles_creation
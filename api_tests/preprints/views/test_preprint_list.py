@@ -8,6 +8,7 @@ from waffle.testutils import override_switch
 
 from addons.github.models import GithubFile
 from api.base.settings.defaults import API_BASE
+from api.citations.utils import render_citation, render_citations
 from api_tests import utils as test_utils
 from api_tests.preprints.filters.test_filters import PreprintsListFilteringMixin
 from api_tests.preprints.views.test_preprint_list_mixin import (
@@ -234,6 +235,24 @@ class TestPreprintList(ApiTestCase):
         assert_in(self.preprint._id, ids)
         assert_not_in(self.project._id, ids)
 
+    def test_citations_in_meta(self):
+        other_preprint = PreprintFactory(creator=self.user)
+        res = self.app.get(self.url)
+        assert_not_in('citation', res.json['data'][0].get('meta', {}))
+
+        with mock.patch('api.preprints.serializers.render_citations', wraps=render_citations) as mock_render:
+            res = self.app.get(self.url + '?citation=apa')
+        assert_equal(res.status_code, 200)
+        assert_equal(mock_render.call_count, 1)
+        citations = {each['id']: each['meta']['citation'] for each in res.json['data']}
+        assert_equal(citations, {
+            self.preprint._id: render_citation(self.preprint, 'apa'),
+            other_preprint._id: render_citation(other_preprint, 'apa'),
+        })
+
+        res = self.app.get(self.url + '?citation=not-a-style', expect_errors=True)
+        assert_equal(res.status_code, 400)
+
     def test_withdrawn_preprints_list(self):
         pp = PreprintFactory(provider__reviews_workflow='pre-moderation', is_published=False, creator=self.user)
         pp.machine_state = 'pending'
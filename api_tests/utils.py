@@ -58,6 +58,10 @@ def disconnected_from_listeners(signal):
     for listener in listeners:
         signal.connect(listener)
 
+def get_query_count(res):
+    """Return the number of queries made for ``res``, recorded when the query_budget fixture is used."""
+    return int(res.headers['X-Query-Count'])
+
 def only_supports_methods(view, expected_methods):
     if isinstance(view.__class__, type):
         view = view()
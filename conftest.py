@@ -73,10 +73,6 @@ _MOCKS = {
         'mark': 'enable_implicit_clean',
         'replacement': lambda *args, **kwargs: None,
     },
-    'osf.models.base._check_blacklist': {
-        'mark': 'enable_blacklist_check',
-        'replacement': lambda *args, **kwargs: False,
-    },
     'website.search.search.search_engine': {
         'mark': 'enable_search',
         'replacement': mock.MagicMock()
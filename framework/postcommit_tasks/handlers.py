@@ -1,13 +1,14 @@
 # -*- coding: utf-8 -*-
 import functools
-import hashlib
 import logging
 import threading
+import time
 
 import binascii
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 import os
 
+import gevent
 from celery.canvas import Signature
 from celery.local import PromiseProxy
 from gevent.pool import Pool
@@ -18,6 +19,95 @@ from website import settings
 _local = threading.local()
 logger = logging.getLogger(__name__)
 
+# One bounded pool per gevent hub (i.e. per OS thread), shared by all requests on that hub
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_postcommit_pool():
+    hub = gevent.get_hub()
+    with _pools_lock:
+        pool = _pools.get(hub)
+        if pool is None:
+            # one db connection per greenlet, let's share
+            pool = _pools[hub] = Pool(settings.POSTCOMMIT_POOL_SIZE)
+        return pool
+
+
+class PostcommitStats(object):
+    """Process-wide timing counters for non-celery postcommit tasks, keyed by function name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.tasks = defaultdict(lambda: {'count': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            self.overflows = 0
+            self.timeouts = 0
+
+    def record(self, name, elapsed, error=False):
+        with self._lock:
+            task = self.tasks[name]
+            task['count'] += 1
+            task['errors'] += int(error)
+            task['total_seconds'] += elapsed
+            task['max_seconds'] = max(task['max_seconds'], elapsed)
+
+    def record_overflow(self):
+        with self._lock:
+            self.overflows += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'overflows': self.overflows,
+                'timeouts': self.timeouts,
+                'tasks': {
+                    name: dict(task, mean_seconds=task['total_seconds'] / task['count'] if task['count'] else 0.0)
+                    for name, task in self.tasks.items()
+                },
+            }
+
+postcommit_stats = PostcommitStats()
+
+
+def get_task_name(func):
+    func = getattr(func, 'func', func)  # unwrap functools.partial
+    return '{}.{}'.format(getattr(func, '__module__', None), getattr(func, '__name__', repr(func)))
+
+
+def timed(func):
+    name = get_task_name(func)
+
+    def wrapped():
+        start = time.time()
+        error = True
+        try:
+            result = func()
+            error = False
+            return result
+        finally:
+            postcommit_stats.record(name, time.time() - start, error=error)
+    return wrapped
+
+
+def make_task_key(fn, args, kwargs):
+    """Build a dedupe key for a postcommit task without hashing its repr.
+    Falls back to repr for unhashable arguments (e.g. lists or dicts).
+    """
+    key = (fn.__module__, fn.__name__, args, tuple(sorted(kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        key = (fn.__module__, fn.__name__, repr(args), repr(sorted(kwargs.items())))
+    return key
+
 def postcommit_queue():
     if not hasattr(_local, 'postcommit_queue'):
         _local.postcommit_queue = OrderedDict()
@@ -39,11 +129,20 @@ def postcommit_after_request(response, base_status_error_code=500):
         return response
     try:
         if postcommit_queue():
-            number_of_threads = 30  # one db connection per greenlet, let's share
-            pool = Pool(number_of_threads)
+            pool = get_postcommit_pool()
+            greenlets = []
             for func in postcommit_queue().values():
-                pool.spawn(func)
-            pool.join(timeout=5.0, raise_error=True)  # 5 second timeout and reraise exceptions
+                if pool.full():
+                    # spawn blocks until a slot frees up
+                    postcommit_stats.record_overflow()
+                greenlets.append(pool.spawn(timed(func)))
+            if not settings.POSTCOMMIT_FIRE_AND_FORGET:
+                finished = gevent.joinall(greenlets, timeout=settings.POSTCOMMIT_TIMEOUT, raise_error=True)
+                if len(finished) < len(greenlets):
+                    postcommit_stats.record_timeout()
+                    logger.warning('{} postcommit tasks did not finish within {}s'.format(
+                        len(greenlets) - len(finished), settings.POSTCOMMIT_TIMEOUT
+                    ))
 
         if postcommit_celery_queue():
             if settings.USE_CELERY:
@@ -76,15 +175,11 @@ def enqueue_postcommit_task(fn, args, kwargs, celery=False, once_per_request=Tru
         # For testing purposes only: run fn directly
         fn(*args, **kwargs)
     else:
-        # make a hash of the pertinent data
-        raw = [fn.__name__, fn.__module__, args, kwargs]
-        m = hashlib.md5()
-        m.update('-'.join([x.__repr__() for x in raw]))
-        key = m.hexdigest()
+        key = make_task_key(fn, args, kwargs)
 
         if not once_per_request:
             # we want to run it once for every occurrence, add a random string
-            key = '{}:{}'.format(key, binascii.hexlify(os.urandom(8)))
+            key += (binascii.hexlify(os.urandom(8)), )
 
         if celery and isinstance(fn, PromiseProxy):
             postcommit_celery_queue().update({key: fn.si(*args, **kwargs)})
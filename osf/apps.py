@@ -16,3 +16,5 @@ class AppConfig(BaseAppConfig):
             update_permission_groups,
             dispatch_uid='osf.apps.update_permissions_groups'
         )
+        from osf.models.storage_usage import connect_storage_usage_receivers
+        connect_storage_usage_receivers()
@@ -1,9 +1,15 @@
+from multiprocessing.pool import ThreadPool
+
 from framework.celery_tasks import app as celery_app
+from framework.celery_tasks.handlers import enqueue_task, get_task_from_queue
 from django.apps import apps
+from django.db import transaction
 from django.utils import timezone
 
 from website import settings
 from osf.external.chronos import ChronosClient
+from osf.models import spam
+from osf.utils.akismet import AkismetClientError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,3 +23,72 @@ def update_submissions_status_async(ids):
         submission = ChronosSubmission.load(submission_id)
         if submission.modified < timezone.now() - settings.CHRONOS_SUBMISSION_UPDATE_TIME:
             client.sync_manuscript(submission)
+
+
+def enqueue_spam_check(resource, user, content, request_headers):
+    """Check ``resource`` for spam after the request, together with the other checks of the request."""
+    check = {
+        'guid': resource._id,
+        'user_id': user._id,
+        'author': user.fullname,
+        'author_email': user.username,
+        'content': content,
+        'request_headers': request_headers,
+    }
+    task = get_task_from_queue('osf.external.tasks.check_spam_async', predicate=lambda task: True)
+    if task:
+        task.kwargs['checks'] = [queued for queued in task.kwargs['checks'] if queued['guid'] != check['guid']] + [check]
+    else:
+        enqueue_task(check_spam_async.s(checks=[check]))
+
+
+def _run_spam_check(client, check):
+    try:
+        return spam.check_content(client, check['author'], check['author_email'], check['content'], check['request_headers'])
+    except AkismetClientError:
+        logger.exception('Error performing SPAM check of {}'.format(check['guid']))
+        return None
+
+
+def apply_spam_check(check, is_spam, pro_tip):
+    """Record the result of a spam check on its node or preprint, unless it was reviewed or flagged
+    while the check was running, and suspend its author if it is spam.
+    """
+    Guid = apps.get_model('osf.Guid')
+    OSFUser = apps.get_model('osf.OSFUser')
+    guid = Guid.load(check['guid'])
+    if not guid or not guid.referent:
+        return
+    with transaction.atomic():
+        resource = type(guid.referent).objects.filter(id=guid.object_id).select_for_update().get()
+        if resource.spam_status == spam.SpamStatus.HAM or resource.is_spammy:
+            return
+        resource.record_spam_check(is_spam, pro_tip, check['author'], check['author_email'], check['content'], check['request_headers'])
+        logger.info("{} ({}) '{}' smells like {} (tip: {})".format(
+            resource.__class__.__name__, resource._id, resource.title.encode('utf-8'), 'SPAM' if is_spam else 'HAM', pro_tip
+        ))
+        if is_spam:
+            user = OSFUser.load(check['user_id'])
+            if user and user.spam_status != spam.SpamStatus.HAM:
+                resource._check_spam_user(user)
+        resource.save()
+
+
+@celery_app.task(ignore_results=True)
+def check_spam_async(checks):
+    """Run the spam checks queued by SpamOverrideMixin.check_spam during a request.
+
+    The checks are sent to Akismet concurrently, up to AKISMET_MAX_CONCURRENT_REQUESTS at a time
+    over the shared client's connections, and each result is applied in its own transaction.
+    """
+    client = spam._get_client()
+    pool = ThreadPool(min(len(checks), settings.AKISMET_MAX_CONCURRENT_REQUESTS))
+    try:
+        results = pool.map(lambda check: _run_spam_check(client, check), checks)
+    finally:
+        pool.close()
+        pool.join()
+    for check, result in zip(checks, results):
+        if result is not None:
+            apply_spam_check(check, *result)
+
@@ -3,6 +3,8 @@ ELASTICSEARCH_METRICS = 'elasticsearch_metrics'
 STORAGE_USAGE = 'storage_usage'
 ENABLE_INACTIVE_SCHEMAS = 'enable_inactive_schemas'
 ENFORCE_CSRF = 'enforce_csrf'
+SAMPLING_PROFILER = 'sampling_profiler'
+NODE_LOG_FEED = 'node_log_feed'
 INSTITUTIONAL_LANDING_FLAG = 'institutions_nav_bar'
 STORAGE_I18N = 'storage_i18n'
 OSF_PREREGISTRATION = 'osf_preregistration'
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Create the FileVersionSummary of every OsfStorage file that doesn't have one yet.
+
+Folder listings fill in missing summaries lazily, so this only saves that work on first access.
+
+    python manage.py backfill_file_version_summaries --batch-size 5000
+"""
+from __future__ import unicode_literals
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from addons.osfstorage.models import OsfStorageFile
+from osf.models import FileVersionSummary
+
+logger = logging.getLogger(__name__)
+
+
+def iter_file_id_batches(batch_size):
+    queryset = OsfStorageFile.objects.filter(version_summary__isnull=True)
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def backfill_file_version_summaries(batch_size):
+    created = 0
+    for file_ids in iter_file_id_batches(batch_size):
+        with transaction.atomic():
+            created += FileVersionSummary.refresh(file_ids=file_ids)
+        logger.info('Summarized {} files, up to id {}'.format(created, file_ids[-1]))
+    return created
+
+
+class Command(BaseCommand):
+    """Backfill the version summaries used by osfstorage folder listings."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--batch-size', type=int, default=1000, help='Files summarized per query')
+
+    def handle(self, *args, **options):
+        created = backfill_file_version_summaries(options['batch_size'])
+        logger.info('{} file version summaries created'.format(created))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Add existing logs to the aggregate log feeds of their nodes and those nodes' ancestors.
+
+Logs written after migration 0169 are added as they are saved. Turn on the node_log_feed switch
+once this has run.
+
+    python manage.py backfill_node_log_feed --batch-size 10000
+"""
+from __future__ import unicode_literals
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from osf.models import NodeLog, NodeLogFeedEntry
+
+logger = logging.getLogger(__name__)
+
+
+def iter_log_id_batches(batch_size, start_id=0):
+    last_id = start_id
+    while True:
+        ids = list(NodeLog.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def backfill_node_log_feed(batch_size, start_id=0):
+    backfilled = 0
+    for log_ids in iter_log_id_batches(batch_size, start_id=start_id):
+        with transaction.atomic():
+            NodeLogFeedEntry.add_logs(log_ids)
+        backfilled += len(log_ids)
+        logger.info('Added {} logs to feeds, up to id {}'.format(backfilled, log_ids[-1]))
+    return backfilled
+
+
+class Command(BaseCommand):
+    """Backfill NodeLogFeedEntry from existing logs."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--batch-size', type=int, default=10000, help='Logs added per query')
+        parser.add_argument('--start-id', type=int, default=0, help='Resume after this log id')
+
+    def handle(self, *args, **options):
+        backfilled = backfill_node_log_feed(options['batch_size'], start_id=options['start_id'])
+        logger.info('{} logs added to feeds'.format(backfilled))
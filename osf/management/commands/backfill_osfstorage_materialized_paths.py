@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Populate, or check, the stored materialized paths of live OsfStorage files and folders.
+
+    python manage.py backfill_osfstorage_materialized_paths
+    python manage.py backfill_osfstorage_materialized_paths --check
+"""
+from __future__ import unicode_literals
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from addons.osfstorage.models import OsfStorageFileNode, OsfStorageFolder
+
+logger = logging.getLogger(__name__)
+
+# Paths computed from the root folders down; roots are '/', folders end with a slash
+EXPECTED_PATHS_CTE = """
+    WITH RECURSIVE expected(id, path) AS (
+      SELECT T.id, '/' :: TEXT FROM "{table}" AS T WHERE T.id = ANY(%(root_ids)s)
+      UNION ALL
+      SELECT T.id, E.path || T.name || CASE WHEN T.type = %(folder_type)s THEN '/' ELSE '' END
+      FROM expected AS E
+        JOIN "{table}" AS T ON T.parent_id = E.id
+      WHERE T.type = ANY(%(types)s)
+    )
+"""
+
+CHECK_SQL = EXPECTED_PATHS_CTE + """
+    SELECT T.id, T._materialized_path, E.path
+    FROM expected AS E
+      JOIN "{table}" AS T ON T.id = E.id
+    WHERE T._materialized_path IS DISTINCT FROM E.path
+    ORDER BY T.id;
+"""
+
+FIX_SQL = EXPECTED_PATHS_CTE + """
+    UPDATE "{table}" AS T
+    SET _materialized_path = E.path
+    FROM expected AS E
+    WHERE T.id = E.id AND T._materialized_path IS DISTINCT FROM E.path;
+"""
+
+
+def iter_root_id_batches(batch_size):
+    queryset = OsfStorageFolder.objects.filter(is_root=True)
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def get_params(root_ids):
+    return {
+        'root_ids': list(root_ids),
+        'folder_type': OsfStorageFolder._typedmodels_type,
+        'types': list(OsfStorageFileNode._typedmodels_subtypes),
+    }
+
+
+def check_materialized_paths(root_ids):
+    """Return [(file node id, stored path, expected path)] for every mismatch under ``root_ids``."""
+    with connection.cursor() as cursor:
+        cursor.execute(CHECK_SQL.format(table=OsfStorageFileNode._meta.db_table), get_params(root_ids))
+        return cursor.fetchall()
+
+
+def fix_materialized_paths(root_ids):
+    with connection.cursor() as cursor:
+        cursor.execute(FIX_SQL.format(table=OsfStorageFileNode._meta.db_table), get_params(root_ids))
+        return cursor.rowcount
+
+
+def backfill_materialized_paths(batch_size, check=False):
+    total = 0
+    for root_ids in iter_root_id_batches(batch_size):
+        if check:
+            mismatches = check_materialized_paths(root_ids)
+            for file_id, stored, expected in mismatches:
+                logger.warning('Materialized path mismatch for file node {}: stored={!r} expected={!r}'.format(file_id, stored, expected))
+            total += len(mismatches)
+        else:
+            with transaction.atomic():
+                total += fix_materialized_paths(root_ids)
+    return total
+
+
+class Command(BaseCommand):
+    """Backfill OsfStorage materialized paths, or report nodes whose stored path is wrong."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--check', action='store_true', dest='check', help='Only report mismatched paths')
+        parser.add_argument('--batch-size', type=int, default=500, help='Root folders processed per query')
+
+    def handle(self, *args, **options):
+        count = backfill_materialized_paths(options['batch_size'], check=options['check'])
+        logger.info('{} materialized paths {}'.format(count, 'mismatched' if options['check'] else 'updated'))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Time trashing and restoring a large OsfStorage folder.
+
+Builds a throwaway folder of ``--files`` files (``--files-per-folder`` to a subfolder) in the
+OsfStorage root of the given node, trashes and restores it, reports the time and number of
+queries each step took and rolls everything back.
+
+    python manage.py benchmark_folder_trash --guid abc12 --files 50000
+"""
+from __future__ import unicode_literals
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from addons.osfstorage.models import OsfStorageFile, OsfStorageFolder
+from osf.models import AbstractNode
+
+logger = logging.getLogger(__name__)
+
+
+def build_tree(parent, files, files_per_folder):
+    """Create ``files`` files under a new folder in ``parent`` with bulk inserts; return the folder."""
+    top = parent.append_folder('benchmark-{}'.format(int(time.time())))
+    folder_count = (files + files_per_folder - 1) // files_per_folder
+    folders = OsfStorageFolder.objects.bulk_create([
+        OsfStorageFolder(
+            name='folder{}'.format(i), target=top.target, parent=top, provider='osfstorage',
+            _path='', _materialized_path='{}folder{}/'.format(top.materialized_path, i),
+        ) for i in range(folder_count)
+    ])
+    for folder_index, folder in enumerate(folders):
+        first = folder_index * files_per_folder
+        OsfStorageFile.objects.bulk_create([
+            OsfStorageFile(
+                name='file{}'.format(i), target=top.target, parent=folder, provider='osfstorage',
+                _path='', _materialized_path='{}file{}'.format(folder._materialized_path, i),
+            ) for i in range(first, min(first + files_per_folder, files))
+        ])
+    return top
+
+
+def timed(label, func):
+    with CaptureQueriesContext(connection) as queries:
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+    logger.info('{}: {:.2f}s, {} queries'.format(label, elapsed, len(queries)))
+    return result
+
+
+class Command(BaseCommand):
+    """Benchmark set-based folder trash and restore. Nothing is committed."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--guid', type=str, required=True, help='Node to build the folder in')
+        parser.add_argument('--files', type=int, default=50000, help='Number of files in the folder')
+        parser.add_argument('--files-per-folder', type=int, default=500, help='Files per subfolder')
+
+    def handle(self, *args, **options):
+        node = AbstractNode.load(options['guid'])
+        with transaction.atomic():
+            root = node.get_addon('osfstorage').get_root()
+            top = timed('build', lambda: build_tree(root, options['files'], options['files_per_folder']))
+            trashed = timed('trash', lambda: top.delete(user=node.creator))
+            timed('restore', lambda: trashed.restore())
+            transaction.set_rollback(True)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Compare query plans for the first page of a project's aggregate logs.
+
+Seeds a project with components, each with logs, inside a transaction, then prints EXPLAIN ANALYZE
+output for the legacy query (readable component ids materialized into ``node_id IN (...)`` and
+sorted by date) and for the NodeLogFeedEntry query, for a contributor on every component and for
+an anonymous user who can only read the public ones. The transaction is rolled back afterwards
+unless ``--keep`` is passed.
+
+    python manage.py benchmark_node_log_feed --components 500 --logs 200
+"""
+from __future__ import unicode_literals
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from framework.auth import Auth
+from osf.models import Contributor, Node, NodeLog, NodeLogFeedEntry, NodeRelation, NodeTreeClosure
+from osf_tests.factories import AuthUserFactory
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(user, components, logs, public_ratio):
+    """Create a project with ``components`` direct children and ``logs`` logs on every node.
+    ``user`` is an admin contributor on all of them.
+    """
+    public_every = int(1 / public_ratio) if public_ratio else 0
+    root = Node.objects.bulk_create([Node(title='Benchmark project', creator=user, is_public=True)])[0]
+    children = Node.objects.bulk_create([
+        Node(title='Benchmark component {}'.format(i), creator=user, root=root, is_public=bool(public_every and i % public_every == 0))
+        for i in range(components)
+    ], batch_size=BATCH_SIZE)
+    nodes = [root] + children
+    Node.objects.filter(id=root.id).update(root=root)
+    NodeRelation.objects.bulk_create([
+        NodeRelation(parent=root, child=child, is_node_link=False, _order=i)
+        for i, child in enumerate(children)
+    ], batch_size=BATCH_SIZE)
+    NodeTreeClosure.rebuild()
+    Contributor.objects.bulk_create([
+        Contributor(node=node, user=user, read=True, write=True, admin=True, visible=True)
+        for node in nodes
+    ], batch_size=BATCH_SIZE)
+
+    log_ids = []
+    for node in nodes:
+        created = NodeLog.objects.bulk_create([
+            NodeLog(action=NodeLog.FILE_ADDED, node=node, user=user, original_node=node, params={})
+            for _ in range(logs)
+        ], batch_size=BATCH_SIZE)
+        log_ids.extend(log.id for log in created)
+    for offset in range(0, len(log_ids), BATCH_SIZE):
+        NodeLogFeedEntry.add_logs(log_ids[offset:offset + BATCH_SIZE])
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE osf_abstractnode; ANALYZE osf_nodelog; ANALYZE osf_nodelogfeedentry; ANALYZE osf_nodetreeclosure;')
+    return Node.objects.get(id=root.id), len(log_ids)
+
+
+def explain(label, queryset, page_size):
+    start = time.time()
+    sql, params = queryset[:page_size].query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+        plan = [row[0] for row in cursor.fetchall()]
+    elapsed = time.time() - start
+    logger.info('=== {} ({:.1f}ms wall) ==='.format(label, elapsed * 1000))
+    for line in plan:
+        logger.info(line)
+
+
+class Command(BaseCommand):
+    """Benchmark legacy vs. feed-based aggregate log queries on a seeded project."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--components', type=int, default=500, help='Number of components to seed')
+        parser.add_argument('--logs', type=int, default=200, help='Logs per node')
+        parser.add_argument('--public-ratio', type=float, default=0.5, help='Fraction of seeded components that are public')
+        parser.add_argument('--page-size', type=int, default=10, help='Logs per page')
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            dest='keep',
+            help='Commit the seeded data instead of rolling it back'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = AuthUserFactory()
+                start = time.time()
+                root, total = seed(user, options['components'], options['logs'], options['public_ratio'])
+                logger.info('Seeded {} components and {} logs in {:.1f}s'.format(options['components'], total, time.time() - start))
+
+                for label, auth in (('contributor', Auth(user)), ('anonymous', Auth())):
+                    # Building the legacy query resolves the readable ids in Python, which is part of its cost
+                    legacy = NodeLog.objects.filter(root.get_aggregate_logs_query(auth)).order_by('-date')
+                    explain('legacy {}'.format(label), legacy, options['page_size'])
+                    explain('feed {}'.format(label), root.get_aggregate_logs_feed_queryset(auth), options['page_size'])
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            logger.info('Rolled back seeded data')
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Compare query plans for node list permission filtering.
+
+Seeds a synthetic project forest inside a transaction, then prints EXPLAIN ANALYZE output for
+the legacy ``can_view`` filter (Exists subquery OR'd with a recursive implicit-admin CTE) and
+the set-based filter from ``osf.utils.node_permissions``. The transaction is rolled back
+afterwards unless ``--keep`` is passed.
+
+    python manage.py benchmark_node_permissions --nodes 100000 --branching 5
+"""
+from __future__ import unicode_literals
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+
+from osf.models import AbstractNode, Contributor, Node, NodeRelation, NodeTreeClosure
+from osf.utils.node_permissions import get_readable_node_ids
+from osf_tests.factories import AuthUserFactory
+
+logger = logging.getLogger(__name__)
+
+LEGACY_IMPLICIT_READ = """
+    "osf_abstractnode".id in (
+        WITH RECURSIVE implicit_read AS (
+            SELECT "osf_contributor"."node_id"
+            FROM "osf_contributor"
+            WHERE "osf_contributor"."user_id" = %s
+            AND "osf_contributor"."admin" is TRUE
+        UNION ALL
+            SELECT "osf_noderelation"."child_id"
+            FROM "implicit_read"
+            LEFT JOIN "osf_noderelation" ON "osf_noderelation"."parent_id" = "implicit_read"."node_id"
+            WHERE "osf_noderelation"."is_node_link" IS FALSE
+        ) SELECT * FROM implicit_read
+    )
+"""
+
+BATCH_SIZE = 5000
+
+
+class Rollback(Exception):
+    pass
+
+
+def legacy_can_view(user_id):
+    qs = AbstractNode.objects.filter(is_public=True)
+    sqs = Contributor.objects.filter(node=OuterRef('pk'), user__id=user_id, read=True)
+    qs |= AbstractNode.objects.annotate(can_view=Exists(sqs)).filter(can_view=True)
+    qs |= AbstractNode.objects.extra(where=[LEGACY_IMPLICIT_READ], params=(user_id, ))
+    return qs
+
+
+def set_based_can_view(user_id):
+    return AbstractNode.objects.filter(Q(is_public=True) | Q(id__in=get_readable_node_ids(user_id)))
+
+
+def seed(user, total, branching, public_ratio):
+    """Create ``total`` nodes as a forest where every node has ``branching`` children.
+    ``user`` is an admin on every root, so it is an implicit admin on the whole forest.
+    """
+    creator = AuthUserFactory()
+    node_ids = []
+    public_every = int(1 / public_ratio) if public_ratio else 0
+    for offset in range(0, total, BATCH_SIZE):
+        batch = [
+            Node(title='Benchmark node {}'.format(i), creator=creator, is_public=bool(public_every and i % public_every == 0))
+            for i in range(offset, min(offset + BATCH_SIZE, total))
+        ]
+        node_ids.extend(node.id for node in Node.objects.bulk_create(batch))
+
+    # Lay the nodes out as complete trees four levels deep
+    tree_size = sum(branching ** level for level in range(4))
+    relations = []
+    roots = []
+    for index, node_id in enumerate(node_ids):
+        position = index % tree_size
+        if position == 0:
+            roots.append(node_id)
+            continue
+        parent_id = node_ids[index - position + (position - 1) // branching]
+        relations.append(NodeRelation(parent_id=parent_id, child_id=node_id, is_node_link=False, _order=0))
+    NodeRelation.objects.bulk_create(relations, batch_size=BATCH_SIZE)
+    NodeTreeClosure.rebuild()
+
+    Contributor.objects.bulk_create([
+        Contributor(node_id=node_id, user=user, read=True, write=True, admin=True, visible=True)
+        for node_id in roots
+    ], batch_size=BATCH_SIZE)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE osf_abstractnode; ANALYZE osf_contributor; ANALYZE osf_noderelation; ANALYZE osf_nodetreeclosure;')
+    return len(roots)
+
+
+def explain(label, qs):
+    sql, params = qs.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        start = time.time()
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+        plan = [row[0] for row in cursor.fetchall()]
+        elapsed = time.time() - start
+    logger.info('=== {} ({:.1f}ms wall) ==='.format(label, elapsed * 1000))
+    for line in plan:
+        logger.info(line)
+
+
+class Command(BaseCommand):
+    """Benchmark legacy vs. set-based node permission filtering on a seeded dataset."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--nodes', type=int, default=100000, help='Number of nodes to seed')
+        parser.add_argument('--branching', type=int, default=5, help='Children per node in the seeded trees')
+        parser.add_argument('--public-ratio', type=float, default=0.1, help='Fraction of seeded nodes that are public')
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            dest='keep',
+            help='Commit the seeded data instead of rolling it back'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = AuthUserFactory()
+                start = time.time()
+                roots = seed(user, options['nodes'], options['branching'], options['public_ratio'])
+                logger.info('Seeded {} nodes ({} roots) in {:.1f}s'.format(options['nodes'], roots, time.time() - start))
+
+                explain('legacy can_view', legacy_can_view(user.id))
+                start = time.time()
+                readable = get_readable_node_ids(user.id)
+                logger.info('Resolved {} readable node ids in {:.1f}ms'.format(len(readable), (time.time() - start) * 1000))
+                explain('set-based can_view', set_based_can_view(user.id))
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            logger.info('Rolled back seeded data')
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Compare the query plans of the folder listing served by osfstorage_get_children before and
+after FileVersionSummary, on a real folder.
+
+Runs EXPLAIN ANALYZE for the previous per-child LATERAL query and for GET_CHILDREN_SQL and logs
+both plans along with their execution times. Nothing is written: summaries created for the folder
+while running are rolled back.
+
+    python manage.py benchmark_osfstorage_children --folder 5c8a1d2e3f4a5b6c7d8e9f00 --user abc12
+"""
+from __future__ import unicode_literals
+import logging
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from addons.osfstorage.models import OsfStorageFolder
+from addons.osfstorage.views import GET_CHILDREN_SQL
+from osf.models import FileVersionSummary, OSFUser
+
+logger = logging.getLogger(__name__)
+
+# The query osfstorage_get_children ran before FileVersionSummary, kept here for comparison
+LATERAL_GET_CHILDREN_SQL = """
+    SELECT json_agg(CASE
+        WHEN F.type = 'osf.osfstoragefile' THEN
+            json_build_object(
+                'id', F._id
+                , 'path', '/' || F._id
+                , 'name', F.name
+                , 'kind', 'file'
+                , 'size', LATEST_VERSION.size
+                , 'downloads',  COALESCE(DOWNLOAD_COUNT, 0)
+                , 'version', (SELECT COUNT(*) FROM osf_basefilenode_versions WHERE osf_basefilenode_versions.basefilenode_id = F.id)
+                , 'contentType', LATEST_VERSION.content_type
+                , 'modified', LATEST_VERSION.created
+                , 'created', EARLIEST_VERSION.created
+                , 'checkout', CHECKOUT_GUID
+                , 'md5', LATEST_VERSION.metadata ->> 'md5'
+                , 'sha256', LATEST_VERSION.metadata ->> 'sha256'
+                , 'latestVersionSeen', SEEN_LATEST_VERSION.case
+            )
+        ELSE
+            json_build_object(
+                'id', F._id
+                , 'path', '/' || F._id || '/'
+                , 'name', F.name
+                , 'kind', 'folder'
+            )
+        END
+    )
+    FROM osf_basefilenode AS F
+    LEFT JOIN LATERAL (
+        SELECT * FROM osf_fileversion
+        JOIN osf_basefilenode_versions ON osf_fileversion.id = osf_basefilenode_versions.fileversion_id
+        WHERE osf_basefilenode_versions.basefilenode_id = F.id
+        ORDER BY created DESC
+        LIMIT 1
+    ) LATEST_VERSION ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT * FROM osf_fileversion
+        JOIN osf_basefilenode_versions ON osf_fileversion.id = osf_basefilenode_versions.fileversion_id
+        WHERE osf_basefilenode_versions.basefilenode_id = F.id
+        ORDER BY created ASC
+        LIMIT 1
+    ) EARLIEST_VERSION ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT _id from osf_guid
+        WHERE object_id = F.checkout_id
+        AND content_type_id = %(user_content_type_id)s
+        LIMIT 1
+    ) CHECKOUT_GUID ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT P.total AS DOWNLOAD_COUNT FROM osf_pagecounter AS P
+        WHERE P._id = 'download:' || %(target_id)s || ':' || F._id
+        LIMIT 1
+    ) DOWNLOAD_COUNT ON TRUE
+    LEFT JOIN LATERAL (
+      SELECT EXISTS(
+        SELECT (1) FROM osf_fileversionusermetadata
+          INNER JOIN osf_fileversion ON osf_fileversionusermetadata.file_version_id = osf_fileversion.id
+          INNER JOIN osf_basefilenode_versions ON osf_fileversion.id = osf_basefilenode_versions.fileversion_id
+          WHERE osf_fileversionusermetadata.user_id = %(user_pk)s
+          AND osf_basefilenode_versions.basefilenode_id = F.id
+        LIMIT 1
+      )
+    ) SEEN_FILE ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT CASE WHEN SEEN_FILE.exists
+        THEN
+            CASE WHEN EXISTS(
+              SELECT (1) FROM osf_fileversionusermetadata
+              WHERE osf_fileversionusermetadata.file_version_id = LATEST_VERSION.fileversion_id
+              AND osf_fileversionusermetadata.user_id = %(user_pk)s
+              LIMIT 1
+            )
+            THEN
+              json_build_object('user', %(user_id)s, 'seen', TRUE)
+            ELSE
+              json_build_object('user', %(user_id)s, 'seen', FALSE)
+            END
+        ELSE
+          NULL
+        END
+    ) SEEN_LATEST_VERSION ON TRUE
+    WHERE parent_id = %(parent_id)s
+    AND (NOT F.type IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder'))
+"""
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0][0]
+    return plan
+
+
+def format_plan(node, depth=0):
+    lines = ['{}{} (rows={}, loops={}, time={:.2f}ms)'.format(
+        '  ' * depth, node['Node Type'], node.get('Actual Rows'), node.get('Actual Loops'), node.get('Actual Total Time', 0)
+    )]
+    for child in node.get('Plans', []):
+        lines.extend(format_plan(child, depth + 1))
+    return lines
+
+
+def benchmark(folder_id, user_id=None):
+    folder = OsfStorageFolder.objects.get(_id=folder_id)
+    params = {
+        'user_content_type_id': ContentType.objects.get_for_model(OSFUser).id,
+        'target_id': folder.target._id,
+        'user_pk': OSFUser.objects.filter(guids___id=user_id).values_list('pk', flat=True).first() if user_id else None,
+        'user_id': user_id,
+        'parent_id': folder.id,
+    }
+    with transaction.atomic():
+        FileVersionSummary.refresh(parent_id=folder.id)
+        for name, sql in (('lateral', LATERAL_GET_CHILDREN_SQL), ('summary', GET_CHILDREN_SQL)):
+            plan = explain(sql, params)
+            logger.info('{}: planning {:.2f}ms, execution {:.2f}ms\n{}'.format(
+                name, plan['Planning Time'], plan['Execution Time'], '\n'.join(format_plan(plan['Plan']))
+            ))
+        transaction.set_rollback(True)
+
+
+class Command(BaseCommand):
+    """Explain the old and new osfstorage_get_children queries for a folder."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--folder', type=str, required=True, help='_id of the OsfStorage folder to list')
+        parser.add_argument('--user', type=str, default=None, help='Guid of the user listing the folder')
+
+    def handle(self, *args, **options):
+        benchmark(options['folder'], user_id=options['user'])
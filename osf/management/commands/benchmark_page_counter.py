@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Load test PageCounter updates on a single hot page.
+
+Several threads record hits on the same counter, as concurrent downloads of a popular file do,
+using each strategy in turn, and the throughput and the final count are reported:
+
+- ``locked``: the previous read-modify-write of the row under ``select_for_update``
+- ``upsert``: ``PageCounter.apply_increments`` for every hit, in autocommit, as ``PageCounter.record``
+  runs it after the request's transaction has committed
+- ``buffered``: ``PageCounterBuffer``, flushed once at the end
+
+    python manage.py benchmark_page_counter --threads 16 --hits 2000
+"""
+from __future__ import unicode_literals
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from osf.models import PageCounter
+from osf.models.analytics import PageCounterBuffer
+
+logger = logging.getLogger(__name__)
+
+MODES = ('locked', 'upsert', 'buffered')
+
+
+def locked_update(page, day):
+    with transaction.atomic():
+        counter, created = PageCounter.objects.select_for_update().get_or_create(_id=page)
+        day_counts = counter.date.setdefault(day, {'total': 0, 'unique': 0})
+        day_counts['total'] += 1
+        day_counts['unique'] += 1
+        counter.total += 1
+        counter.unique += 1
+        counter.save()
+
+
+def run(mode, page, threads, hits):
+    day = timezone.now().strftime('%Y/%m/%d')
+    PageCounter.objects.filter(_id=page).delete()
+    buffer = PageCounterBuffer(max_keys=1000, flush_interval=3600)
+
+    def hit():
+        if mode == 'locked':
+            locked_update(page, day)
+        elif mode == 'upsert':
+            PageCounter.apply_increments({(page, day): (1, 1, 1, 1)})
+        else:
+            buffer.add(page, day, (1, 1, 1, 1))
+
+    def worker():
+        try:
+            for _ in range(hits):
+                hit()
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.time()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    buffer.flush()
+    elapsed = time.time() - start
+
+    counter = PageCounter.objects.get(_id=page)
+    expected = threads * hits
+    logger.info('{:>8}: {:.0f} hits/s, total={} day total={} (expected {})'.format(
+        mode, expected / elapsed, counter.total, counter.date[day]['total'], expected
+    ))
+    counter.delete()
+
+
+class Command(BaseCommand):
+    """Compare PageCounter update strategies under contention on one page."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--hits', type=int, default=1000, help='Hits recorded by each client')
+        parser.add_argument('--page', type=str, default='download:bench0:hotfile', help='Counter _id to use')
+        parser.add_argument('--modes', nargs='*', default=MODES, choices=MODES, help='Strategies to run')
+
+    def handle(self, *args, **options):
+        for mode in options['modes']:
+            run(mode, options['page'], options['threads'], options['hits'])
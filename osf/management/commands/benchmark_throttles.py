@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Compare the per-request cost of the API throttle backends.
+
+Simulates a single client hitting a throttle at a steady rate and reports the mean time spent in
+``allow_request`` and the size of the cached state for the ``history`` and ``counter`` backends.
+
+    python manage.py benchmark_throttles --rate 10000/hour --requests 20000
+"""
+from __future__ import unicode_literals
+import logging
+import pickle
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from api.base import throttling
+
+logger = logging.getLogger(__name__)
+
+
+class FakeRequest(object):
+    META = {'REMOTE_ADDR': '127.0.0.1'}
+
+
+def make_throttle_class(backend, rate, cache):
+    return type(str('Benchmark{}Throttle'.format(backend.title())), (throttling.BaseThrottle, ), {
+        'scope': 'benchmark',
+        'rate': rate,
+        'backend': backend,
+        'cache': cache,
+        'get_cache_key': lambda self, request, view: 'throttle_benchmark_{}'.format(backend),
+    })
+
+
+def get_state_keys(throttle):
+    if throttle.get_backend() == throttling.COUNTER_BACKEND:
+        return throttle.get_bucket_keys()
+    return [throttle.key]
+
+
+def state_size(throttle, cache):
+    return sum(len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)) for value in cache.get_many(get_state_keys(throttle)).values())
+
+
+def run(backend, rate, total, cache_alias):
+    cache = caches[cache_alias]
+    throttle_class = make_throttle_class(backend, rate, cache)
+    interval = float(throttle_class().duration) / throttle_class().num_requests
+    request = FakeRequest()
+    clock = [time.time()]
+    elapsed = 0
+    allowed = 0
+    for _ in range(total):
+        clock[0] += interval
+        throttle = throttle_class()
+        throttle.timer = lambda: clock[0]
+        start = time.time()
+        allowed += throttle.allow_request(request, None)
+        elapsed += time.time() - start
+    logger.info('{:>8}: {:.1f}us/request, {} of {} allowed, {} bytes of cached state'.format(
+        backend, elapsed / total * 1e6, allowed, total, state_size(throttle, cache)
+    ))
+    cache.delete_many(get_state_keys(throttle))
+
+
+class Command(BaseCommand):
+    """Benchmark the history and counter throttle backends."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--rate', type=str, default='10000/hour', help='Throttle rate, e.g. 10000/hour')
+        parser.add_argument('--requests', type=int, default=20000, help='Number of simulated requests')
+        parser.add_argument('--cache', type=str, default='default', help='Cache alias to store throttle state in')
+
+    def handle(self, *args, **options):
+        for backend in (throttling.HISTORY_BACKEND, throttling.COUNTER_BACKEND):
+            run(backend, options['rate'], options['requests'], options['cache'])
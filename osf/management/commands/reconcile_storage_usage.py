@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Compare NodeStorageUsage counters with the aggregate over each node's files and report drift.
+
+    python manage.py reconcile_storage_usage
+    python manage.py reconcile_storage_usage --fix --guids abc12 def34
+"""
+from __future__ import unicode_literals
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from osf.models import AbstractNode, NodeStorageUsage
+
+logger = logging.getLogger(__name__)
+
+
+def iter_node_id_batches(batch_size, guids=None):
+    queryset = AbstractNode.objects.all()
+    if guids:
+        queryset = queryset.filter(guids___id__in=guids)
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def reconcile_storage_usage(batch_size, fix=False, guids=None):
+    drifted = 0
+    for node_ids in iter_node_id_batches(batch_size, guids=guids):
+        with transaction.atomic():
+            drift = NodeStorageUsage.reconcile(node_ids, fix=fix)
+        for (node_id, region_id), (counter, aggregate) in sorted(drift.items()):
+            logger.warning('Storage usage drift for node {} region {}: counter={} aggregate={}'.format(node_id, region_id, counter, aggregate))
+        drifted += len(drift)
+    return drifted
+
+
+class Command(BaseCommand):
+    """Detect, and optionally fix, drift between storage usage counters and file versions."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--fix', action='store_true', dest='fix', help='Overwrite drifted counters with the aggregate')
+        parser.add_argument('--guids', nargs='*', default=None, help='Only check these nodes')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Nodes checked per query')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_storage_usage(options['batch_size'], fix=options['fix'], guids=options['guids'])
+        logger.info('{} drifted storage usage counters{}'.format(drifted, ' fixed' if options['fix'] and drifted else ''))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Reindex nodes and/or preprints in Elasticsearch with the streaming bulk indexer.
+
+Examples:
+
+    python manage.py reindex_search --nodes abc12 def34
+    python manage.py reindex_search --all-preprints --chunk-size 1000 --workers 4
+"""
+from __future__ import unicode_literals
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from osf.models import AbstractNode, Preprint
+from website.search import search
+
+logger = logging.getLogger(__name__)
+
+
+def reindex(queryset, label, index=None, chunk_size=None, workers=None):
+    start = time.time()
+    success, errors = search.bulk_index(queryset, index=index, chunk_size=chunk_size, workers=workers)
+    elapsed = time.time() - start
+    logger.info('Reindexed {} documents for {} and their files in {:.1f}s ({:.1f} docs/sec), {} errors'.format(
+        success, label, elapsed, success / elapsed if elapsed else 0, len(errors)
+    ))
+
+
+class Command(BaseCommand):
+    """Reindex nodes and/or preprints in Elasticsearch."""
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--nodes', nargs='*', default=[], help='Guids of nodes to reindex')
+        parser.add_argument('--preprints', nargs='*', default=[], help='Guids of preprints to reindex')
+        parser.add_argument('--all-nodes', action='store_true', dest='all_nodes', help='Reindex every node')
+        parser.add_argument('--all-preprints', action='store_true', dest='all_preprints', help='Reindex every preprint')
+        parser.add_argument('--index', type=str, default=None, help='Index to write to, defaults to ELASTIC_INDEX')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Objects per query and per bulk request')
+        parser.add_argument('--workers', type=int, default=None, help='Number of concurrent bulk request threads')
+
+    def handle(self, *args, **options):
+        kwargs = {
+            'index': options['index'],
+            'chunk_size': options['chunk_size'],
+            'workers': options['workers'],
+        }
+        if options['all_nodes']:
+            reindex(AbstractNode.objects.exclude(type__in=['osf.collection', 'osf.quickfilesnode']), 'nodes', **kwargs)
+        elif options['nodes']:
+            reindex(AbstractNode.objects.filter(guids___id__in=options['nodes']), 'nodes', **kwargs)
+        if options['all_preprints']:
+            reindex(Preprint.objects.all(), 'preprints', **kwargs)
+        elif options['preprints']:
+            reindex(Preprint.objects.filter(guids___id__in=options['preprints']), 'preprints', **kwargs)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2019-04-22 14:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POPULATE_CLOSURE = """
+INSERT INTO osf_nodetreeclosure (ancestor_id, descendant_id, depth)
+WITH RECURSIVE closure (ancestor_id, descendant_id, depth) AS (
+    SELECT parent_id, child_id, 1
+    FROM osf_noderelation
+    WHERE is_node_link IS FALSE
+  UNION ALL
+    SELECT C.ancestor_id, R.child_id, C.depth + 1
+    FROM closure AS C
+      JOIN osf_noderelation AS R ON R.parent_id = C.descendant_id
+    WHERE R.is_node_link IS FALSE
+) SELECT ancestor_id, descendant_id, MIN(depth)
+FROM closure
+GROUP BY ancestor_id, descendant_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0161_add_spam_fields_to_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeTreeClosure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_closures', to='osf.AbstractNode')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_closures', to='osf.AbstractNode')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='nodetreeclosure',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='nodetreeclosure',
+            index_together=set([('ancestor', 'depth'), ('descendant', 'depth')]),
+        ),
+        migrations.RunSQL(POPULATE_CLOSURE, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+from osf.utils.migrations import AddWaffleSwitches
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0162_nodetreeclosure'),
+    ]
+
+    operations = [
+        AddWaffleSwitches(['sampling_profiler'], active=False),
+    ]
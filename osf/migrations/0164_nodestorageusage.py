@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POPULATE_STORAGE_USAGE = """
+INSERT INTO osf_nodestorageusage (node_id, region_id, total)
+SELECT F.target_object_id, V.region_id, SUM(V.size)
+FROM osf_basefilenode_versions AS T
+  JOIN osf_basefilenode AS F ON F.id = T.basefilenode_id
+  JOIN osf_fileversion AS V ON V.id = T.fileversion_id
+WHERE F.type = 'osf.osfstoragefile'
+  AND F.target_content_type_id = (SELECT id FROM django_content_type WHERE app_label = 'osf' AND model = 'abstractnode')
+  AND V.size IS NOT NULL
+GROUP BY F.target_object_id, V.region_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('addons_osfstorage', '0005_region_mfr_url'),
+        ('osf', '0163_add_sampling_profiler_switch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeStorageUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.BigIntegerField(default=0)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storage_usage_counters', to='osf.AbstractNode')),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='addons_osfstorage.Region')),
+            ],
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX osf_nodestorageusage_node_region_uniq ON osf_nodestorageusage (node_id, COALESCE(region_id, -1));',
+            'DROP INDEX IF EXISTS osf_nodestorageusage_node_region_uniq;',
+        ),
+        migrations.RunSQL(POPULATE_STORAGE_USAGE, migrations.RunSQL.noop),
+    ]
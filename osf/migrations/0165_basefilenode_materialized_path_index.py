@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY cannot be run in a txn
+
+    # OsfStorage paths are populated on save; run the backfill_osfstorage_materialized_paths
+    # management command to fill in existing files.
+    dependencies = [
+        ('osf', '0164_nodestorageusage'),
+    ]
+
+    operations = [
+        migrations.RunSQL([
+            'CREATE INDEX CONCURRENTLY osf_basefilenode_target_materialized_path ON osf_basefilenode '
+            '(target_object_id, target_content_type_id, _materialized_path text_pattern_ops);',
+        ], [
+            'DROP INDEX IF EXISTS osf_basefilenode_target_materialized_path, RESTRICT;'
+        ])
+    ]
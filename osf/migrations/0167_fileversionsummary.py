@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0166_create_citation_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileVersionSummary',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='version_summary', serialize=False, to='osf.BaseFileNode')),
+                ('version_count', models.PositiveIntegerField(default=0)),
+                ('earliest_version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='osf.FileVersion')),
+                ('latest_version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='osf.FileVersion')),
+            ],
+        ),
+    ]
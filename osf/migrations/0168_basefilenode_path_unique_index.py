@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import logging
+
+from django.db import connection
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+DUPLICATES_SQL = """
+    SELECT array_agg(id ORDER BY id)
+    FROM osf_basefilenode
+    WHERE provider <> 'osfstorage'
+    AND type NOT IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder')
+    AND _path IS NOT NULL
+    GROUP BY target_content_type_id, target_object_id, type, _path
+    HAVING COUNT(*) > 1;
+"""
+
+
+def trash_duplicate_filenodes(*args):
+    """Concurrent listings of external folders could create the same file node twice. Keep the
+    oldest, which is the one lookups by path have been returning, and trash the others after moving
+    their guids over.
+    """
+    from osf.models.files import BaseFileNode
+    with connection.cursor() as cursor:
+        cursor.execute(DUPLICATES_SQL)
+        groups = [row[0] for row in cursor.fetchall()]
+    logger.info('Found {} duplicated external file nodes'.format(len(groups)))
+    for ids in groups:
+        keep = BaseFileNode.objects.get(id=ids[0])
+        for dupe in BaseFileNode.objects.filter(id__in=ids[1:]):
+            for guid in list(dupe.guids.all()):
+                guid.referent = keep
+                guid.save()
+            dupe.delete()
+
+
+def noop(*args):
+    pass
+
+
+class Migration(migrations.Migration):
+    atomic = False  # CREATE INDEX CONCURRENTLY cannot be run in a txn
+
+    dependencies = [
+        ('osf', '0167_fileversionsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(trash_duplicate_filenodes, noop),
+        migrations.RunSQL([
+            """
+            CREATE UNIQUE INDEX CONCURRENTLY osf_basefilenode_active_path_unique_index
+            ON osf_basefilenode (target_content_type_id, target_object_id, type, _path)
+            WHERE provider <> 'osfstorage' AND type NOT IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder');
+            """
+        ], [
+            'DROP INDEX IF EXISTS osf_basefilenode_active_path_unique_index RESTRICT;'
+        ])
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import osf.utils.fields
+
+from osf import features
+from osf.utils.migrations import AddWaffleSwitches
+
+
+class Migration(migrations.Migration):
+
+    # The feed is filled as logs are written; run the backfill_node_log_feed management command
+    # for existing logs before turning on the node_log_feed switch.
+    dependencies = [
+        ('osf', '0168_basefilenode_path_unique_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeLogFeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', osf.utils.fields.NonNaiveDateTimeField(blank=True, null=True)),
+                ('feed_node', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.AbstractNode')),
+                ('log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='osf.NodeLog')),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='osf.AbstractNode')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='nodelogfeedentry',
+            unique_together=set([('feed_node', 'log')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='nodelogfeedentry',
+            index_together=set([('feed_node', 'date', 'log')]),
+        ),
+        AddWaffleSwitches([features.NODE_LOG_FEED], active=False),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import osf.utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('osf', '0169_nodelogfeedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexQueueEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=16)),
+                ('object_id', models.IntegerField()),
+                ('superseded', models.BooleanField(default=False)),
+                ('armed', osf.utils.fields.NonNaiveDateTimeField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchindexqueueentry',
+            unique_together=set([('doc_type', 'object_id')]),
+        ),
+    ]
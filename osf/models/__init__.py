@@ -8,7 +8,7 @@ from osf.models.collection import CollectionSubmission, Collection  # noqa
 from osf.models.node import AbstractNode, Node  # noqa
 from osf.models.sanctions import Sanction, Embargo, Retraction, RegistrationApproval, DraftRegistrationApproval, EmbargoTerminationApproval  # noqa
 from osf.models.registrations import Registration, DraftRegistrationLog, DraftRegistration  # noqa
-from osf.models.nodelog import NodeLog  # noqa
+from osf.models.nodelog import NodeLog, NodeLogFeedEntry  # noqa
 from osf.models.preprintlog import PreprintLog  # noqa
 from osf.models.tag import Tag  # noqa
 from osf.models.comment import Comment  # noqa
@@ -33,7 +33,10 @@ from osf.models.files import (  # noqa
     FileVersion, TrashedFile, TrashedFileNode, TrashedFolder, FileVersionUserMetadata,  # noqa
 )  # noqa
 from osf.models.metadata import FileMetadataRecord  # noqa
-from osf.models.node_relation import NodeRelation  # noqa
+from osf.models.node_relation import NodeRelation, NodeTreeClosure  # noqa
+from osf.models.storage_usage import NodeStorageUsage  # noqa
+from osf.models.file_version_summary import FileVersionSummary  # noqa
+from osf.models.search_index_queue import SearchIndexQueueEntry  # noqa
 from osf.models.analytics import UserActivityCounter, PageCounter  # noqa
 from osf.models.admin_profile import AdminProfile  # noqa
 from osf.models.admin_log_entry import AdminLogEntry  # noqa
@@ -1,17 +1,33 @@
+import atexit
 import logging
+import threading
 
 from dateutil import parser
-from django.db import models, transaction
+from django.db import connection, models, transaction
 from django.db.models import Sum
 from django.db.models.expressions import RawSQL
 from django.utils import timezone
 
+from framework.celery_tasks.handlers import in_request_context
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
 from framework.sessions import session
 from osf.models.base import BaseModel
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
+from osf.utils.requests import get_request_cache
+from website import settings
 
 logger = logging.getLogger(__name__)
 
+REQUEST_CACHE_NAMESPACE = 'page_counter_increments'
+
+
+def merge_increment(increments, key, increment):
+    pending = increments.get(key)
+    increments[key] = increment if pending is None else tuple(a + b for a, b in zip(pending, increment))
+
+def _apply_request_increments(batch):
+    PageCounter.apply_increments(batch.pop('increments'))
+
 
 class UserActivityCounter(BaseModel):
     primary_identifier_name = '_id'
@@ -100,62 +116,95 @@ class PageCounter(BaseModel):
         date_string = date.strftime('%Y/%m/%d')
         visited_by_date = session.data.get('visited_by_date', {'date': date_string, 'pages': []})
 
-        with transaction.atomic():
-            model_instance, created = cls.objects.select_for_update().get_or_create(_id=cleaned_page)
-
-            # if they visited something today
-            if date_string == visited_by_date['date']:
-                # if they haven't visited this page today
-                if cleaned_page not in visited_by_date['pages']:
-                    # if the model_instance has today in it
-                    if date_string in model_instance.date.keys():
-                        # increment the number of unique visitors for today
-                        model_instance.date[date_string]['unique'] += 1
-                    else:
-                        # set the number of unique visitors for today to 1
-                        model_instance.date[date_string] = dict(unique=1)
-            # if they haven't visited something today
-            else:
-                # set their visited by date to blank
-                visited_by_date['date'] = date_string
-                visited_by_date['pages'] = []
-                # if the model_instance has today in it
-                if date_string in model_instance.date.keys():
-                    # increment the number of unique visitors for today
-                    model_instance.date[date_string]['unique'] += 1
-                else:
-                    # set the number of unique visitors to 1
-                    model_instance.date[date_string] = dict(unique=1)
+        day_unique = 0
+        # if they visited something today
+        if date_string == visited_by_date['date']:
+            # if they haven't visited this page today, they are a new unique visitor for today
+            if cleaned_page not in visited_by_date['pages']:
+                day_unique = 1
+        # if they haven't visited something today
+        else:
+            # set their visited by date to blank
+            visited_by_date['date'] = date_string
+            visited_by_date['pages'] = []
+            day_unique = 1
 
-            # update their sessions
-            visited_by_date['pages'].append(cleaned_page)
-            session.data['visited_by_date'] = visited_by_date
-
-            if date_string in model_instance.date.keys():
-                if 'total' not in model_instance.date[date_string].keys():
-                    model_instance.date[date_string].update(total=0)
-                model_instance.date[date_string]['total'] += 1
-            else:
-                model_instance.date[date_string] = dict(total=1)
-
-            # if a download counter is being updated, only perform the update
-            # if the user who is downloading isn't a contributor to the project
-            page_type = cleaned_page.split(':')[0]
-            if page_type in ('download', 'view') and node_info:
-                if node_info['contributors'].filter(guids___id__isnull=False, guids___id=session.data.get('auth_user_id')).exists():
-                    model_instance.save()
-                    return
+        # update their sessions
+        visited_by_date['pages'].append(cleaned_page)
+        session.data['visited_by_date'] = visited_by_date
 
+        total = unique = 0
+        # if a download counter is being updated, only count it towards the totals
+        # if the user who is downloading isn't a contributor to the project
+        page_type = cleaned_page.split(':')[0]
+        is_contributor = (
+            page_type in ('download', 'view') and node_info and
+            node_info['contributors'].filter(guids___id__isnull=False, guids___id=session.data.get('auth_user_id')).exists()
+        )
+        if not is_contributor:
             visited = session.data.get('visited', [])
             if page not in visited:
-                model_instance.unique += 1
+                unique = 1
                 visited.append(page)
                 session.data['visited'] = visited
 
             session.save()
-            model_instance.total += 1
+            total = 1
+
+        cls.record(cleaned_page, date_string, (1, day_unique, total, unique))
+
+    @classmethod
+    def record(cls, page, day, increment):
+        """Add ``increment``, a tuple of (day total, day unique, total, unique), to the counter for
+        the cleaned ``page`` and ``day`` ('yyyy/mm/dd'), either through the write-behind buffer or
+        with ``apply_increments``.
 
-            model_instance.save()
+        During a request the increments are applied once the request's transaction has committed,
+        so that the counter's row is not locked until the end of the request.
+        """
+        if settings.PAGE_COUNTER_WRITE_BEHIND:
+            get_page_counter_buffer().add(page, day, increment)
+            return
+        batch = get_request_cache(REQUEST_CACHE_NAMESPACE) if in_request_context() else None
+        if batch is None:
+            cls.apply_increments({(page, day): increment})
+        elif 'increments' in batch:
+            merge_increment(batch['increments'], (page, day), increment)
+        else:
+            # Tests run postcommit tasks right away, which pops the increments so the next call starts a new batch
+            batch['increments'] = {(page, day): increment}
+            enqueue_postcommit_task(_apply_request_increments, (batch, ), {}, celery=False, once_per_request=True)
+
+    @classmethod
+    def apply_increments(cls, increments):
+        """Apply {(page, day): (day total, day unique, total, unique)} with one upsert per key.
+
+        The counters' rows stay locked until the end of the transaction, so outside of autocommit
+        concurrent increments of the same page wait for it.
+        """
+        table = cls._meta.db_table
+        sql = """
+            INSERT INTO "{table}" (_id, date, total, "unique", created, modified)
+            VALUES (
+              %(page)s,
+              jsonb_build_object(%(day)s, jsonb_build_object('total', %(day_total)s, 'unique', %(day_unique)s)),
+              %(total)s, %(unique)s, now(), now()
+            )
+            ON CONFLICT (_id) DO UPDATE SET
+              date = "{table}".date || jsonb_build_object(%(day)s, COALESCE("{table}".date -> %(day)s, '{{}}'::jsonb) || jsonb_build_object(
+                'total', COALESCE(("{table}".date -> %(day)s ->> 'total')::int, 0) + %(day_total)s,
+                'unique', COALESCE(("{table}".date -> %(day)s ->> 'unique')::int, 0) + %(day_unique)s
+              )),
+              total = "{table}".total + EXCLUDED.total,
+              "unique" = "{table}"."unique" + EXCLUDED."unique",
+              modified = now();
+        """.format(table=table)
+        params = [
+            {'page': page, 'day': day, 'day_total': day_total, 'day_unique': day_unique, 'total': total, 'unique': unique}
+            for (page, day), (day_total, day_unique, total, unique) in sorted(increments.items())
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
 
     @classmethod
     def get_basic_counters(cls, page):
@@ -164,3 +213,75 @@ class PageCounter(BaseModel):
             return (counter.unique, counter.total)
         except cls.DoesNotExist:
             return (None, None)
+
+
+class PageCounterBuffer(object):
+    """Write-behind buffer for PageCounter increments.
+
+    Increments are summed per (page, day) in memory and applied by ``PageCounter.apply_increments``
+    from a background thread, ``flush_interval`` seconds after the first increment since the last
+    flush or as soon as ``max_keys`` pages/days are pending. Flushing from its own thread keeps the
+    upserts out of request transactions. Increments that are pending when a process is killed
+    are lost; ``flush`` is called at exit otherwise.
+    """
+
+    def __init__(self, max_keys, flush_interval):
+        self.max_keys = max_keys
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.increments = {}
+        self._timer = None
+
+    def add(self, page, day, increment):
+        with self.lock:
+            merge_increment(self.increments, (page, day), increment)
+            if len(self.increments) >= self.max_keys:
+                self._schedule(0)
+            elif self._timer is None:
+                self._schedule(self.flush_interval)
+
+    def _schedule(self, delay):
+        # Caller holds the lock
+        if self._timer is not None:
+            if delay:
+                return
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self):
+        try:
+            self.flush()
+        finally:
+            # Timer threads are not reused; don't leak their connections
+            connection.close()
+
+    def flush(self):
+        with self.lock:
+            increments, self.increments = self.increments, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not increments:
+            return
+        try:
+            PageCounter.apply_increments(increments)
+        except Exception:
+            logger.exception('Failed to apply {} page counter increments, retrying later'.format(len(increments)))
+            with self.lock:
+                for key, increment in increments.items():
+                    merge_increment(self.increments, key, increment)
+                if self._timer is None:
+                    self._schedule(self.flush_interval)
+
+
+_page_counter_buffer = None
+
+
+def get_page_counter_buffer():
+    global _page_counter_buffer
+    if _page_counter_buffer is None:
+        _page_counter_buffer = PageCounterBuffer(settings.PAGE_COUNTER_BUFFER_SIZE, settings.PAGE_COUNTER_FLUSH_INTERVAL)
+        atexit.register(_page_counter_buffer.flush)
+    return _page_counter_buffer
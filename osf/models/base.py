@@ -1,5 +1,7 @@
 import logging
 import random
+import threading
+import time
 
 import bson
 from django.contrib.contenttypes.fields import (GenericForeignKey,
@@ -9,11 +11,12 @@ from django.core.exceptions import MultipleObjectsReturned
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import models
 from django.db.models import ForeignKey
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django_extensions.db.models import TimeStampedModel
 from include import IncludeQuerySet
 
+from osf.utils import guid_map
 from osf.utils.caching import cached_property
 from osf.exceptions import ValidationError
 from osf.utils.fields import LowercaseCharField, NonNaiveDateTimeField
@@ -23,21 +26,64 @@ ALPHABET = '23456789abcdefghjkmnpqrstuvwxyz'
 logger = logging.getLogger(__name__)
 
 
-def _check_blacklist(guid):
-    return BlackListGuid.objects.filter(guid=guid).exists()
+GUID_POOL_SIZE = 50
+GUID_POOL_MAX_AGE = 60  # seconds
 
 
-def generate_guid(length=5):
-    while True:
-        guid_id = ''.join(random.sample(ALPHABET, length))
+def reserve_guids(count, length=5):
+    """Return ``count`` random guids that are neither in use nor blacklisted.
+
+    Candidates are checked a block at a time against Guid and BlackListGuid with one query, rather
+    than with two queries per candidate.
+    """
+    reserved = set()
+    while len(reserved) < count:
+        # Generate twice what is missing so that collisions rarely take another round trip
+        candidates = set(''.join(random.sample(ALPHABET, length)) for _ in range(2 * (count - len(reserved)))) - reserved
+        taken = Guid.objects.filter(_id__in=candidates).order_by().values_list('_id', flat=True).union(
+            BlackListGuid.objects.filter(guid__in=candidates).order_by().values_list('guid', flat=True)
+        )
+        reserved |= candidates - set(taken)
+    return list(reserved)[:count]
+
+
+class GuidPool(object):
+    """An in-process pool of guids that were unused and not blacklisted when they were reserved.
+
+    Pooled guids are only reserved in this process, so another process can still take one before
+    it is used, as with checking a single guid before inserting it; the unique constraint on
+    Guid._id catches that either way. Pools are dropped after ``max_age`` seconds to keep the
+    window short.
+    """
+
+    def __init__(self, size=GUID_POOL_SIZE, max_age=GUID_POOL_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+        self._pools = {}  # length -> (time reserved, guids)
+        self._lock = threading.Lock()
+
+    def take(self, count=1, length=5):
+        with self._lock:
+            reserved_at, guids = self._pools.get(length, (0, []))
+            if time.time() - reserved_at > self.max_age:
+                guids = []
+            if len(guids) < count:
+                guids = reserve_guids(count + self.size, length)
+                reserved_at = time.time()
+            taken, guids = guids[:count], guids[count:]
+            self._pools[length] = (reserved_at, guids)
+        return taken
+
+    def clear(self):
+        with self._lock:
+            self._pools.clear()
 
-        # is the guid in the blacklist
-        if _check_blacklist(guid_id):
-            continue
 
-        # it's not, check and see if it's already in the database
-        if not Guid.objects.filter(_id=guid_id).exists():
-            return guid_id
+guid_pool = GuidPool()
+
+
+def generate_guid(length=5):
+    return guid_pool.take(1, length)[0]
 
 
 def generate_object_id():
@@ -147,10 +193,43 @@ class Guid(BaseModel):
     # Override load in order to load by GUID
     @classmethod
     def load(cls, data, select_for_update=False):
+        if not select_for_update:
+            guid = guid_map.get_guid(data)
+            if guid:
+                return guid
         try:
-            return cls.objects.get(_id=data) if not select_for_update else cls.objects.filter(_id=data).select_for_update().get()
+            guid = cls.objects.get(_id=data) if not select_for_update else cls.objects.filter(_id=data).select_for_update().get()
         except cls.DoesNotExist:
             return None
+        guid_map.remember_guid(guid)
+        return guid
+
+    @classmethod
+    def bulk_create_for(cls, referents):
+        """Give each of the saved ``referents`` that has no guid yet a new one, with one insert.
+
+        Guids are taken from the pool in one block. Unlike saving each referent, no post_save
+        signals are sent. Returns the created guids.
+        """
+        by_content_type = {}
+        for referent in referents:
+            content_type = ContentType.objects.get_for_model(referent)
+            by_content_type.setdefault(content_type.id, {})[referent.pk] = referent
+
+        missing_by_length = {}
+        for content_type_id, by_pk in by_content_type.items():
+            existing = set(cls.objects.filter(content_type_id=content_type_id, object_id__in=list(by_pk)).values_list('object_id', flat=True))
+            for pk, referent in by_pk.items():
+                if pk not in existing:
+                    missing_by_length.setdefault(referent.__guid_min_length__, []).append((content_type_id, referent))
+
+        guids = []
+        for length, missing in missing_by_length.items():
+            for guid_id, (content_type_id, referent) in zip(guid_pool.take(len(missing), length), missing):
+                guids.append(cls(_id=guid_id, content_type_id=content_type_id, object_id=referent.pk))
+                # Clear the query cache of referent.guids, as ensure_guid does
+                getattr(referent, '_prefetched_objects_cache', {}).pop('guids', None)
+        return cls.objects.bulk_create(guids)
 
     class Meta:
         ordering = ['-created']
@@ -294,11 +373,16 @@ class GuidMixin(BaseIDMixin):
 
     @cached_property
     def _id(self):
+        if 'guids' not in getattr(self, '_prefetched_objects_cache', {}):
+            guid_id = guid_map.get_guid_id(self)
+            if guid_id:
+                return guid_id
         try:
             guid = self.guids.first()
         except IndexError:
             return None
         if guid:
+            guid_map.remember_guid(guid, primary=True)
             return guid._id
         return None
 
@@ -324,13 +408,20 @@ class GuidMixin(BaseIDMixin):
         # Minor optimization--no need to query if q is None or ''
         if not q:
             return None
+        if not select_for_update:
+            instance = guid_map.get_instance(cls, q)
+            if instance is not None:
+                return instance
         try:
             # guids___id__isnull=False forces an INNER JOIN
             if select_for_update:
-                return cls.objects.filter(guids___id__isnull=False, guids___id=q).select_for_update()[:1].get()
-            return cls.objects.filter(guids___id__isnull=False, guids___id=q)[:1].get()
+                instance = cls.objects.filter(guids___id__isnull=False, guids___id=q).select_for_update()[:1].get()
+            else:
+                instance = cls.objects.filter(guids___id__isnull=False, guids___id=q)[:1].get()
         except cls.DoesNotExist:
             return None
+        guid_map.remember(instance, q)
+        return instance
 
     @property
     def deep_url(self):
@@ -352,3 +443,12 @@ def ensure_guid(sender, instance, created, **kwargs):
             del instance._prefetched_objects_cache['guids']
         Guid.objects.create(object_id=instance.pk, content_type=ContentType.objects.get_for_model(instance),
                             _id=generate_guid(instance.__guid_min_length__))
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def forget_guid_identity(sender, instance, **kwargs):
+    if sender is Guid:
+        guid_map.forget_guid(instance)
+    elif issubclass(sender, GuidMixin):
+        guid_map.forget(instance)
@@ -1,7 +1,9 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete
 from include import IncludeManager
 
 from osf.utils.fields import NonNaiveDateTimeField
+from osf.utils.node_permissions import clear_readable_node_ids_cache
 from osf.utils.permissions import (
     READ,
     WRITE,
@@ -56,6 +58,10 @@ class Contributor(AbstractBaseContributor):
         order_with_respect_to = 'node'
 
 
+post_save.connect(clear_readable_node_ids_cache, sender=Contributor)
+post_delete.connect(clear_readable_node_ids_cache, sender=Contributor)
+
+
 class PreprintContributor(models.Model):
     objects = IncludeManager()
 
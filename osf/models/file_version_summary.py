@@ -0,0 +1,94 @@
+from django.db import connection, models
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from osf.models.files import BaseFileNode, FileVersion
+
+
+class FileVersionSummary(models.Model):
+    """The latest and earliest versions of a file and how many versions it has.
+
+    Equivalent to ordering ``file.versions`` by ``created`` and counting them, but kept up to date
+    by the signal handlers below whenever versions are added to, removed from or deleted under a
+    file, so listings can join to it instead of querying the versions of every file. Kept out of
+    the file row itself so that saving a stale BaseFileNode instance can't overwrite it.
+
+    Files without a row have not been summarized yet; see ``refresh`` with ``parent_id`` and the
+    backfill_file_version_summaries command.
+    """
+    file = models.OneToOneField('BaseFileNode', primary_key=True, related_name='version_summary', on_delete=models.CASCADE)
+    latest_version = models.ForeignKey('FileVersion', null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    earliest_version = models.ForeignKey('FileVersion', null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    version_count = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return 'file={}, latest={}, count={}'.format(self.file_id, self.latest_version_id, self.version_count)
+
+    @classmethod
+    def refresh(cls, file_ids=None, parent_id=None):
+        """Recompute the summaries of ``file_ids``, or create the missing summaries of the
+        OsfStorage files directly under the folder ``parent_id``, with one statement.
+        """
+        if file_ids is not None:
+            where = 'F.id = ANY(%(file_ids)s)'
+        else:
+            where = """
+                F.parent_id = %(parent_id)s AND F.type = 'osf.osfstoragefile'
+                AND NOT EXISTS (SELECT 1 FROM "{table}" AS S WHERE S.file_id = F.id)
+            """.format(table=cls._meta.db_table)
+        sql = """
+            INSERT INTO "{table}" (file_id, latest_version_id, earliest_version_id, version_count)
+            SELECT
+              F.id,
+              (SELECT V.id FROM "{through}" AS T JOIN "{versions}" AS V ON V.id = T.fileversion_id
+               WHERE T.basefilenode_id = F.id ORDER BY V.created DESC, V.id DESC LIMIT 1),
+              (SELECT V.id FROM "{through}" AS T JOIN "{versions}" AS V ON V.id = T.fileversion_id
+               WHERE T.basefilenode_id = F.id ORDER BY V.created ASC, V.id ASC LIMIT 1),
+              (SELECT COUNT(*) FROM "{through}" AS T WHERE T.basefilenode_id = F.id)
+            FROM "{files}" AS F
+            WHERE {where}
+            ON CONFLICT (file_id) DO UPDATE SET
+              latest_version_id = EXCLUDED.latest_version_id,
+              earliest_version_id = EXCLUDED.earliest_version_id,
+              version_count = EXCLUDED.version_count;
+        """.format(
+            table=cls._meta.db_table,
+            through=BaseFileNode.versions.through._meta.db_table,
+            versions=FileVersion._meta.db_table,
+            files=BaseFileNode._meta.db_table,
+            where=where,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'file_ids': list(file_ids or []), 'parent_id': parent_id})
+            return cursor.rowcount
+
+
+@receiver(m2m_changed, sender=BaseFileNode.versions.through)
+def file_version_summary_versions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Versions added to or removed from files, e.g. by create_version or copying a file."""
+    if action == 'pre_clear' and reverse:
+        # The version's files are gone from the through table by post_clear
+        instance._version_summary_file_ids = list(instance.basefilenode_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        file_ids = [instance.pk]
+    elif action == 'post_clear':
+        file_ids = getattr(instance, '_version_summary_file_ids', None)
+    else:
+        file_ids = pk_set
+    if file_ids:
+        FileVersionSummary.refresh(file_ids=file_ids)
+
+
+@receiver(pre_delete, sender=FileVersion)
+def file_version_summary_pre_delete(sender, instance, **kwargs):
+    instance._version_summary_file_ids = list(instance.basefilenode_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=FileVersion)
+def file_version_summary_post_delete(sender, instance, **kwargs):
+    file_ids = getattr(instance, '_version_summary_file_ids', None)
+    if file_ids:
+        FileVersionSummary.refresh(file_ids=file_ids)
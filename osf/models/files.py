@@ -6,7 +6,7 @@ import os
 import requests
 from dateutil.parser import parse as parse_date
 from django.apps import apps
-from django.db import models, IntegrityError
+from django.db import connection, models, IntegrityError
 from django.db.models import Manager
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
@@ -39,6 +39,12 @@ __all__ = (
 PROVIDER_MAP = {}
 logger = logging.getLogger(__name__)
 
+# Condition of the unique index on (target, type, path) that BaseFileNode.bulk_upsert conflicts on;
+# must match osf_basefilenode_active_path_unique_index exactly
+PATH_UNIQUE_INDEX_PREDICATE = (
+    "provider <> 'osfstorage' AND type NOT IN ('osf.trashedfilenode', 'osf.trashedfile', 'osf.trashedfolder')"
+)
+
 
 class BaseFileNodeManager(TypedModelManager, IncludeManager):
 
@@ -117,6 +123,24 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
             ('target_content_type', 'target_object_id', )
         )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(BaseFileNode, cls).from_db(db, field_names, values)
+        # Remember where the file was loaded from so osf.models.storage_usage can tell when
+        # it is trashed, restored or moved to another target
+        if not instance.get_deferred_fields().intersection(('type', 'target_content_type_id', 'target_object_id')):
+            instance._storage_usage_state = instance.get_storage_usage_state()
+        # Lets providers that store their materialized path skip recomputing it on save
+        if not instance.get_deferred_fields().intersection(('type', 'name', 'parent_id')):
+            instance._materialized_path_state = instance.get_materialized_path_state()
+        return instance
+
+    def get_storage_usage_state(self):
+        return self.type, self.target_content_type_id, self.target_object_id
+
+    def get_materialized_path_state(self):
+        return self.type, self.name, self.parent_id
+
     @property
     def history(self):
         return self._history
@@ -189,12 +213,80 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
 
     @classmethod
     def get_or_create(cls, target, path):
+        return BaseFileNode.bulk_get_or_create(target, [(cls, path)])[0]
+
+    @classmethod
+    def bulk_get_or_create(cls, target, entries):
+        """Like ``get_or_create`` for a list of ``(file node class, path)`` pairs, e.g. the contents
+        of a folder listed by WaterButler, with one query. Returns the file nodes in the same order;
+        those that don't exist yet are not saved.
+        """
         content_type = ContentType.objects.get_for_model(target)
-        try:
-            obj = cls.objects.get(target_object_id=target.id, target_content_type=content_type, _path='/' + path.lstrip('/'))
-        except cls.DoesNotExist:
-            obj = cls(target_object_id=target.id, target_content_type=content_type, _path='/' + path.lstrip('/'))
-        return obj
+        keys = [(klass._typedmodels_type, '/' + path.lstrip('/')) for klass, path in entries]
+        existing = {}
+        if keys:
+            queryset = BaseFileNode.objects.filter(
+                target_object_id=target.id,
+                target_content_type=content_type,
+                type__in=set(type_ for type_, _ in keys),
+                _path__in=set(path for _, path in keys),
+            ).order_by('-id')
+            # Prefer the oldest node if duplicates from before the unique index exist
+            existing = {(file_node.type, file_node._path): file_node for file_node in queryset}
+        file_nodes = []
+        for (klass, _), key in zip(entries, keys):
+            file_node = existing.get(key)
+            if file_node is None:
+                file_node = klass(target_object_id=target.id, target_content_type=content_type, _path=key[1])
+            file_nodes.append(file_node)
+        return file_nodes
+
+    @classmethod
+    def bulk_upsert(cls, file_nodes):
+        """Save ``file_nodes``, new and existing, with a single INSERT ... ON CONFLICT keyed by
+        target, type and path so that concurrent listings of the same folder can't create duplicates.
+        Sets the primary key of new nodes; if another request created a node first, the ``_id``
+        is updated to that node's.
+
+        Only for providers other than OsfStorage, whose paths aren't unique. Does not send
+        ``pre_save`` or ``post_save``.
+        """
+        if not file_nodes:
+            return file_nodes
+        fields = [field for field in BaseFileNode._meta.concrete_fields if not field.primary_key]
+        by_key = {}
+        for file_node in file_nodes:
+            if file_node._meta.model._provider in (None, 'osfstorage'):
+                raise ValueError('Only file nodes of external providers can be upserted by path')
+            file_node.provider = file_node._meta.model._provider
+            by_key.setdefault((file_node.target_content_type_id, file_node.target_object_id, file_node.type, file_node._path), []).append(file_node)
+        rows = []
+        # A row can only be upserted once per statement; sorting keeps concurrent upserts from deadlocking
+        for key in sorted(by_key):
+            file_node = by_key[key][-1]
+            rows.append([field.get_db_prep_save(field.pre_save(file_node, file_node.pk is None), connection) for field in fields])
+        # Creation time and identifiers of existing nodes are kept
+        updated = [field.column for field in fields if field.column not in ('_id', 'created')]
+        sql = """
+            INSERT INTO "{table}" ({columns})
+            VALUES {values}
+            ON CONFLICT (target_content_type_id, target_object_id, type, _path) WHERE {predicate}
+            DO UPDATE SET {updates}
+            RETURNING target_content_type_id, target_object_id, type, _path, id, _id;
+        """.format(
+            table=BaseFileNode._meta.db_table,
+            columns=', '.join('"{}"'.format(field.column) for field in fields),
+            values=', '.join(['({})'.format(', '.join(['%s'] * len(fields)))] * len(rows)),
+            predicate=PATH_UNIQUE_INDEX_PREDICATE,
+            updates=', '.join('"{0}" = EXCLUDED."{0}"'.format(column) for column in updated),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+            for row in cursor.fetchall():
+                for file_node in by_key[row[:4]]:
+                    file_node.pk, file_node._id = row[4:]
+                    file_node._state.adding = False
+        return file_nodes
 
     @classmethod
     def get_file_guids(cls, materialized_path, provider, target):
@@ -387,9 +479,35 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
             self.target = self.parent.target
         if save:
             self.save()
-        if recursive and not self.is_file:
-            for child in self.children:
-                child._update_node(save=save)
+            if recursive and not self.is_file:
+                self._move_descendants_to_target()
+
+    def _move_descendants_to_target(self):
+        """Set-based equivalent of calling ``_update_node`` on every live descendant of this folder:
+        point them at this folder's target. Returns the ids of the descendants that moved.
+        """
+        subtree = self._get_subtree('NOT (T.type = ANY(%(trashed_types)s))', {
+            'trashed_types': list(TrashedFileNode._typedmodels_subtypes),
+        })
+        content_type = ContentType.objects.get_for_model(self.target)
+        moved = list(
+            BaseFileNode.objects.filter(id__in=[row[0] for row in subtree])
+            .exclude(target_content_type=content_type, target_object_id=self.target.id)
+            .values_list('id', flat=True)
+        )
+        if not moved:
+            return moved
+
+        # Bulk updates skip the signals that maintain storage usage counters
+        NodeStorageUsage = apps.get_model('osf.NodeStorageUsage')
+        NodeStorageUsage.adjust(-1, file_ids=moved)
+        BaseFileNode.objects.filter(id__in=moved).update(
+            target_content_type=content_type,
+            target_object_id=self.target.id,
+            modified=timezone.now(),
+        )
+        NodeStorageUsage.adjust(1, file_ids=moved)
+        return moved
 
     # TODO: Remove unused parent param
     def delete(self, user=None, parent=None, save=True, deleted_on=None):
@@ -406,10 +524,10 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
         self.deleted_on = deleted_on = deleted_on or timezone.now()
 
         if not self.is_file:
+            # Descendants are only written when the folder is
+            if save:
+                self._trash_descendants(user, deleted_on)
             self.recast(TrashedFolder._typedmodels_type)
-
-            for child in BaseFileNode.objects.filter(parent=self.id).exclude(type__in=TrashedFileNode._typedmodels_subtypes):
-                child.delete(user=user, save=save, deleted_on=deleted_on)
         else:
             self.recast(TrashedFile._typedmodels_type)
 
@@ -423,6 +541,84 @@ class BaseFileNode(TypedModel, CommentableMixin, OptionalGuidMixin, Taggable, Ob
 
         return self
 
+    def _get_subtree(self, where, params):
+        """Return [(pk, _id, type, provider)] for every descendant reachable through nodes matching ``where``."""
+        sql = """
+            WITH RECURSIVE subtree(id) AS (
+              SELECT T.id FROM "{table}" AS T WHERE T.parent_id = %(parent_id)s AND {where}
+              UNION ALL
+              SELECT T.id FROM "{table}" AS T
+                JOIN subtree AS S ON T.parent_id = S.id
+              WHERE {where}
+            )
+            SELECT T.id, T._id, T.type, T.provider
+            FROM subtree AS S
+              JOIN "{table}" AS T ON T.id = S.id;
+        """.format(table=self._meta.db_table, where=where)
+        params = dict(params, parent_id=self.pk)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _trash_descendants(self, user, deleted_on):
+        """Set-based equivalent of calling ``delete`` on every live descendant of this folder:
+        recast them to TrashedFile/TrashedFolder, stamp deleted_on/deleted_by and detach comments
+        from the files, in a fixed number of queries however large the subtree.
+        """
+        subtree = self._get_subtree('NOT (T.type = ANY(%(trashed_types)s))', {
+            'trashed_types': list(TrashedFileNode._typedmodels_subtypes),
+        })
+        if not subtree:
+            return subtree
+        file_ids = [pk for pk, _, type_, _ in subtree if issubclass(BaseFileNode._typedmodels_registry[type_], File)]
+
+        if file_ids:
+            Comment = apps.get_model('osf.Comment')
+            Guid = apps.get_model('osf.Guid')
+            Comment.objects.filter(root_target__in=Guid.objects.filter(
+                content_type=ContentType.objects.get_for_model(BaseFileNode), object_id__in=file_ids
+            )).update(root_target=None)
+            # Bulk updates skip the signals that maintain storage usage counters
+            apps.get_model('osf.NodeStorageUsage').adjust(-1, file_ids=file_ids)
+
+        file_id_set = set(file_ids)
+        folder_ids = [row[0] for row in subtree if row[0] not in file_id_set]
+        modified = timezone.now()
+        for ids, trashed_cls in ((file_ids, TrashedFile), (folder_ids, TrashedFolder)):
+            if ids:
+                BaseFileNode.objects.filter(id__in=ids).update(
+                    type=trashed_cls._typedmodels_type,
+                    deleted_on=deleted_on,
+                    deleted_by=user,
+                    modified=modified,
+                )
+        return subtree
+
+    def _restore_descendants(self, deleted_on):
+        """Set-based equivalent of calling ``restore`` on every descendant trashed along with this
+        folder, i.e. at ``deleted_on``. Descendants trashed separately stay in the trash.
+        """
+        subtree = self._get_subtree('T.type = ANY(%(trashed_types)s) AND T.deleted_on = %(deleted_on)s', {
+            'trashed_types': list(TrashedFileNode._typedmodels_subtypes),
+            'deleted_on': deleted_on,
+        })
+        groups = {}
+        for pk, _, type_, provider in subtree:
+            groups.setdefault((type_, provider), []).append(pk)
+
+        modified = timezone.now()
+        for (type_, provider), ids in groups.items():
+            kind = 1 if type_ == TrashedFile._typedmodels_type else 0
+            BaseFileNode.objects.filter(id__in=ids).update(
+                type=self.resolve_class(provider, kind)._typedmodels_type,
+                modified=modified,
+            )
+
+        file_ids = [pk for pk, _, type_, _ in subtree if type_ == TrashedFile._typedmodels_type]
+        if file_ids:
+            apps.get_model('osf.NodeStorageUsage').adjust(1, file_ids=file_ids)
+        return subtree
+
     def _serialize(self, **kwargs):
         return {
             'id': self._id,
@@ -697,9 +893,7 @@ class TrashedFolder(TrashedFileNode):
         tf = super(TrashedFolder, self).restore(recursive=True, parent=None, save=True, deleted_on=None)
 
         if not self.is_file and recursive:
-            deleted_on = deleted_on or self.deleted_on
-            for child in TrashedFileNode.objects.filter(parent=self.id, deleted_on=deleted_on):
-                child.restore(recursive=True, save=save, deleted_on=deleted_on)
+            tf._restore_descendants(deleted_on or self.deleted_on)
         return tf
 
 
@@ -739,6 +933,17 @@ class FileVersion(ObjectIDMixin, BaseModel):
 
     includable_objects = IncludeManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(FileVersion, cls).from_db(db, field_names, values)
+        # See BaseFileNode.from_db
+        if not instance.get_deferred_fields().intersection(('size', 'region_id')):
+            instance._storage_usage_state = instance.get_storage_usage_state()
+        return instance
+
+    def get_storage_usage_state(self):
+        return self.size, self.region_id
+
     @property
     def location_hash(self):
         return self.location['object']
@@ -1546,6 +1546,14 @@ class SpamOverrideMixin(SpamMixin):
         content = self._get_spam_content(saved_fields)
         if not content:
             return
+        if settings.SPAM_CHECK_ASYNC and self.pk:
+            if self.spam_status == SpamStatus.HAM:
+                return False
+            if self.is_spammy:
+                return True
+            from osf.external.tasks import enqueue_spam_check
+            enqueue_spam_check(self, user, content, request_headers)
+            return False
         is_spam = self.do_check_spam(
             user.fullname,
             user.username,
@@ -1579,16 +1587,45 @@ class SpamOverrideMixin(SpamMixin):
                     can_change_preferences=False,
                 )
             user.save()
+            self._make_user_content_private(user)
 
-            # Make public nodes private from this contributor
-            for node in user.contributed:
-                if self._id != node._id and len(node.contributors) == 1 and node.is_public and not node.is_quickfiles:
-                    node.set_privacy('private', log=False, save=True)
+    def _make_user_content_private(self, user):
+        """Make the public nodes and preprints that ``user`` is the only contributor to private, other
+        than this one.
+
+        Candidates are found with one query per model rather than by counting the contributors of
+        everything ``user`` contributed to, and each is then made private with ``set_privacy`` so that
+        addon hooks, identifier, search and SHARE updates and save signals run as usual. Public
+        registrations are skipped unless their embargo is pending, since set_privacy refuses to
+        make them private; they must be withdrawn instead.
+        """
+        from osf.models import AbstractNode, Preprint
 
-            # Make preprints private from this contributor
-            for preprint in user.preprints.all():
-                if self._id != preprint._id and len(preprint.contributors) == 1 and preprint.is_public:
-                    preprint.set_privacy('private', log=False, save=True)
+        # Annotate before filtering by the user, so that all contributors are counted
+        nodes = (
+            AbstractNode.objects.annotate(contributor_count=models.Count('_contributors'))
+            .filter(contributor_count=1, contributor__user=user, is_public=True)
+            .exclude(type='osf.quickfilesnode')
+        )
+        preprints = (
+            Preprint.objects.annotate(contributor_count=models.Count('_contributors'))
+            .filter(contributor_count=1, _contributors=user, is_public=True)
+        )
+        if isinstance(self, AbstractNode):
+            nodes = nodes.exclude(id=self.id)
+        else:
+            preprints = preprints.exclude(id=self.id)
+
+        made_private = 0
+        for node in nodes:
+            if node.is_registration and not node.is_pending_embargo:
+                continue
+            node.set_privacy('private', log=False, save=True)
+            made_private += 1
+        for preprint in preprints:
+            preprint.set_privacy('private', log=False, save=True)
+            made_private += 1
+        logger.info('Made {} nodes and preprints of {} private'.format(made_private, user._id))
 
     def flag_spam(self):
         """ Overrides SpamMixin#flag_spam.
@@ -1,4 +1,3 @@
-import functools
 import itertools
 import logging
 import re
@@ -7,7 +6,7 @@ import warnings
 import httplib
 
 import bson
-from django.db.models import Q, OuterRef, Exists
+from django.db.models import F, Q, OuterRef, Exists
 from dirtyfields import DirtyFieldsMixin
 from django.apps import apps
 from django_bulk_update.helper import bulk_update
@@ -21,7 +20,6 @@ from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.functional import cached_property
 from keen import scoped_keys
-from psycopg2._psycopg import AsIs
 from typedmodels.models import TypedModel, TypedModelManager
 from include import IncludeManager
 
@@ -39,8 +37,8 @@ from osf.models.identifiers import Identifier, IdentifierMixin
 from osf.models.licenses import NodeLicenseRecord
 from osf.models.mixins import (AddonModelMixin, CommentableMixin, Loggable, ContributorMixin,
                                NodeLinkMixin, Taggable, TaxonomizableMixin, SpamOverrideMixin)
-from osf.models.node_relation import NodeRelation
-from osf.models.nodelog import NodeLog
+from osf.models.node_relation import NodeRelation, NodeTreeClosure
+from osf.models.nodelog import NodeLog, NodeLogFeedEntry
 from osf.models.sanctions import RegistrationApproval
 from osf.models.private_link import PrivateLink
 from osf.models.tag import Tag
@@ -51,6 +49,7 @@ from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 from osf.utils.fields import NonNaiveDateTimeField
 from osf.utils.requests import get_request_and_user_id, string_type_request_headers
 from osf.utils import sanitize
+from osf.utils.node_permissions import clear_readable_node_ids_cache, get_readable_node_ids
 from website import language, settings
 from website.citations.utils import datetime_to_csl
 from website.project.licenses import set_license
@@ -62,9 +61,6 @@ from website.identifiers.clients import DataCiteClient
 from osf.utils.permissions import ADMIN, CREATOR_PERMISSIONS, DEFAULT_CONTRIBUTOR_PERMISSIONS, expand_permissions
 from website.util import api_url_for, api_v2_url, web_url_for
 from .base import BaseModel, GuidMixin, GuidMixinQuerySet
-from api.caching.tasks import update_storage_usage
-from api.caching import settings as cache_settings
-from api.caching.utils import storage_usage_cache
 
 
 logger = logging.getLogger(__name__)
@@ -77,53 +73,19 @@ class AbstractNodeQuerySet(GuidMixinQuerySet):
 
     def get_children(self, root, active=False, include_root=False):
         # If `root` is a root node, we can use the 'descendants' related name
-        # rather than doing a recursive query
+        # rather than joining against the closure table
         if root.id == root.root_id:
             query = root.descendants.all() if include_root else root.descendants.exclude(id=root.id)
             if active:
                 query = query.filter(is_deleted=False)
             return query
-        else:
-            sql = """
-                WITH RECURSIVE descendants AS (
-                SELECT
-                    parent_id,
-                    child_id,
-                    1 AS LEVEL,
-                    ARRAY[parent_id] as pids
-                FROM %s
-                %s
-                WHERE is_node_link IS FALSE AND parent_id = %s %s
-                UNION ALL
-                SELECT
-                    d.parent_id,
-                    s.child_id,
-                    d.level + 1,
-                    d.pids || s.parent_id
-                FROM descendants AS d
-                    JOIN %s AS s
-                    ON d.child_id = s.parent_id
-                WHERE s.is_node_link IS FALSE AND %s = ANY(pids)
-                ) SELECT array_agg(DISTINCT child_id)
-                FROM descendants
-                WHERE parent_id = %s;
-            """
-            with connection.cursor() as cursor:
-                node_relation_table = AsIs(NodeRelation._meta.db_table)
-                cursor.execute(sql, [
-                    node_relation_table,
-                    AsIs('LEFT JOIN osf_abstractnode ON {}.child_id = osf_abstractnode.id'.format(node_relation_table) if active else ''),
-                    root.pk,
-                    AsIs('AND osf_abstractnode.is_deleted IS FALSE' if active else ''),
-                    node_relation_table,
-                    root.pk,
-                    root.pk])
-                row = cursor.fetchone()[0]
-                if not row:
-                    return AbstractNode.objects.filter(id=root.pk) if include_root else AbstractNode.objects.none()
-                if include_root:
-                    row.append(root.pk)
-                return AbstractNode.objects.filter(id__in=row)
+        descendant_ids = NodeTreeClosure.objects.filter(ancestor_id=root.pk).values('descendant_id')
+        query = Q(id__in=descendant_ids)
+        if active:
+            query &= Q(is_deleted=False)
+        if include_root:
+            query |= Q(id=root.pk)
+        return AbstractNode.objects.filter(query)
 
     def can_view(self, user=None, private_link=None):
         qs = self.filter(is_public=True)
@@ -142,23 +104,7 @@ class AbstractNodeQuerySet(GuidMixinQuerySet):
             if not isinstance(user, int):
                 raise TypeError('"user" must be either {} or {}. Got {!r}'.format(int, OSFUser, user))
 
-            sqs = Contributor.objects.filter(node=models.OuterRef('pk'), user__id=user, read=True)
-            qs |= self.annotate(can_view=models.Exists(sqs)).filter(can_view=True)
-            qs |= self.extra(where=["""
-                "osf_abstractnode".id in (
-                    WITH RECURSIVE implicit_read AS (
-                        SELECT "osf_contributor"."node_id"
-                        FROM "osf_contributor"
-                        WHERE "osf_contributor"."user_id" = %s
-                        AND "osf_contributor"."admin" is TRUE
-                    UNION ALL
-                        SELECT "osf_noderelation"."child_id"
-                        FROM "implicit_read"
-                        LEFT JOIN "osf_noderelation" ON "osf_noderelation"."parent_id" = "implicit_read"."node_id"
-                        WHERE "osf_noderelation"."is_node_link" IS FALSE
-                    ) SELECT * FROM implicit_read
-                )
-            """], params=(user, ))
+            qs |= self.filter(id__in=get_readable_node_ids(user))
 
         return qs
 
@@ -668,8 +614,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
     def bulk_update_search(cls, nodes, index=None):
         from website import search
         try:
-            serialize = functools.partial(search.search.update_node, index=index, bulk=True, async_update=False)
-            search.search.bulk_update_nodes(serialize, nodes, index=index)
+            search.search.bulk_index(AbstractNode.objects.filter(id__in=[node.id for node in nodes]), index=index)
         except search.exceptions.SearchUnavailableError as e:
             logger.exception(e)
             log_exception()
@@ -789,9 +734,23 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
             ) & Q(should_hide=False)
         )
 
+    def get_aggregate_logs_feed_queryset(self, auth):
+        """The logs of this node and its readable components, read from NodeLogFeedEntry in the order
+        of its index instead of sorting the logs of every component.
+        """
+        readable = Node.objects.get_children(self).can_view(user=auth.user, private_link=auth.private_link).values('id')
+        return NodeLog.objects.filter(
+            Q(feed_entries__node_id=self.id) | Q(feed_entries__node_id__in=readable),
+            feed_entries__feed_node_id=self.id,
+            should_hide=False,
+        ).annotate(feed_date=F('feed_entries__date')).order_by('-feed_date', '-id')
+
     def get_aggregate_logs_queryset(self, auth):
-        query = self.get_aggregate_logs_query(auth)
-        return NodeLog.objects.filter(query).order_by('-date').include(
+        if NodeLogFeedEntry.is_enabled():
+            queryset = self.get_aggregate_logs_feed_queryset(auth)
+        else:
+            queryset = NodeLog.objects.filter(self.get_aggregate_logs_query(auth)).order_by('-date')
+        return queryset.include(
             'node__guids', 'user__guids', 'original_node__guids', limit_includes=10
         )
 
@@ -832,22 +791,35 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         """ Returns a generator of first descendant node(s) readable by <user>
         in each descendant branch.
         """
-        new_branches = []
-        for node in self.nodes_primary.filter(is_deleted=False):
-            if node.can_view(auth):
-                yield node
-            else:
-                new_branches.append(node)
+        descendant_ids = NodeTreeClosure.objects.filter(ancestor=self).values('descendant_id')
+        relations = NodeRelation.objects.filter(
+            child_id__in=descendant_ids,
+            is_node_link=False,
+            child__is_deleted=False,
+        ).select_related('child').order_by('parent_id', '_order')
+        children_by_parent = {}
+        for relation in relations:
+            children_by_parent.setdefault(relation.parent_id, []).append(relation.child)
+
+        def find_in_branch(parent_id):
+            new_branches = []
+            for node in children_by_parent.get(parent_id, []):
+                if node.can_view(auth):
+                    yield node
+                else:
+                    new_branches.append(node)
+
+            for bnode in new_branches:
+                for node in find_in_branch(bnode.id):
+                    yield node
 
-        for bnode in new_branches:
-            for node in bnode.find_readable_descendants(auth):
-                yield node
+        return find_in_branch(self.id)
 
     @property
     def parents(self):
-        if self.parent_node:
-            return [self.parent_node] + self.parent_node.parents
-        return []
+        ancestor_closures = (NodeTreeClosure.objects.filter(descendant=self)
+                             .select_related('ancestor').order_by('depth'))
+        return [closure.ancestor for closure in ancestor_closures]
 
     @property
     def parent_admin_contributor_ids(self):
@@ -1233,39 +1205,11 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
         return self.private_links.filter(is_deleted=True).values_list('key', flat=True)
 
     def get_root(self):
-        sql = """
-            WITH RECURSIVE ascendants AS (
-              SELECT
-                parent_id,
-                child_id,
-                1 AS LEVEL,
-                ARRAY[child_id] as cids
-              FROM %s
-              WHERE is_node_link IS FALSE and child_id = %s
-              UNION ALL
-              SELECT
-                S.parent_id,
-                D.child_id,
-                D.level + 1,
-                D.cids || S.child_id
-              FROM ascendants AS D
-                JOIN %s AS S
-                  ON D.parent_id = S.child_id
-              WHERE S.is_node_link IS FALSE
-                AND %s = ANY(cids)
-            ) SELECT parent_id
-              FROM ascendants
-              WHERE child_id = %s
-              ORDER BY level DESC
-              LIMIT 1;
-        """
-        with connection.cursor() as cursor:
-            node_relation_table = AsIs(NodeRelation._meta.db_table)
-            cursor.execute(sql, [node_relation_table, self.pk, node_relation_table, self.pk, self.pk])
-            res = cursor.fetchone()
-            if res:
-                return AbstractNode.objects.get(pk=res[0])
-            return self
+        root_id = (NodeTreeClosure.objects.filter(descendant_id=self.pk)
+                   .order_by('-depth').values_list('ancestor_id', flat=True).first())
+        if root_id:
+            return AbstractNode.objects.get(pk=root_id)
+        return self
 
     def find_readable_antecedent(self, auth):
         """ Returns first antecendant node readable by <user>.
@@ -1284,6 +1228,8 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
             contrib.node = self
             contribs.append(contrib)
         Contributor.objects.bulk_create(contribs)
+        # bulk_create doesn't send post_save
+        clear_readable_node_ids_cache()
 
     def register_node(self, schema, auth, data, parent=None, child_ids=None, provider=None):
         """Make a frozen copy of a node.
@@ -1639,6 +1585,7 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
                 for log in page
             ]
             NodeLog.objects.bulk_create(logs_to_create)
+            NodeLogFeedEntry.add_logs([log.id for log in logs_to_create])
 
     def use_as_template(self, auth, changes=None, top_level=True, parent=None):
         """Create a new project, using an existing project as a template.
@@ -2227,14 +2174,10 @@ class AbstractNode(DirtyFieldsMixin, TypedModel, AddonModelMixin, IdentifierMixi
 
     @property
     def storage_usage(self):
-        key = cache_settings.STORAGE_USAGE_KEY.format(target_id=self._id)
-
-        storage_usage_total = storage_usage_cache.get(key)
-        if storage_usage_total:
-            return storage_usage_total
-        else:
-            update_storage_usage(self)  # sets cache
-            return storage_usage_cache.get(key)
+        if self.is_quickfiles:
+            return None
+        NodeStorageUsage = apps.get_model('osf.NodeStorageUsage')
+        return NodeStorageUsage.get_totals([self.id])[self.id]
 
 
 class Node(AbstractNode):
@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, connection
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
 
+from osf.utils.node_permissions import clear_readable_node_ids_cache
 from .base import BaseModel, ObjectIDMixin
+from .nodelog import NodeLogFeedEntry
 
 
 class NodeRelation(ObjectIDMixin, BaseModel):
@@ -25,3 +29,112 @@ class NodeRelation(ObjectIDMixin, BaseModel):
         index_together = (
             ('is_node_link', 'child', 'parent'),
         )
+
+
+class NodeTreeClosure(models.Model):
+    """Transitive closure of the component tree (NodeRelations where is_node_link is False).
+
+    Contains one row for every (ancestor, descendant) pair, with ``depth`` being the number of
+    edges between them (a direct child has depth 1). Nodes are not stored as their own ancestors.
+    Rows are maintained by the NodeRelation signal handlers below; do not write to this table directly.
+    """
+    ancestor = models.ForeignKey('AbstractNode', related_name='descendant_closures', on_delete=models.CASCADE)
+    descendant = models.ForeignKey('AbstractNode', related_name='ancestor_closures', on_delete=models.CASCADE)
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        index_together = (
+            ('ancestor', 'depth'),
+            ('descendant', 'depth'),
+        )
+
+    def __unicode__(self):
+        return 'ancestor={}, descendant={}, depth={}'.format(self.ancestor_id, self.descendant_id, self.depth)
+
+    @classmethod
+    def link(cls, parent_id, child_id):
+        """Attach the subtree rooted at ``child_id`` underneath ``parent_id``."""
+        sql = """
+            INSERT INTO "{table}" (ancestor_id, descendant_id, depth)
+            SELECT A.ancestor_id, D.descendant_id, A.depth + D.depth + 1
+            FROM (
+                SELECT ancestor_id, depth FROM "{table}" WHERE descendant_id = %(parent)s
+                UNION ALL SELECT %(parent)s, 0
+            ) AS A CROSS JOIN (
+                SELECT descendant_id, depth FROM "{table}" WHERE ancestor_id = %(child)s
+                UNION ALL SELECT %(child)s, 0
+            ) AS D
+            ON CONFLICT (ancestor_id, descendant_id) DO NOTHING;
+        """.format(table=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'parent': parent_id, 'child': child_id})
+        NodeLogFeedEntry.link(parent_id, child_id)
+        clear_readable_node_ids_cache()
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the entire table from NodeRelations. Intended for repair and benchmarking only."""
+        sql = """
+            DELETE FROM "{table}";
+            INSERT INTO "{table}" (ancestor_id, descendant_id, depth)
+            WITH RECURSIVE closure (ancestor_id, descendant_id, depth) AS (
+                SELECT parent_id, child_id, 1
+                FROM "{noderelation}"
+                WHERE is_node_link IS FALSE
+              UNION ALL
+                SELECT C.ancestor_id, R.child_id, C.depth + 1
+                FROM closure AS C
+                  JOIN "{noderelation}" AS R ON R.parent_id = C.descendant_id
+                WHERE R.is_node_link IS FALSE
+            ) SELECT ancestor_id, descendant_id, MIN(depth)
+            FROM closure
+            GROUP BY ancestor_id, descendant_id;
+        """.format(table=cls._meta.db_table, noderelation=NodeRelation._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+        clear_readable_node_ids_cache()
+
+    @classmethod
+    def unlink(cls, parent_id, child_id):
+        """Detach the subtree rooted at ``child_id`` from ``parent_id`` and all of its ancestors."""
+        sql = """
+            DELETE FROM "{table}"
+            WHERE descendant_id IN (
+                SELECT descendant_id FROM "{table}" WHERE ancestor_id = %(child)s
+                UNION ALL SELECT %(child)s
+            ) AND ancestor_id IN (
+                SELECT ancestor_id FROM "{table}" WHERE descendant_id = %(parent)s
+                UNION ALL SELECT %(parent)s
+            );
+        """.format(table=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'parent': parent_id, 'child': child_id})
+        NodeLogFeedEntry.unlink(parent_id, child_id)
+        clear_readable_node_ids_cache()
+
+
+@receiver(pre_save, sender=NodeRelation)
+def detach_moved_node_relation(sender, instance, raw=False, **kwargs):
+    """If an existing component relation is repointed (i.e. a node is moved), drop its old closure rows."""
+    if raw or not instance.pk:
+        return
+    previous = NodeRelation.objects.filter(pk=instance.pk).values('parent_id', 'child_id', 'is_node_link').first()
+    if not previous or previous['is_node_link']:
+        return
+    if (previous['parent_id'], previous['child_id'], previous['is_node_link']) != (instance.parent_id, instance.child_id, instance.is_node_link):
+        NodeTreeClosure.unlink(previous['parent_id'], previous['child_id'])
+
+
+@receiver(post_save, sender=NodeRelation)
+def attach_node_relation(sender, instance, raw=False, **kwargs):
+    if raw or instance.is_node_link:
+        return
+    NodeTreeClosure.link(instance.parent_id, instance.child_id)
+
+
+@receiver(post_delete, sender=NodeRelation)
+def detach_node_relation(sender, instance, **kwargs):
+    if instance.is_node_link:
+        return
+    NodeTreeClosure.unlink(instance.parent_id, instance.child_id)
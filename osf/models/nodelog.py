@@ -1,8 +1,12 @@
 from include import IncludeManager
+import waffle
 
 from django.apps import apps
-from django.db import models
+from django.db import connection, models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils import timezone
+from osf import features
 from osf.models.base import BaseModel, ObjectIDMixin
 from osf.utils.datetime_aware_jsonfield import DateTimeAwareJSONField
 from osf.utils.fields import NonNaiveDateTimeField
@@ -181,3 +185,101 @@ class NodeLog(ObjectIDMixin, BaseModel):
 
     def _natural_key(self):
         return self._id
+
+
+class NodeLogFeedEntry(models.Model):
+    """The logs of a node and all of its components, for aggregate log pages.
+
+    Contains one row for every log and each node whose aggregate feed includes it: the node the log
+    is on and all of its ancestors in NodeTreeClosure. The log's node and date are copied so that
+    a feed can be read in date order with a range scan of one index. Hidden logs are left out.
+    Rows are maintained when logs are saved and by ``NodeTreeClosure.link``/``unlink``.
+
+    Reads go through the feed while the node_log_feed switch is on; turn it on after running the
+    backfill_node_log_feed command.
+    """
+    feed_node = models.ForeignKey('AbstractNode', related_name='+', db_index=False, on_delete=models.CASCADE)
+    log = models.ForeignKey('NodeLog', related_name='feed_entries', on_delete=models.CASCADE)
+    node = models.ForeignKey('AbstractNode', related_name='+', on_delete=models.CASCADE)
+    date = NonNaiveDateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('feed_node', 'log')
+        index_together = (
+            ('feed_node', 'date', 'log'),
+        )
+
+    def __unicode__(self):
+        return 'feed_node={}, log={}, node={}'.format(self.feed_node_id, self.log_id, self.node_id)
+
+    @classmethod
+    def is_enabled(cls):
+        return waffle.switch_is_active(features.NODE_LOG_FEED)
+
+    @classmethod
+    def add_logs(cls, log_ids):
+        """Add the logs ``log_ids`` to the feeds of their nodes and of those nodes' ancestors."""
+        sql = """
+            INSERT INTO "{table}" (feed_node_id, log_id, node_id, date)
+            SELECT F.feed_node_id, L.id, L.node_id, L.date
+            FROM "{nodelog}" AS L
+            CROSS JOIN LATERAL (
+                SELECT L.node_id AS feed_node_id
+                UNION ALL SELECT ancestor_id FROM "{closure}" WHERE descendant_id = L.node_id
+            ) AS F
+            WHERE L.id = ANY(%(log_ids)s) AND L.node_id IS NOT NULL AND L.should_hide IS FALSE
+            ON CONFLICT (feed_node_id, log_id) DO NOTHING;
+        """.format(table=cls._meta.db_table, nodelog=NodeLog._meta.db_table, closure=cls._closure_table())
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'log_ids': list(log_ids)})
+
+    @classmethod
+    def remove_logs(cls, log_ids):
+        cls.objects.filter(log_id__in=log_ids).delete()
+
+    @classmethod
+    def link(cls, parent_id, child_id):
+        """Add the logs of the subtree rooted at ``child_id`` to the feeds of ``parent_id`` and its ancestors."""
+        sql = """
+            INSERT INTO "{table}" (feed_node_id, log_id, node_id, date)
+            SELECT A.ancestor_id, F.log_id, F.node_id, F.date
+            FROM (
+                SELECT ancestor_id FROM "{closure}" WHERE descendant_id = %(parent)s
+                UNION ALL SELECT %(parent)s
+            ) AS A CROSS JOIN (
+                SELECT log_id, node_id, date FROM "{table}"
+                WHERE feed_node_id = %(child)s
+            ) AS F
+            ON CONFLICT (feed_node_id, log_id) DO NOTHING;
+        """.format(table=cls._meta.db_table, closure=cls._closure_table())
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'parent': parent_id, 'child': child_id})
+
+    @classmethod
+    def unlink(cls, parent_id, child_id):
+        """Remove the logs of the subtree rooted at ``child_id`` from the feeds of ``parent_id`` and its ancestors."""
+        sql = """
+            DELETE FROM "{table}"
+            WHERE feed_node_id IN (
+                SELECT ancestor_id FROM "{closure}" WHERE descendant_id = %(parent)s
+                UNION ALL SELECT %(parent)s
+            ) AND log_id IN (
+                SELECT log_id FROM "{table}" WHERE feed_node_id = %(child)s
+            );
+        """.format(table=cls._meta.db_table, closure=cls._closure_table())
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'parent': parent_id, 'child': child_id})
+
+    @staticmethod
+    def _closure_table():
+        return apps.get_model('osf.NodeTreeClosure')._meta.db_table
+
+
+@receiver(post_save, sender=NodeLog)
+def node_log_feed_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        # The date, node or visibility of the log may have changed
+        NodeLogFeedEntry.remove_logs([instance.pk])
+    NodeLogFeedEntry.add_logs([instance.pk])
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import functools
 import urlparse
 import logging
 import re
@@ -985,8 +984,7 @@ class Preprint(DirtyFieldsMixin, GuidMixin, IdentifierMixin, ReviewableMixin, Ba
     def bulk_update_search(cls, preprints, index=None):
         from website import search
         try:
-            serialize = functools.partial(search.search.update_preprint, index=index, bulk=True, async_update=False)
-            search.search.bulk_update_nodes(serialize, preprints, index=index)
+            search.search.bulk_index(Preprint.objects.filter(id__in=[preprint.id for preprint in preprints]), index=index)
         except search.exceptions.SearchUnavailableError as e:
             logger.exception(e)
             log_exception()
@@ -0,0 +1,84 @@
+from django.db import connection, models
+
+from osf.utils.fields import NonNaiveDateTimeField
+
+
+class SearchIndexQueueEntry(models.Model):
+    """A node or preprint with a search index update waiting in website.search.index_queue.
+
+    Rows are written with single upsert/delete statements outside of request transactions, so
+    concurrent requests never wait on each other's uncommitted entries, and unlike a cache they
+    are never evicted to make room for others. ``superseded`` entries were deleted from the
+    index after the update was queued and are skipped when claimed.
+    """
+    doc_type = models.CharField(max_length=16)
+    object_id = models.IntegerField()
+    superseded = models.BooleanField(default=False)
+    armed = NonNaiveDateTimeField()
+
+    class Meta:
+        unique_together = ('doc_type', 'object_id')
+
+    def __unicode__(self):
+        return 'doc_type={}, object_id={}, superseded={}'.format(self.doc_type, self.object_id, self.superseded)
+
+    @classmethod
+    def arm(cls, keys, stale_after):
+        """Mark the (doc_type, object id) ``keys`` as pending and return the ones that were not already.
+
+        Superseded entries and entries older than ``stale_after`` seconds, whose flush was
+        presumably lost, are armed again and returned as well.
+        """
+        if not keys:
+            return []
+        keys = sorted(set(keys))  # Lock rows in a consistent order
+        sql = """
+            INSERT INTO "{table}" (doc_type, object_id, superseded, armed)
+            SELECT K.doc_type, K.object_id, FALSE, now()
+            FROM unnest(%(doc_types)s::varchar[], %(object_ids)s::int[]) AS K (doc_type, object_id)
+            ON CONFLICT (doc_type, object_id) DO UPDATE SET superseded = FALSE, armed = now()
+            WHERE "{table}".superseded OR "{table}".armed < now() - make_interval(secs => %(stale_after)s)
+            RETURNING doc_type, object_id;
+        """.format(table=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'doc_types': [doc_type for doc_type, _ in keys],
+                'object_ids': [object_id for _, object_id in keys],
+                'stale_after': stale_after,
+            })
+            return sorted(cursor.fetchall())
+
+    @classmethod
+    def supersede(cls, keys):
+        """Mark the pending entries for ``keys`` as superseded. Returns how many were pending."""
+        if not keys:
+            return 0
+        sql = """
+            UPDATE "{table}" AS E SET superseded = TRUE
+            FROM unnest(%(doc_types)s::varchar[], %(object_ids)s::int[]) AS K (doc_type, object_id)
+            WHERE E.doc_type = K.doc_type AND E.object_id = K.object_id AND NOT E.superseded;
+        """.format(table=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'doc_types': [doc_type for doc_type, _ in keys],
+                'object_ids': [object_id for _, object_id in keys],
+            })
+            return cursor.rowcount
+
+    @classmethod
+    def claim(cls, keys):
+        """Delete the entries for ``keys`` and return the ones that were not superseded."""
+        if not keys:
+            return []
+        sql = """
+            DELETE FROM "{table}" AS E
+            USING unnest(%(doc_types)s::varchar[], %(object_ids)s::int[]) AS K (doc_type, object_id)
+            WHERE E.doc_type = K.doc_type AND E.object_id = K.object_id
+            RETURNING E.doc_type, E.object_id, E.superseded;
+        """.format(table=cls._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'doc_types': [doc_type for doc_type, _ in keys],
+                'object_ids': [object_id for _, object_id in keys],
+            })
+            return sorted((doc_type, object_id) for doc_type, object_id, superseded in cursor.fetchall() if not superseded)
@@ -13,11 +13,37 @@ from website import settings
 logger = logging.getLogger(__name__)
 
 
+_clients = {}
+
+
 def _get_client():
-    return akismet.AkismetClient(
-        apikey=settings.AKISMET_APIKEY,
-        website=settings.DOMAIN,
-        verify=True
+    """Return the Akismet client for the current settings, shared within the process so that its
+    connections are reused.
+    """
+    key = (settings.AKISMET_APIKEY, settings.DOMAIN, settings.AKISMET_URL)
+    if key not in _clients:
+        _clients[key] = akismet.AkismetClient(
+            apikey=settings.AKISMET_APIKEY,
+            website=settings.DOMAIN,
+            verify=True,
+            base_url=settings.AKISMET_URL,
+            max_concurrent_requests=settings.AKISMET_MAX_CONCURRENT_REQUESTS,
+        )
+    return _clients[key]
+
+
+def check_content(client, author, author_email, content, request_headers):
+    """Ask Akismet whether ``content`` is spam. Returns an (is_spam, pro_tip) tuple.
+
+    :raises: AkismetClientError
+    """
+    return client.check_comment(
+        user_ip=request_headers['Remote-Addr'],
+        user_agent=request_headers.get('User-Agent'),
+        referrer=request_headers.get('Referer'),
+        comment_content=content,
+        comment_author=author,
+        comment_author_email=author_email
     )
 
 
@@ -190,31 +216,25 @@ class SpamMixin(models.Model):
             return True
 
         client = _get_client()
-        remote_addr = request_headers['Remote-Addr']
-        user_agent = request_headers.get('User-Agent')
-        referer = request_headers.get('Referer')
         try:
-            is_spam, pro_tip = client.check_comment(
-                user_ip=remote_addr,
-                user_agent=user_agent,
-                referrer=referer,
-                comment_content=content,
-                comment_author=author,
-                comment_author_email=author_email
-            )
+            is_spam, pro_tip = check_content(client, author, author_email, content, request_headers)
         except akismet.AkismetClientError:
             logger.exception('Error performing SPAM check')
             return False
         if update:
-            self.spam_pro_tip = pro_tip
-            self.spam_data['headers'] = {
-                'Remote-Addr': remote_addr,
-                'User-Agent': user_agent,
-                'Referer': referer,
-            }
-            self.spam_data['content'] = content
-            self.spam_data['author'] = author
-            self.spam_data['author_email'] = author_email
-            if is_spam:
-                self.flag_spam()
+            self.record_spam_check(is_spam, pro_tip, author, author_email, content, request_headers)
         return is_spam
+
+    def record_spam_check(self, is_spam, pro_tip, author, author_email, content, request_headers):
+        """Store what was sent to Akismet and its answer, and flag this object if it is spam."""
+        self.spam_pro_tip = pro_tip
+        self.spam_data['headers'] = {
+            'Remote-Addr': request_headers['Remote-Addr'],
+            'User-Agent': request_headers.get('User-Agent'),
+            'Referer': request_headers.get('Referer'),
+        }
+        self.spam_data['content'] = content
+        self.spam_data['author'] = author
+        self.spam_data['author_email'] = author_email
+        if is_spam:
+            self.flag_spam()
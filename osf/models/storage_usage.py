@@ -0,0 +1,211 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models
+from django.db.models.signals import m2m_changed, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from osf.models.files import BaseFileNode, FileVersion
+
+# Only live OsfStorage files on nodes count towards storage usage; trashed files,
+# other providers, preprints and quickfiles do not.
+COUNTED_FILE_TYPE = 'osf.osfstoragefile'
+
+
+def get_node_content_type_id():
+    from osf.models import AbstractNode
+    return ContentType.objects.get_for_model(AbstractNode).id
+
+
+class NodeStorageUsage(models.Model):
+    """Running total of the size of all versions of the live OsfStorage files on a node, per region.
+
+    Equivalent to ``node.files.aggregate(Sum('versions__size'))`` split by ``FileVersion.region``,
+    but maintained by the signal handlers below as files and versions change, in the same
+    transaction as the change. ``reconcile`` recomputes totals from scratch to detect drift.
+    """
+    node = models.ForeignKey('AbstractNode', related_name='storage_usage_counters', on_delete=models.CASCADE)
+    # Null for versions created before regions existed
+    region = models.ForeignKey('addons_osfstorage.Region', null=True, blank=True, on_delete=models.CASCADE)
+    total = models.BigIntegerField(default=0)
+
+    # (node, region) is unique, enforced by an index on (node_id, COALESCE(region_id, -1)) created in
+    # the migration so that rows with no region conflict with each other in ``adjust``
+
+    def __unicode__(self):
+        return 'node={}, region={}, total={}'.format(self.node_id, self.region_id, self.total)
+
+    @classmethod
+    def adjust(cls, sign, file_ids=None, version_ids=None):
+        """Add (sign=1) or subtract (sign=-1) the sizes of the versions linked to ``file_ids``
+        and/or ``version_ids``, as currently stored in the database.
+        """
+        where = []
+        params = {'sign': sign, 'file_type': COUNTED_FILE_TYPE, 'content_type': get_node_content_type_id()}
+        if file_ids is not None:
+            where.append('T.basefilenode_id = ANY(%(file_ids)s)')
+            params['file_ids'] = list(file_ids)
+        if version_ids is not None:
+            where.append('T.fileversion_id = ANY(%(version_ids)s)')
+            params['version_ids'] = list(version_ids)
+        sql = """
+            INSERT INTO "{table}" (node_id, region_id, total)
+            SELECT F.target_object_id, V.region_id, %(sign)s * SUM(V.size)
+            FROM "{through}" AS T
+              JOIN "{files}" AS F ON F.id = T.basefilenode_id
+              JOIN "{versions}" AS V ON V.id = T.fileversion_id
+            WHERE F.type = %(file_type)s AND F.target_content_type_id = %(content_type)s AND V.size IS NOT NULL AND {where}
+            GROUP BY F.target_object_id, V.region_id
+            ON CONFLICT (node_id, COALESCE(region_id, -1)) DO UPDATE SET total = "{table}".total + EXCLUDED.total;
+        """.format(
+            table=cls._meta.db_table,
+            through=BaseFileNode.versions.through._meta.db_table,
+            files=BaseFileNode._meta.db_table,
+            versions=FileVersion._meta.db_table,
+            where=' AND '.join(where),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    @classmethod
+    def get_totals(cls, node_ids):
+        """Return {node id: total bytes} for ``node_ids`` in one query. Nodes without files map to 0."""
+        totals = dict(
+            cls.objects.filter(node_id__in=node_ids)
+            .values('node_id')
+            .annotate(sum=models.Sum('total'))
+            .values_list('node_id', 'sum')
+        )
+        return {node_id: int(totals.get(node_id) or 0) for node_id in node_ids}
+
+    @classmethod
+    def get_region_totals(cls, node_id):
+        """Return {region id: total bytes} for ``node_id``."""
+        return dict(cls.objects.filter(node_id=node_id, total__gt=0).values_list('region_id', 'total'))
+
+    @classmethod
+    def get_aggregate_totals(cls, node_ids):
+        """Recompute {(node id, region id): total} for ``node_ids`` from the files themselves."""
+        sql = """
+            SELECT F.target_object_id, V.region_id, SUM(V.size)
+            FROM "{through}" AS T
+              JOIN "{files}" AS F ON F.id = T.basefilenode_id
+              JOIN "{versions}" AS V ON V.id = T.fileversion_id
+            WHERE F.type = %(file_type)s AND F.target_content_type_id = %(content_type)s
+              AND F.target_object_id = ANY(%(node_ids)s) AND V.size IS NOT NULL
+            GROUP BY F.target_object_id, V.region_id;
+        """.format(
+            through=BaseFileNode.versions.through._meta.db_table,
+            files=BaseFileNode._meta.db_table,
+            versions=FileVersion._meta.db_table,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {'file_type': COUNTED_FILE_TYPE, 'content_type': get_node_content_type_id(), 'node_ids': list(node_ids)})
+            return {(node_id, region_id): total for node_id, region_id, total in cursor.fetchall()}
+
+    @classmethod
+    def reconcile(cls, node_ids, fix=False):
+        """Compare the counters for ``node_ids`` against the aggregate over their files.
+
+        Returns {(node id, region id): (counter, aggregate)} for every mismatch. With ``fix``,
+        the counters are overwritten with the aggregate.
+        """
+        expected = cls.get_aggregate_totals(node_ids)
+        actual = {
+            (node_id, region_id): total
+            for node_id, region_id, total in cls.objects.filter(node_id__in=node_ids).values_list('node_id', 'region_id', 'total')
+        }
+        drift = {}
+        for key in set(expected) | set(actual):
+            if expected.get(key, 0) != actual.get(key, 0):
+                drift[key] = (actual.get(key, 0), expected.get(key, 0))
+        if fix and drift:
+            drifted = set(node_id for node_id, _ in drift)
+            cls.objects.filter(node_id__in=drifted).delete()
+            cls.objects.bulk_create([
+                cls(node_id=node_id, region_id=region_id, total=total)
+                for (node_id, region_id), total in expected.items()
+                if node_id in drifted
+            ])
+        return drift
+
+
+def get_counted_node_id(state):
+    """Given a file's (type, target content type id, target id), return the id of the node its
+    versions count towards, or None.
+    """
+    file_type, content_type_id, object_id = state
+    if file_type == COUNTED_FILE_TYPE and content_type_id == get_node_content_type_id():
+        return object_id
+    return None
+
+
+def file_storage_usage_pre_save(sender, instance, raw=False, **kwargs):
+    """Trashing, restoring or moving a file to another target takes its versions off the old node's counter.
+
+    Relies on the state recorded by ``from_db`` and ``get_storage_usage_state``; objects whose
+    original state is unknown are left alone and picked up by ``NodeStorageUsage.reconcile``.
+    """
+    if raw or not instance.pk or not isinstance(instance, (BaseFileNode, FileVersion)):
+        return
+    previous = getattr(instance, '_storage_usage_state', None)
+    current = instance.get_storage_usage_state()
+    if isinstance(instance, BaseFileNode):
+        changed = previous is not None and get_counted_node_id(previous) != get_counted_node_id(current)
+    else:
+        changed = previous is not None and previous != current
+    instance._storage_usage_changed = changed
+    if changed:
+        if isinstance(instance, BaseFileNode):
+            NodeStorageUsage.adjust(-1, file_ids=[instance.pk])
+        else:
+            NodeStorageUsage.adjust(-1, version_ids=[instance.pk])
+
+
+def file_storage_usage_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if not isinstance(instance, (BaseFileNode, FileVersion)):
+        return
+    if getattr(instance, '_storage_usage_changed', False):
+        if isinstance(instance, BaseFileNode):
+            NodeStorageUsage.adjust(1, file_ids=[instance.pk])
+        else:
+            NodeStorageUsage.adjust(1, version_ids=[instance.pk])
+    instance._storage_usage_state = instance.get_storage_usage_state()
+    instance._storage_usage_changed = False
+
+
+@receiver(m2m_changed, sender=BaseFileNode.versions.through)
+def file_versions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Versions added to or removed from files, e.g. by create_version or copying a file."""
+    if action == 'post_add':
+        sign = 1
+    elif action in ('pre_remove', 'pre_clear'):
+        sign = -1
+    else:
+        return
+    if reverse:
+        NodeStorageUsage.adjust(sign, file_ids=pk_set, version_ids=[instance.pk])
+    else:
+        NodeStorageUsage.adjust(sign, file_ids=[instance.pk], version_ids=pk_set)
+
+
+def file_storage_usage_pre_delete(sender, instance, **kwargs):
+    if isinstance(instance, BaseFileNode):
+        NodeStorageUsage.adjust(-1, file_ids=[instance.pk])
+    elif isinstance(instance, FileVersion):
+        NodeStorageUsage.adjust(-1, version_ids=[instance.pk])
+
+
+def connect_storage_usage_receivers():
+    """Connect the save and delete receivers above to BaseFileNode, FileVersion and their subclasses.
+
+    Signals are sent with the concrete (typed) class as sender, so each file class is registered
+    rather than receiving every model's saves. Called from the osf app's ``ready``, once the
+    addons' file classes are loaded.
+    """
+    from django.apps import apps
+    for model in apps.get_models():
+        if issubclass(model, (BaseFileNode, FileVersion)):
+            pre_save.connect(file_storage_usage_pre_save, sender=model)
+            post_save.connect(file_storage_usage_post_save, sender=model)
+            pre_delete.connect(file_storage_usage_pre_delete, sender=model)
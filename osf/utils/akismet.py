@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
 
 
 class AkismetClientError(Exception):
@@ -11,14 +14,26 @@ class AkismetClientError(Exception):
 
 
 class AkismetClient(object):
+    """Client for the Akismet API.
+
+    Requests go through one session so that connections are kept alive and reused, and at most
+    ``max_concurrent_requests`` are in flight at once when the client is shared between threads.
+    ``base_url`` replaces the Akismet API, e.g. with a local fake server in tests.
+    """
 
     API_PROTOCOL = 'https://'
     API_HOST = 'rest.akismet.com'
 
-    def __init__(self, apikey, website, verify=False):
+    def __init__(self, apikey, website, verify=False, base_url=None, max_concurrent_requests=4):
         self.apikey = apikey
         self.website = website
+        self.base_url = base_url.rstrip('/') if base_url else None
         self._apikey_is_valid = None
+        self._semaphore = threading.BoundedSemaphore(max_concurrent_requests)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_requests)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         if verify:
             self._verify_apikey()
 
@@ -28,17 +43,28 @@ class AkismetClient(object):
             'content-type': 'application/x-www-form-urlencoded'
         }
 
+    def _url(self, method, keyed=True):
+        if self.base_url:
+            return '{}/1.1/{}'.format(self.base_url, method)
+        if keyed:
+            return '{}{}.{}/1.1/{}'.format(self.API_PROTOCOL, self.apikey, self.API_HOST, method)
+        return '{}{}/1.1/{}'.format(self.API_PROTOCOL, self.API_HOST, method)
+
+    def _post(self, method, data, keyed=True, **kwargs):
+        with self._semaphore:
+            return self.session.post(self._url(method, keyed=keyed), data=data, headers=self._default_headers, **kwargs)
+
     def _is_apikey_valid(self):
         if self._apikey_is_valid is not None:
             return self._apikey_is_valid
         else:
-            res = requests.post(
-                '{}{}/1.1/verify-key'.format(self.API_PROTOCOL, self.API_HOST),
+            res = self._post(
+                'verify-key',
                 data={
                     'key': self.apikey,
                     'blog': self.website
                 },
-                headers=self._default_headers
+                keyed=False
             )
             self._apikey_is_valid = (res.text == 'valid')
             return self._is_apikey_valid()
@@ -69,12 +95,7 @@ class AkismetClient(object):
         data['user_agent'] = user_agent
 
         try:
-            res = requests.post(
-                '{}{}.{}/1.1/comment-check'.format(self.API_PROTOCOL, self.apikey, self.API_HOST),
-                data=data,
-                headers=self._default_headers,
-                timeout=5
-            )
+            res = self._post('comment-check', data=data, timeout=5)
             res.raise_for_status()
         except requests.exceptions.RequestException as e:
             raise AkismetClientError(reason=e.args[0])
@@ -92,11 +113,7 @@ class AkismetClient(object):
         data['user_ip'] = user_ip
         data['user_agent'] = user_agent
 
-        res = requests.post(
-            '{}{}.{}/1.1/submit-spam'.format(self.API_PROTOCOL, self.apikey, self.API_HOST),
-            data=data,
-            headers=self._default_headers
-        )
+        res = self._post('submit-spam', data=data)
         if res.status_code != requests.codes.ok:
             raise AkismetClientError(reason=res.text)
 
@@ -112,10 +129,6 @@ class AkismetClient(object):
         data['user_ip'] = user_ip
         data['user_agent'] = user_agent
 
-        res = requests.post(
-            '{}{}.{}/1.1/submit-ham'.format(self.API_PROTOCOL, self.apikey, self.API_HOST),
-            data=data,
-            headers=self._default_headers
-        )
+        res = self._post('submit-ham', data=data)
         if res.status_code != requests.codes.ok:
             raise AkismetClientError(reason=res.text)
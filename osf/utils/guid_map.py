@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""A request-scoped identity map for guids and the objects they refer to.
+
+``GuidMixin._id`` queries the object's guids unless they were included with the queryset, and
+``GuidMixin.load`` and ``Guid.load`` query every time, so serializers, URL builders and permission
+checks that resolve the same guids over and over make the same queries. During a request this
+module remembers
+
+- which (content type, object id) each guid resolves to,
+- the primary guid of each (content type, object id), which is what ``_id`` returns, and
+- the instances that were loaded by guid or listed in a page of results.
+
+Entries are dropped when a guid or a guid's referent is saved or deleted (see the receivers in
+osf.models.base). Queryset ``update``/``delete`` calls that bypass signals are not seen, and
+loading an object already in the map returns the same instance. Callers that lock rows with
+``select_for_update`` always go to the database.
+
+Outside of a request every function is a no-op and lookups miss without being counted.
+"""
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+
+from osf.utils.requests import get_request_cache
+
+REQUEST_CACHE_NAMESPACE = 'guid_identity_map'
+
+
+def _get_map():
+    cache = get_request_cache(REQUEST_CACHE_NAMESPACE)
+    if cache is not None and not cache:
+        cache.update({
+            'guids': {},  # guid _id -> (content type id, object id)
+            'primary': {},  # (content type id, object id) -> guid _id
+            'instances': {},  # (content type id, object id) -> instance
+            'guid_objects': {},  # guid _id -> Guid
+            'hits': 0,
+            'misses': 0,
+        })
+    return cache
+
+
+def _key(instance):
+    return ContentType.objects.get_for_model(instance).id, instance.pk
+
+
+def _count(identity_map, hit):
+    identity_map['hits' if hit else 'misses'] += 1
+
+
+def _prefetched_guids(instance):
+    return getattr(instance, '_prefetched_objects_cache', {}).get('guids')
+
+
+def get_guid_id(instance):
+    """Return the primary guid ``_id`` of ``instance`` if it is known during this request."""
+    identity_map = _get_map()
+    if identity_map is None or not instance.pk:
+        return None
+    guid_id = identity_map['primary'].get(_key(instance))
+    _count(identity_map, guid_id is not None)
+    return guid_id
+
+
+def get_instance(model, guid_id):
+    """Return the instance of ``model`` that ``guid_id`` refers to if it was loaded during this request."""
+    identity_map = _get_map()
+    if identity_map is None or not guid_id:
+        return None
+    key = identity_map['guids'].get(guid_id.lower())
+    instance = identity_map['instances'].get(key) if key else None
+    # A guid may be looked up through a model it doesn't belong to, e.g. Registration.load on a node
+    if not isinstance(instance, model):
+        instance = None
+    _count(identity_map, instance is not None)
+    return instance
+
+
+def get_guid(guid_id):
+    """Return the Guid ``guid_id`` if it was loaded during this request."""
+    identity_map = _get_map()
+    if identity_map is None or not guid_id:
+        return None
+    guid = identity_map['guid_objects'].get(guid_id.lower())
+    _count(identity_map, guid is not None)
+    return guid
+
+
+def remember(instance, guid_id=None, primary=False):
+    """Add ``instance`` to the map, and that ``guid_id`` refers to it if given.
+
+    :param bool primary: Whether ``guid_id`` is what ``instance._id`` returns
+    """
+    identity_map = _get_map()
+    if identity_map is None or not instance.pk:
+        return
+    key = _key(instance)
+    identity_map['instances'][key] = instance
+    if guid_id:
+        guid_id = guid_id.lower()
+        identity_map['guids'][guid_id] = key
+        if primary:
+            identity_map['primary'][key] = guid_id
+
+
+def remember_guid(guid, primary=False):
+    """Add a Guid and what it resolves to to the map."""
+    identity_map = _get_map()
+    if identity_map is None or not guid.object_id:
+        return
+    key = (guid.content_type_id, guid.object_id)
+    identity_map['guid_objects'][guid._id] = guid
+    identity_map['guids'][guid._id] = key
+    if primary:
+        identity_map['primary'][key] = guid._id
+
+
+def prefetch(instances):
+    """Add a page of results to the map, with the primary guids of all of them.
+
+    Guids included with the queryset are used as they are; the rest are fetched with one query
+    per content type. Anything that is not a saved GuidMixin instance is ignored.
+    """
+    identity_map = _get_map()
+    if identity_map is None or not instances:
+        return
+    from osf.models.base import GuidMixin, Guid
+    missing = {}
+    for instance in instances:
+        if not isinstance(instance, GuidMixin) or not instance.pk:
+            continue
+        key = _key(instance)
+        identity_map['instances'][key] = instance
+        if key in identity_map['primary']:
+            continue
+        guids = _prefetched_guids(instance)
+        if guids is not None:
+            if guids:
+                identity_map['primary'][key] = guids[0]._id
+                identity_map['guids'][guids[0]._id] = key
+        else:
+            missing.setdefault(key[0], []).append(key[1])
+
+    for content_type_id, object_ids in missing.items():
+        # Guid is ordered newest first, like instance.guids.first()
+        rows = Guid.objects.filter(content_type_id=content_type_id, object_id__in=object_ids).values_list('_id', 'object_id')
+        for guid_id, object_id in rows:
+            key = (content_type_id, object_id)
+            identity_map['guids'][guid_id] = key
+            identity_map['primary'].setdefault(key, guid_id)
+
+
+def forget(instance):
+    """Drop ``instance`` from the map after it was saved or deleted.
+
+    Its guids still resolve to it until they are deleted themselves, which forget_guid handles.
+    """
+    identity_map = _get_map()
+    if identity_map is None or not instance.pk:
+        return
+    key = _key(instance)
+    identity_map['instances'].pop(key, None)
+    identity_map['primary'].pop(key, None)
+
+
+def forget_guid(guid):
+    """Drop a guid that was created, repointed or deleted, and what it used to resolve to."""
+    identity_map = _get_map()
+    if identity_map is None:
+        return
+    previous = identity_map['guids'].pop(guid._id, None)
+    identity_map['guid_objects'].pop(guid._id, None)
+    if previous and identity_map['primary'].get(previous) == guid._id:
+        identity_map['primary'].pop(previous)
+    if guid.object_id is not None:
+        # A new guid becomes the primary guid of its referent
+        identity_map['primary'].pop((guid.content_type_id, guid.object_id), None)
+
+
+def get_stats():
+    """Return the hits and misses of the map during this request, or None outside of one."""
+    identity_map = _get_map()
+    if identity_map is None:
+        return None
+    lookups = identity_map['hits'] + identity_map['misses']
+    return {
+        'hits': identity_map['hits'],
+        'misses': identity_map['misses'],
+        'hit_rate': float(identity_map['hits']) / lookups if lookups else None,
+    }
@@ -86,3 +86,25 @@ def string_type_request_headers(req):
             if isinstance(v, string_types)
         }
     return request_headers
+
+
+def get_request_cache(namespace):
+    """Return a dict that lives for the duration of the current Django or Flask request.
+
+    Returns None outside of a request, so that callers do not accidentally cache on the
+    process-global dummy request.
+    """
+    req = get_current_request()
+    if isinstance(req, DummyRequest):
+        return None
+    caches = getattr(req, '_osf_request_caches', None)
+    if caches is None:
+        caches = {}
+        setattr(req, '_osf_request_caches', caches)
+    return caches.setdefault(namespace, {})
+
+
+def clear_request_cache(namespace):
+    cache = get_request_cache(namespace)
+    if cache is not None:
+        cache.clear()
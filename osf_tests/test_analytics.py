@@ -12,13 +12,20 @@ from nose.tools import *  # noqa: F403
 from datetime import datetime
 
 from addons.osfstorage.models import OsfStorageFile
+from api.base.api_globals import api_globals
 from framework import analytics
+from framework.postcommit_tasks.handlers import postcommit_before_request, postcommit_queue
 from osf.models import PageCounter
+from osf.models.analytics import PageCounterBuffer
 
 from tests.base import OsfTestCase
 from osf_tests.factories import UserFactory, ProjectFactory
 
 
+class FakeRequest(object):
+    pass
+
+
 class TestAnalytics(OsfTestCase):
 
     def test_get_total_activity_count(self):
@@ -123,6 +130,89 @@ class TestPageCounter:
         assert page_counter.total == 0
         assert page_counter.unique == 0
 
+    @mock.patch('osf.models.analytics.session')
+    def test_update_counter_daily_counts(self, mock_session, project, file_node):
+        mock_session.data = {}
+        page_counter_id = 'download:{}:{}'.format(project._id, file_node.id)
+        today = timezone.now().strftime('%Y/%m/%d')
+
+        PageCounter.update_counter(page_counter_id, {})
+        PageCounter.update_counter(page_counter_id, {})
+
+        page_counter = PageCounter.objects.get(_id=page_counter_id)
+        assert page_counter.date[today] == {'total': 2, 'unique': 1}
+
+    def test_apply_increments_merges_days(self):
+        PageCounter.objects.create(_id='view:abcde', date={'2018/02/04': {'total': 3, 'unique': 2}}, total=3, unique=2)
+
+        PageCounter.apply_increments({
+            ('view:abcde', '2018/02/04'): (2, 1, 2, 0),
+            ('view:abcde', '2018/02/05'): (1, 1, 1, 1),
+            ('view:fghij', '2018/02/05'): (1, 1, 0, 0),
+        })
+
+        page_counter = PageCounter.objects.get(_id='view:abcde')
+        assert page_counter.date == {'2018/02/04': {'total': 5, 'unique': 3}, '2018/02/05': {'total': 1, 'unique': 1}}
+        assert (page_counter.total, page_counter.unique) == (6, 3)
+        assert PageCounter.get_basic_counters('view:fghij') == (0, 0)
+
+    @mock.patch('osf.models.analytics.session')
+    @mock.patch('osf.models.analytics.settings.PAGE_COUNTER_WRITE_BEHIND', True)
+    def test_update_counter_write_behind(self, mock_session, project, file_node):
+        mock_session.data = {}
+        page_counter_id = 'download:{}:{}'.format(project._id, file_node.id)
+        buffer = PageCounterBuffer(max_keys=100, flush_interval=3600)
+
+        with mock.patch('osf.models.analytics.get_page_counter_buffer', return_value=buffer):
+            PageCounter.update_counter(page_counter_id, {})
+            PageCounter.update_counter(page_counter_id, {})
+            assert not PageCounter.objects.filter(_id=page_counter_id).exists()
+            buffer.flush()
+
+        page_counter = PageCounter.objects.get(_id=page_counter_id)
+        assert page_counter.total == 2
+        assert page_counter.unique == 1
+
+    def test_request_increments_are_applied_after_commit(self):
+        api_globals.request = FakeRequest()
+        postcommit_before_request()
+        try:
+            PageCounter.record('view:abcde', '2018/02/04', (1, 1, 1, 1))
+            PageCounter.record('view:abcde', '2018/02/04', (1, 0, 1, 0))
+            PageCounter.record('view:fghij', '2018/02/04', (1, 1, 1, 1))
+            assert not PageCounter.objects.exists()
+            tasks = list(postcommit_queue().values())
+        finally:
+            api_globals.request = None
+
+        assert len(tasks) == 1
+        tasks[0]()
+        assert PageCounter.get_basic_counters('view:abcde') == (1, 2)
+        assert PageCounter.get_basic_counters('view:fghij') == (1, 1)
+
+    def test_buffer_sums_increments_per_page_and_day(self):
+        buffer = PageCounterBuffer(max_keys=100, flush_interval=3600)
+        buffer.add('view:abcde', '2018/02/04', (1, 1, 1, 1))
+        buffer.add('view:abcde', '2018/02/04', (1, 0, 1, 0))
+        buffer.add('view:abcde', '2018/02/05', (1, 1, 0, 0))
+
+        with mock.patch.object(PageCounter, 'apply_increments') as mock_apply:
+            buffer.flush()
+        mock_apply.assert_called_once_with({
+            ('view:abcde', '2018/02/04'): (2, 1, 2, 1),
+            ('view:abcde', '2018/02/05'): (1, 1, 0, 0),
+        })
+        assert buffer.increments == {}
+
+    def test_buffer_keeps_increments_when_flush_fails(self):
+        buffer = PageCounterBuffer(max_keys=100, flush_interval=3600)
+        buffer.add('view:abcde', '2018/02/04', (1, 1, 1, 1))
+
+        with mock.patch.object(PageCounter, 'apply_increments', side_effect=Exception):
+            buffer.flush()
+        assert buffer.increments == {('view:abcde', '2018/02/04'): (1, 1, 1, 1)}
+        buffer._timer.cancel()
+
     def test_get_all_downloads_on_date(self, page_counter, page_counter2):
         """
         This method tests that multiple pagecounter objects have their download totals summed properly.
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import datetime
 import mock
+import os
+import tempfile
 import time
 import unittest
 import logging
@@ -9,20 +12,24 @@ import functools
 
 from nose.tools import *  # noqa: F403
 import pytest
+from django.utils import timezone
 
+from api.base.api_globals import api_globals
 from framework.auth.core import Auth
+from framework.postcommit_tasks.handlers import postcommit_before_request, postcommit_queue
 
 from website import settings
 import website.search.search as search
-from website.search import elastic_search
+from website.search import elastic_search, index_queue
 from website.search.util import build_query
-from website.search_migration.migrate import migrate
+from website.search_migration.migrate import MigrationState, get_pages, migrate, run_pages
 from osf.models import (
     Retraction,
     NodeLicense,
     Tag,
     Preprint,
     QuickFilesNode,
+    SearchIndexQueueEntry,
 )
 from addons.wiki.models import WikiPage
 from addons.osfstorage.models import OsfStorageFile
@@ -37,6 +44,9 @@ from tests.utils import run_celery_tasks
 
 TEST_INDEX = 'test'
 
+class FakeRequest(object):
+    pass
+
 def query(term, raw=False):
     results = search.search(build_query(term), index=elastic_search.INDEX, raw=raw)
     return results
@@ -1276,6 +1286,36 @@ class TestSearchMigration(OsfTestCase):
             assert_equal(var[settings.ELASTIC_INDEX + '_v{}'.format(n + 1)]['aliases'].keys()[0], settings.ELASTIC_INDEX)
             assert not var.get(settings.ELASTIC_INDEX + '_v{}'.format(n))
 
+    def test_migration_resumes_from_state_file(self):
+        state_file = os.path.join(tempfile.mkdtemp(), 'search_migration.json')
+        with mock.patch('website.search_migration.migrate.migrate_users', side_effect=RuntimeError):
+            with assert_raises(RuntimeError):
+                migrate(delete=False, index=settings.ELASTIC_INDEX, app=self.app.app, state_file=state_file)
+        state = MigrationState(state_file)
+        assert_equal(state.index, settings.ELASTIC_INDEX + '_v1')
+        assert_true(state.is_step_done('nodes'))
+        assert_false(state.is_step_done('users'))
+
+        with mock.patch('website.search_migration.migrate.migrate_nodes') as migrate_nodes:
+            migrate(delete=False, index=settings.ELASTIC_INDEX, app=self.app.app, state_file=state_file)
+        assert_false(migrate_nodes.called)
+        var = self.es.indices.get_aliases()
+        assert_equal(var[settings.ELASTIC_INDEX + '_v1']['aliases'].keys()[0], settings.ELASTIC_INDEX)
+        assert_false(os.path.exists(state_file))
+
+    def test_run_pages_skips_finished_pages(self):
+        state = MigrationState()
+        state.finish_page('step', (0, 10))
+        sent = []
+
+        def send(docs):
+            sent.extend(docs)
+            return len(docs)
+
+        total = run_pages('step', get_pages(25, 10), lambda page: [page], send, state=state)
+        assert_equal(total, 3)
+        assert_equal(sent, [(10, 20), (20, 30), (30, 40)])
+
     def test_migration_institutions(self):
         migrate(delete=True, index=settings.ELASTIC_INDEX, app=self.app.app)
         count_query = {}
@@ -1470,3 +1510,158 @@ class TestSearchFiles(OsfTestCase):
 
         find = query_file('GreenLight.mp3')['results']
         assert_equal(len(find), 0)
+
+
+@pytest.mark.django_db
+class TestStreamingBulkIndexer:
+
+    def test_prefetched_node_serialization_matches(self):
+        project = factories.ProjectFactory(is_public=True)
+        child = factories.NodeFactory(parent=project, is_public=True)
+        child.add_tag('bulk-tag', auth=Auth(child.creator), save=True)
+        child.add_contributor(factories.UserFactory(), auth=Auth(child.creator), visible=True, save=True)
+        institution = factories.InstitutionFactory()
+        child.affiliated_institutions.add(institution)
+
+        expected = elastic_search.serialize_node(child, 'component')
+        nodes = list(elastic_search.iter_chunks(
+            elastic_search.AbstractNode.objects.filter(id__in=[project.id, child.id]), 10
+        ))[0]
+        elastic_search.prefetch_search_data(nodes)
+        prefetched = [node for node in nodes if node.id == child.id][0]
+
+        assert elastic_search.serialize_node(prefetched, 'component') == expected
+        assert prefetched.parent_node == project
+
+    def test_iter_chunks_pages_by_id(self):
+        nodes = [factories.ProjectFactory() for _ in range(5)]
+        queryset = elastic_search.AbstractNode.objects.filter(id__in=[node.id for node in nodes])
+        chunks = list(elastic_search.iter_chunks(queryset, 2))
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        assert [node.id for chunk in chunks for node in chunk] == sorted(node.id for node in nodes)
+
+    def test_private_nodes_become_delete_actions(self):
+        private = factories.ProjectFactory(is_public=False)
+        public = factories.ProjectFactory(is_public=True)
+        queryset = elastic_search.AbstractNode.objects.filter(id__in=[private.id, public.id])
+        actions = {action['_id']: action for action in elastic_search.iter_index_actions(queryset, index=TEST_INDEX)}
+
+        assert actions[private._id]['_op_type'] == 'delete'
+        assert actions[public._id]['_op_type'] == 'index'
+        assert actions[public._id]['_source']['title'] == public.title
+
+    def test_files_are_indexed_with_their_node(self):
+        private = factories.ProjectFactory(is_public=False)
+        public = factories.ProjectFactory(is_public=True)
+        private_file = private.get_addon('osfstorage').get_root().append_file('private.txt')
+        public_file = public.get_addon('osfstorage').get_root().append_file('public.txt')
+        queryset = elastic_search.AbstractNode.objects.filter(id__in=[private.id, public.id])
+        actions = {action['_id']: action for action in elastic_search.iter_index_actions(queryset, index=TEST_INDEX)}
+
+        assert actions[private_file._id]['_op_type'] == 'delete'
+        assert actions[public_file._id]['_op_type'] == 'index'
+        assert actions[public_file._id]['_source']['node_url'] == '/{}/'.format(public._id)
+
+    def test_system_qa_tags_are_not_indexed(self):
+        project = factories.ProjectFactory(is_public=True)
+        project.add_system_tag('qatest')
+        queryset = elastic_search.AbstractNode.objects.filter(id=project.id)
+        actions = list(elastic_search.iter_index_actions(queryset, index=TEST_INDEX))
+
+        assert actions[0]['_op_type'] == 'delete'
+
+
+@pytest.mark.django_db
+class TestSearchIndexQueue:
+
+    @pytest.fixture(autouse=True)
+    def clear_queue(self):
+        index_queue.reset_index_queue_stats()
+        with mock.patch('website.search.index_queue.flush_index_updates.apply_async') as apply_async:
+            yield apply_async
+
+    def test_repeated_updates_are_coalesced(self, clear_queue):
+        assert index_queue.enqueue_index_update(index_queue.NODE, 1) is True
+        assert index_queue.enqueue_index_update(index_queue.NODE, 1) is False
+        assert index_queue.enqueue_index_update(index_queue.PREPRINT, 1) is True
+
+        assert clear_queue.call_count == 2
+        stats = index_queue.get_index_queue_stats()
+        assert stats['enqueued'] == 3
+        assert stats['coalesced'] == 1
+
+    def test_delete_supersedes_pending_update(self):
+        index_queue.enqueue_index_update(index_queue.NODE, 1)
+        index_queue.enqueue_index_update(index_queue.NODE, 2)
+        index_queue.supersede_index_update(index_queue.NODE, 1)
+
+        pending = index_queue.pop_pending([[index_queue.NODE, 1], [index_queue.NODE, 2]])
+        assert pending == {index_queue.NODE: [2], index_queue.PREPRINT: []}
+        assert index_queue.get_index_queue_stats()['superseded'] == 1
+
+    def test_update_after_delete_is_rearmed(self, clear_queue):
+        index_queue.enqueue_index_update(index_queue.NODE, 1)
+        index_queue.supersede_index_update(index_queue.NODE, 1)
+        assert index_queue.enqueue_index_update(index_queue.NODE, 1) is True
+        assert clear_queue.call_count == 2
+        assert index_queue.pop_pending([[index_queue.NODE, 1]])[index_queue.NODE] == [1]
+
+    def test_pop_pending_claims_entries(self):
+        index_queue.enqueue_index_update(index_queue.NODE, 1)
+        assert index_queue.pop_pending([[index_queue.NODE, 1]])[index_queue.NODE] == [1]
+        assert index_queue.pop_pending([[index_queue.NODE, 1]])[index_queue.NODE] == []
+
+    def test_request_updates_are_queued_after_commit(self, clear_queue):
+        api_globals.request = FakeRequest()
+        postcommit_before_request()
+        try:
+            assert index_queue.enqueue_index_update(index_queue.NODE, 1) is None
+            index_queue.enqueue_index_update(index_queue.NODE, 2)
+            index_queue.enqueue_index_update(index_queue.NODE, 1)
+            index_queue.supersede_index_update(index_queue.NODE, 2)
+            assert not SearchIndexQueueEntry.objects.exists()
+            tasks = list(postcommit_queue().values())
+        finally:
+            api_globals.request = None
+
+        assert len(tasks) == 1
+        tasks[0]()
+        assert clear_queue.call_count == 1
+        assert clear_queue.call_args[1]['kwargs'] == {'keys': [[index_queue.NODE, 1]]}
+        assert index_queue.pop_pending([[index_queue.NODE, 1], [index_queue.NODE, 2]])[index_queue.NODE] == [1]
+
+    def test_orphaned_entries_are_rearmed(self):
+        index_queue.enqueue_index_update(index_queue.NODE, 1)
+        SearchIndexQueueEntry.objects.update(armed=timezone.now() - datetime.timedelta(seconds=index_queue.get_pending_timeout() + 1))
+        assert index_queue.enqueue_index_update(index_queue.NODE, 1) is True
+
+    @mock.patch('website.search.search.bulk_index')
+    def test_flush_bulk_indexes_pending_objects(self, mock_bulk_index):
+        project = factories.ProjectFactory(is_public=True)
+        component = factories.NodeFactory(parent=project, is_public=True)
+        index_queue.reset_index_queue_stats()
+        for _ in range(3):
+            index_queue.enqueue_index_update(index_queue.NODE, project.id)
+        index_queue.enqueue_index_update(index_queue.NODE, component.id)
+
+        index_queue.flush_index_updates([[index_queue.NODE, project.id], [index_queue.NODE, component.id]])
+
+        assert mock_bulk_index.call_count == 1
+        queryset = mock_bulk_index.call_args[0][0]
+        assert set(queryset.values_list('id', flat=True)) == {project.id, component.id}
+        stats = index_queue.get_index_queue_stats()
+        assert stats['enqueued'] == 4
+        assert stats['executed'] == 2
+        assert stats['flushes'] == 1
+
+    @mock.patch('website.search.search.search_engine.update_node_async')
+    @mock.patch('website.settings.USE_CELERY', True)
+    def test_async_update_node_uses_queue(self, mock_update_node_async, clear_queue):
+        project = factories.ProjectFactory(is_public=True)
+        clear_queue.reset_mock()
+        search.update_node(project, async_update=True)
+        search.update_node(project, async_update=True)
+
+        assert mock_update_node_async.s.call_count == 0
+        assert clear_queue.call_count == 1
+        assert clear_queue.call_args[1]['kwargs'] == {'keys': [[index_queue.NODE, project.id]]}
@@ -0,0 +1,79 @@
+import pytest
+
+from addons.osfstorage.tests.factories import FileVersionFactory
+from osf.management.commands.backfill_file_version_summaries import backfill_file_version_summaries
+from osf.models import FileVersionSummary
+from osf_tests.factories import ProjectFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def root():
+    return ProjectFactory().get_addon('osfstorage').get_root()
+
+
+def summary(test_file):
+    return FileVersionSummary.objects.get(file=test_file)
+
+
+class TestFileVersionSummary:
+
+    def test_add_versions(self, root):
+        test_file = root.append_file('file')
+        assert not FileVersionSummary.objects.filter(file=test_file).exists()
+
+        first = FileVersionFactory()
+        test_file.versions.add(first)
+        assert (summary(test_file).earliest_version, summary(test_file).latest_version) == (first, first)
+
+        latest = FileVersionFactory()
+        test_file.versions.add(latest)
+        assert summary(test_file).earliest_version == first
+        assert summary(test_file).latest_version == latest
+        assert summary(test_file).version_count == 2
+
+    def test_remove_and_delete_versions(self, root):
+        test_file = root.append_file('file')
+        first, second, third = FileVersionFactory(), FileVersionFactory(), FileVersionFactory()
+        test_file.versions.add(first, second, third)
+
+        test_file.versions.remove(third)
+        assert summary(test_file).latest_version == second
+        assert summary(test_file).version_count == 2
+
+        second.delete()
+        assert summary(test_file).latest_version == first
+        assert summary(test_file).version_count == 1
+
+        first.basefilenode_set.clear()
+        assert summary(test_file).latest_version is None
+        assert summary(test_file).version_count == 0
+
+    def test_copied_file(self, root):
+        test_file = root.append_file('file')
+        test_file.versions.add(FileVersionFactory())
+        copied = test_file.copy_under(root.append_folder('folder'))
+        assert summary(copied).latest_version == summary(test_file).latest_version
+        assert summary(copied).version_count == 1
+
+    def test_refresh_missing_by_parent(self, root):
+        test_file = root.append_file('file')
+        version = FileVersionFactory()
+        test_file.versions.add(version)
+        root.append_folder('folder')
+        FileVersionSummary.objects.all().delete()
+
+        assert FileVersionSummary.refresh(parent_id=root.id) == 1
+        assert summary(test_file).latest_version == version
+        # Only files without a summary are filled in
+        assert FileVersionSummary.refresh(parent_id=root.id) == 0
+
+    def test_backfill(self, root):
+        files = [root.append_file('file{}'.format(i)) for i in range(3)]
+        for test_file in files:
+            test_file.versions.add(FileVersionFactory())
+        FileVersionSummary.objects.all().delete()
+
+        assert backfill_file_version_summaries(2) == 3
+        assert FileVersionSummary.objects.filter(file__in=files, version_count=1).count() == 3
@@ -92,3 +92,44 @@ def test_file_update_respects_region(project, user, create_test_file):
     )
     assert new_region != original_region
     assert new_version.region == new_region
+
+
+class TestBulkUpsert:
+
+    def test_bulk_get_or_create(self, project):
+        GithubFile = BaseFileNode.resolve_class('github', BaseFileNode.FILE)
+        GithubFolder = BaseFileNode.resolve_class('github', BaseFileNode.FOLDER)
+        existing = GithubFile.get_or_create(project, '/existing')
+        existing.save()
+
+        file_nodes = BaseFileNode.bulk_get_or_create(project, [(GithubFolder, 'folder/'), (GithubFile, 'existing')])
+        assert file_nodes[0].pk is None
+        assert file_nodes[0]._path == '/folder/'
+        assert file_nodes[1] == existing
+
+    def test_bulk_upsert_creates_and_updates(self, project):
+        GithubFile = BaseFileNode.resolve_class('github', BaseFileNode.FILE)
+        existing = GithubFile.get_or_create(project, '/existing')
+        existing.name = 'existing'
+        existing.save()
+
+        # A node for the same path that another request didn't see yet
+        duplicate = GithubFile.get_or_create(project, '/new')
+        new, stale = BaseFileNode.bulk_get_or_create(project, [(GithubFile, '/new'), (GithubFile, '/existing')])
+        stale.name = 'renamed'
+        BaseFileNode.bulk_upsert([new, stale])
+        assert new.pk is not None
+        assert new.provider == 'github'
+
+        duplicate.name = 'duplicate'
+        BaseFileNode.bulk_upsert([duplicate])
+        assert (duplicate.pk, duplicate._id) == (new.pk, new._id)
+
+        existing.reload()
+        assert existing.name == 'renamed'
+        assert GithubFile.objects.filter(target_object_id=project.id).count() == 2
+
+    def test_bulk_upsert_rejects_osfstorage(self, project):
+        root = project.get_addon('osfstorage').get_root()
+        with pytest.raises(ValueError):
+            BaseFileNode.bulk_upsert([root.append_file('file', save=False)])
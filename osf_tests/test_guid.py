@@ -4,7 +4,8 @@ import urllib
 from django.utils import timezone
 from django.core.exceptions import MultipleObjectsReturned
 
-from osf.models import Guid, NodeLicenseRecord, OSFUser
+from osf.models import BlackListGuid, Guid, Node, NodeLicenseRecord, OSFUser
+from osf.models.base import GuidPool, reserve_guids
 from osf_tests.factories import AuthUserFactory, UserFactory, NodeFactory, NodeLicenseRecordFactory, \
     RegistrationFactory, PreprintFactory, PreprintProviderFactory
 from tests.base import OsfTestCase
@@ -128,6 +129,50 @@ class TestReferent:
             pytest.fail('Multiple objects returned for {} with multiple guids. {}'.format(Factory._meta.model, ex))
 
 
+@pytest.mark.django_db
+class TestGuidAllocation:
+
+    @pytest.mark.django_assert_num_queries
+    def test_reserve_skips_taken_and_blacklisted(self, django_assert_num_queries):
+        Guid.objects.create(_id='aaaaa')
+        BlackListGuid.objects.create(guid='bbbbb')
+        candidates = [list('aaaaa'), list('bbbbb'), list('ccccc'), list('ddddd')]
+        with mock.patch('osf.models.base.random.sample', side_effect=candidates):
+            with django_assert_num_queries(2):
+                reserved = reserve_guids(1)
+        assert len(reserved) == 1
+        assert reserved[0] in ('ccccc', 'ddddd')
+
+    @pytest.mark.django_assert_num_queries
+    def test_pool_reserves_blocks(self, django_assert_num_queries):
+        pool = GuidPool(size=10)
+        with django_assert_num_queries(1):
+            first = pool.take(5)
+        with django_assert_num_queries(0):
+            second = pool.take(5)
+        assert len(set(first + second)) == 10
+
+    def test_pool_expires(self):
+        pool = GuidPool(size=10, max_age=-1)
+        pool.take()
+        with mock.patch('osf.models.base.reserve_guids', return_value=['zzzzz', 'yyyyy']) as mock_reserve:
+            assert pool.take() == ['zzzzz']
+        assert mock_reserve.called
+
+    def test_bulk_create_for(self):
+        user = UserFactory()
+        existing = NodeFactory()
+        nodes = Node.objects.bulk_create([Node(title='Bulk {}'.format(i), creator=user) for i in range(3)])
+
+        created = Guid.bulk_create_for(nodes + [existing])
+        assert len(created) == 3
+        for node in nodes:
+            node = Node.objects.get(id=node.id)
+            assert len(node._id) == 5
+            assert Node.load(node._id) == node
+        assert existing.guids.count() == 1
+
+
 @pytest.mark.enable_bookmark_creation
 class TestResolveGuid(OsfTestCase):
 
@@ -0,0 +1,85 @@
+import pytest
+
+from api.base.api_globals import api_globals
+from osf.models import Guid, Node, Registration
+from osf.utils import guid_map
+from osf_tests.factories import NodeFactory, ProjectFactory
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeRequest(object):
+    pass
+
+
+@pytest.fixture()
+def request_context():
+    api_globals.request = FakeRequest()
+    yield api_globals.request
+    api_globals.request = None
+
+
+@pytest.fixture()
+def project():
+    return ProjectFactory()
+
+
+class TestGuidMap:
+
+    def test_no_caching_outside_of_a_request(self, project):
+        assert Node.load(project._id) is not Node.load(project._id)
+        assert guid_map.get_stats() is None
+
+    @pytest.mark.django_assert_num_queries
+    def test_load_is_cached(self, request_context, project, django_assert_num_queries):
+        loaded = Node.load(project._id)
+        hits = guid_map.get_stats()['hits']
+        with django_assert_num_queries(0):
+            assert Node.load(project._id) is loaded
+            assert Node.load(project._id.upper()) is loaded
+        stats = guid_map.get_stats()
+        assert stats['hits'] == hits + 2
+        assert stats['hit_rate'] == float(stats['hits']) / (stats['hits'] + stats['misses'])
+
+    def test_load_checks_model(self, request_context, project):
+        Node.load(project._id)
+        assert Guid.load(project._id).referent == project
+        assert Registration.load(project._id) is None
+
+    @pytest.mark.django_assert_num_queries
+    def test_id_of_related_objects(self, request_context, project, django_assert_num_queries):
+        children = [NodeFactory(parent=project) for _ in range(3)]
+        roots = [Node.objects.get(id=child.id).root for child in children]
+        assert roots[0]._id == project._id
+        with django_assert_num_queries(0):
+            assert [root._id for root in roots[1:]] == [project._id, project._id]
+
+    @pytest.mark.django_assert_num_queries
+    def test_prefetch(self, request_context, project, django_assert_num_queries):
+        nodes = [NodeFactory() for _ in range(3)]
+        unincluded = list(Node.objects.filter(id__in=[node.id for node in nodes]).include(None))
+        with django_assert_num_queries(1):
+            guid_map.prefetch(unincluded + [project, 'not a node'])
+        with django_assert_num_queries(0):
+            assert [node._id for node in unincluded] == [node._id for node in nodes]
+            assert Node.load(nodes[0]._id) is unincluded[0]
+
+    def test_save_invalidates(self, request_context, project):
+        loaded = Node.load(project._id)
+        project.title = 'Changed'
+        project.save()
+        reloaded = Node.load(project._id)
+        assert reloaded is not loaded
+        assert reloaded.title == 'Changed'
+
+    def test_new_guid_invalidates(self, request_context, project):
+        old_guid = project._id
+        Node.load(old_guid)
+        new_guid = Guid.objects.create(referent=project)
+        assert Node.objects.get(id=project.id)._id == new_guid._id
+        assert Node.load(old_guid) == project
+
+    def test_deleted_guid_invalidates(self, request_context, project):
+        Node.load(project._id)
+        Guid.load(project._id).delete()
+        assert Node.load(project._id) is None
@@ -1,10 +1,16 @@
+import mock
 import pytest
 from nose.tools import assert_raises
 
 from framework.celery_tasks import handlers
+from framework.postcommit_tasks import handlers as postcommit_handlers
 from website.project.tasks import on_node_updated
 
 
+def record_call(calls, value):
+    calls.append(value)
+
+
 class TestCeleryHandlers:
 
     @pytest.fixture()
@@ -40,3 +46,57 @@ class TestCeleryHandlers:
                 'website.project.tasks.on_node_updated',
                 predicate=lambda task: task.kwargs['node_id'] == 'woop'
             )
+
+
+class TestPostcommitHandlers:
+
+    @pytest.fixture(autouse=True)
+    def fresh_queue(self):
+        postcommit_handlers.postcommit_before_request()
+        postcommit_handlers.postcommit_stats.reset()
+        yield
+        postcommit_handlers.postcommit_before_request()
+
+    @pytest.fixture()
+    def response(self):
+        return mock.Mock(status_code=200)
+
+    def test_tasks_are_deduped_once_per_request(self):
+        calls = []
+        postcommit_handlers.enqueue_postcommit_task(record_call, (calls, 'a'), {}, celery=False)
+        postcommit_handlers.enqueue_postcommit_task(record_call, (calls, 'a'), {}, celery=False)
+        postcommit_handlers.enqueue_postcommit_task(record_call, (calls, 'b'), {}, celery=False)
+        assert len(postcommit_handlers.postcommit_queue()) == 2
+
+    def test_tasks_not_deduped_when_not_once_per_request(self):
+        calls = []
+        for _ in range(2):
+            postcommit_handlers.enqueue_postcommit_task(record_call, (calls, 'a'), {}, celery=False, once_per_request=False)
+        assert len(postcommit_handlers.postcommit_queue()) == 2
+
+    def test_unhashable_args_fall_back_to_repr(self):
+        key = postcommit_handlers.make_task_key(record_call, ([], {'a': 1}), {'b': [2]})
+        assert hash(key)
+
+    def test_after_request_runs_tasks_and_records_timing(self, response):
+        calls = []
+        postcommit_handlers.enqueue_postcommit_task(record_call, (calls, 'a'), {}, celery=False)
+        postcommit_handlers.enqueue_postcommit_task(record_call, (calls, 'b'), {}, celery=False)
+        postcommit_handlers.postcommit_after_request(response)
+
+        assert sorted(calls) == ['a', 'b']
+        stats = postcommit_handlers.postcommit_stats.as_dict()
+        task_stats = stats['tasks']['osf_tests.test_handlers.record_call']
+        assert task_stats['count'] == 2
+        assert task_stats['errors'] == 0
+
+    def test_pool_is_shared_between_requests(self):
+        assert postcommit_handlers.get_postcommit_pool() is postcommit_handlers.get_postcommit_pool()
+
+    def test_fire_and_forget(self, response):
+        calls = []
+        postcommit_handlers.enqueue_postcommit_task(record_call, (calls, 'a'), {}, celery=False)
+        with mock.patch('website.settings.POSTCOMMIT_FIRE_AND_FORGET', True):
+            postcommit_handlers.postcommit_after_request(response)
+        postcommit_handlers.get_postcommit_pool().join()
+        assert calls == ['a']
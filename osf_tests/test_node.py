@@ -33,6 +33,7 @@ from osf.models import (
     RegistrationSchema,
     Sanction,
     NodeRelation,
+    NodeTreeClosure,
     Registration,
     DraftRegistration,
     DraftRegistrationApproval,
@@ -570,6 +571,75 @@ class TestRoot:
                 assert p.parent_node._id in parent_list
 
 
+class TestNodeTreeClosure:
+
+    @pytest.fixture()
+    def project(self, user):
+        return ProjectFactory(creator=user)
+
+    def closure(self, node):
+        return set(
+            NodeTreeClosure.objects.filter(descendant=node).values_list('ancestor_id', 'depth')
+        )
+
+    def test_closure_rows_created_for_components(self, project):
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+
+        assert self.closure(project) == set()
+        assert self.closure(child) == {(project.id, 1)}
+        assert self.closure(grandchild) == {(child.id, 1), (project.id, 2)}
+
+    def test_node_links_are_not_in_closure(self, project, auth):
+        linked = ProjectFactory()
+        project.add_node_link(linked, auth=auth, save=True)
+        assert self.closure(linked) == set()
+
+    def test_parents_ordered_nearest_first(self, project):
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+        assert grandchild.parents == [child, project]
+        assert project.parents == []
+
+    def test_get_root_uses_furthest_ancestor(self, project):
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+        assert grandchild.get_root() == project
+        assert project.get_root() == project
+
+    def test_moving_subtree_rewrites_closure(self, project):
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+        new_parent = ProjectFactory()
+
+        relation = NodeRelation.objects.get(parent=project, child=child)
+        relation.parent = new_parent
+        relation.save()
+
+        assert self.closure(child) == {(new_parent.id, 1)}
+        assert self.closure(grandchild) == {(child.id, 1), (new_parent.id, 2)}
+        assert not Node.objects.get_children(project).exists()
+
+    def test_deleting_relation_removes_subtree(self, project):
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+
+        NodeRelation.objects.get(parent=project, child=child).delete()
+
+        assert self.closure(child) == set()
+        assert self.closure(grandchild) == {(child.id, 1)}
+
+    def test_can_view_implicit_admin_from_closure(self, project):
+        admin = AuthUserFactory()
+        child = NodeFactory(parent=project)
+        grandchild = NodeFactory(parent=child)
+        project.add_contributor(admin, permissions=[READ, WRITE, ADMIN], auth=Auth(project.creator), save=True)
+
+        readable = AbstractNode.objects.can_view(user=admin)
+        assert child in readable
+        assert grandchild in readable
+
+
 @pytest.mark.enable_implicit_clean
 class TestNodeMODMCompat:
 
@@ -0,0 +1,96 @@
+import pytest
+from waffle.testutils import override_switch
+
+from framework.auth.core import Auth
+from osf import features
+from osf.management.commands.backfill_node_log_feed import backfill_node_log_feed
+from osf.models import NodeLog, NodeLogFeedEntry, NodeRelation
+from osf_tests.factories import AuthUserFactory, NodeFactory, ProjectFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def user():
+    return AuthUserFactory()
+
+
+@pytest.fixture()
+def project(user):
+    return ProjectFactory(creator=user)
+
+
+def feed(node):
+    return set(NodeLogFeedEntry.objects.filter(feed_node=node).values_list('log_id', flat=True))
+
+
+def log_ids(*nodes):
+    return set(NodeLog.objects.filter(node__in=nodes, should_hide=False).values_list('id', flat=True))
+
+
+class TestNodeLogFeedEntry:
+
+    def test_logs_added_to_node_and_ancestors(self, project, user):
+        child = NodeFactory(parent=project, creator=user)
+        grandchild = NodeFactory(parent=child, creator=user)
+        log = grandchild.add_log('wiki_updated', params={'node': grandchild._id}, auth=Auth(user))
+
+        assert log.id in feed(grandchild)
+        assert log.id in feed(child)
+        assert log.id in feed(project)
+        assert feed(project) == log_ids(project, child, grandchild)
+        assert feed(child) == log_ids(child, grandchild)
+
+    def test_hidden_logs_are_removed(self, project, user):
+        log = project.add_log('wiki_updated', params={'node': project._id}, auth=Auth(user))
+        log.should_hide = True
+        log.save()
+        assert log.id not in feed(project)
+
+    def test_moving_subtree_moves_logs(self, project, user):
+        child = NodeFactory(parent=project, creator=user)
+        grandchild = NodeFactory(parent=child, creator=user)
+        new_parent = ProjectFactory(creator=user)
+
+        relation = NodeRelation.objects.get(parent=project, child=child)
+        relation.parent = new_parent
+        relation.save()
+
+        assert feed(project) == log_ids(project)
+        assert feed(new_parent) == log_ids(new_parent, child, grandchild)
+
+    def test_deleting_relation_removes_logs(self, project, user):
+        child = NodeFactory(parent=project, creator=user)
+        NodeRelation.objects.get(parent=project, child=child).delete()
+
+        assert feed(project) == log_ids(project)
+        assert feed(child) == log_ids(child)
+
+    def test_cloned_logs_are_added(self, project, user):
+        NodeFactory(parent=project, creator=user)
+        fork = project.fork_node(auth=Auth(user))
+        assert feed(fork) == log_ids(*[fork] + list(fork.get_descendants_recursive()))
+
+    def test_backfill(self, project, user):
+        child = NodeFactory(parent=project, creator=user)
+        NodeLogFeedEntry.objects.all().delete()
+
+        backfill_node_log_feed(batch_size=1)
+        assert feed(project) == log_ids(project, child)
+
+    def test_aggregate_logs_match_legacy_query(self, project, user):
+        public_child = NodeFactory(parent=project, creator=user, is_public=True)
+        private_child = NodeFactory(parent=project, creator=user)
+        public_child.add_log('wiki_updated', params={'node': public_child._id}, auth=Auth(user))
+        private_child.add_log('wiki_updated', params={'node': private_child._id}, auth=Auth(user))
+        project.set_privacy('public', auth=Auth(user))
+
+        for auth in (Auth(user), Auth()):
+            legacy = list(project.get_aggregate_logs_queryset(auth).values_list('id', flat=True))
+            with override_switch(features.NODE_LOG_FEED, active=True):
+                from_feed = list(project.get_aggregate_logs_queryset(auth).values_list('id', flat=True))
+            assert sorted(from_feed) == sorted(legacy)
+
+        with override_switch(features.NODE_LOG_FEED, active=True):
+            anonymous = set(project.get_aggregate_logs_queryset(Auth()).values_list('node_id', flat=True))
+        assert anonymous == {project.id, public_child.id}
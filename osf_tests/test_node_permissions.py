@@ -0,0 +1,75 @@
+import pytest
+
+from framework.auth.core import Auth
+from osf.models import Contributor
+from osf.utils import permissions
+from osf.utils.node_permissions import get_readable_node_ids
+from osf_tests.factories import (
+    AuthUserFactory,
+    NodeFactory,
+    ProjectFactory,
+    RegistrationFactory,
+)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def user():
+    return AuthUserFactory()
+
+
+@pytest.fixture()
+def project(user):
+    return ProjectFactory(creator=user)
+
+
+class TestGetReadableNodeIds:
+
+    def test_explicit_read(self, user, project):
+        other = ProjectFactory()
+        assert project.id in get_readable_node_ids(user.id)
+        assert other.id not in get_readable_node_ids(user.id)
+
+    def test_implicit_admin_on_descendants(self, user, project):
+        child = NodeFactory(parent=project, creator=project.creator)
+        grandchild = NodeFactory(parent=child, creator=project.creator)
+        admin = AuthUserFactory()
+        project.add_contributor(admin, permissions=permissions.CREATOR_PERMISSIONS, auth=Auth(user), save=True)
+        Contributor.objects.filter(user=admin, node__in=[child, grandchild]).delete()
+
+        implicit = get_readable_node_ids(admin.id)
+        assert {project.id, child.id, grandchild.id} <= implicit
+        explicit = get_readable_node_ids(admin.id, include_implicit=False)
+        assert child.id not in explicit
+        assert grandchild.id not in explicit
+
+    def test_non_admin_does_not_inherit(self, user, project):
+        child = NodeFactory(parent=project, creator=project.creator)
+        reader = AuthUserFactory()
+        project.add_contributor(reader, permissions=[permissions.READ], auth=Auth(user), save=True)
+        Contributor.objects.filter(user=reader, node=child).delete()
+        assert child.id not in get_readable_node_ids(reader.id)
+
+    def test_cached_per_request_and_cleared_on_contributor_change(self, user, project, request_context):
+        other_project = ProjectFactory()
+        assert other_project.id not in get_readable_node_ids(user.id)
+        other_project.add_contributor(user, permissions=[permissions.READ], auth=Auth(other_project.creator), save=True)
+        assert other_project.id in get_readable_node_ids(user.id)
+
+    def test_cleared_after_registering_in_the_same_request(self, user, project, request_context):
+        assert get_readable_node_ids(user.id)
+        registration = RegistrationFactory(project=project, creator=user)
+        assert registration.id in get_readable_node_ids(user.id)
+
+    def test_cleared_after_forking_in_the_same_request(self, user, project, request_context):
+        assert get_readable_node_ids(user.id)
+        fork = project.fork_node(auth=Auth(user))
+        assert fork.id in get_readable_node_ids(user.id)
+
+    def test_cleared_after_merging_users_in_the_same_request(self, user, project, request_context):
+        dupe = AuthUserFactory()
+        other_project = ProjectFactory(creator=dupe)
+        assert other_project.id not in get_readable_node_ids(user.id)
+        user.merge_user(dupe)
+        assert other_project.id in get_readable_node_ids(user.id)
@@ -0,0 +1,122 @@
+import mock
+import pytest
+from django.utils import timezone
+from multiprocessing.pool import ThreadPool
+
+from osf.external.tasks import apply_spam_check, check_spam_async
+from osf.models import spam
+from osf.models.spam import SpamStatus
+from osf.utils.akismet import AkismetClient
+from osf_tests.factories import (
+    AuthUserFactory,
+    PreprintFactory,
+    ProjectFactory,
+    RegistrationFactory,
+)
+from osf_tests.utils import FakeAkismetServer
+from website import settings
+
+pytestmark = pytest.mark.django_db
+
+HEADERS = {'Remote-Addr': '146.9.219.56', 'User-Agent': 'Mozilla/5.0', 'Referer': 'https://osf.io'}
+
+
+@pytest.yield_fixture()
+def akismet():
+    with FakeAkismetServer() as server:
+        with mock.patch.object(settings, 'AKISMET_URL', server.url), mock.patch.object(settings, 'AKISMET_APIKEY', 'test'):
+            yield server
+    spam._clients.clear()
+
+
+@pytest.fixture()
+def user():
+    return AuthUserFactory()
+
+
+@pytest.fixture()
+def project(user):
+    return ProjectFactory(creator=user, is_public=True)
+
+
+def make_check(resource, user, content):
+    return {
+        'guid': resource._id,
+        'user_id': user._id,
+        'author': user.fullname,
+        'author_email': user.username,
+        'content': content,
+        'request_headers': HEADERS,
+    }
+
+
+class TestAkismetClient:
+
+    def test_client_is_shared(self, akismet, project, user):
+        project.do_check_spam(user.fullname, user.username, 'hello', HEADERS)
+        project.do_check_spam(user.fullname, user.username, 'spam eggs', HEADERS)
+        assert [method for method, data in akismet.requests] == ['verify-key', 'comment-check', 'comment-check']
+        assert project.is_spammy
+
+    def test_concurrency_is_limited(self, akismet):
+        akismet.delay = 0.1
+        client = AkismetClient('test', 'osf.io', base_url=akismet.url, max_concurrent_requests=2)
+        pool = ThreadPool(6)
+        results = pool.map(lambda content: client.check_comment('127.0.0.1', 'test', comment_content=content), ['hi'] * 6)
+        pool.close()
+        assert results == [(False, None)] * 6
+        assert akismet.max_concurrent == 2
+
+
+@mock.patch.object(settings, 'SPAM_CHECK_ENABLED', True)
+@mock.patch.object(settings, 'SPAM_CHECK_ASYNC', True)
+class TestAsyncSpamCheck:
+
+    @mock.patch('osf.external.tasks.enqueue_task')
+    def test_check_spam_is_queued(self, mock_enqueue, project, user):
+        with mock.patch.object(project, '_get_spam_content', return_value='spam eggs'):
+            assert project.check_spam(user, {'title'}, HEADERS) is False
+        assert not project.is_spammy
+        checks = mock_enqueue.call_args[0][0].kwargs['checks']
+        assert checks == [make_check(project, user, 'spam eggs')]
+
+    def test_results_are_applied(self, akismet, project, user):
+        ham = ProjectFactory(creator=user, is_public=True)
+        check_spam_async([make_check(project, user, 'spam eggs'), make_check(ham, user, 'hello')])
+
+        project.reload()
+        ham.reload()
+        assert project.spam_status == SpamStatus.FLAGGED
+        assert project.spam_data['content'] == 'spam eggs'
+        assert project.spam_data['headers']['Remote-Addr'] == HEADERS['Remote-Addr']
+        assert ham.spam_status == SpamStatus.UNKNOWN
+        assert ham.spam_data['content'] == 'hello'
+
+    def test_reviewed_resources_are_skipped(self, project, user):
+        project.confirm_ham(save=True)
+        apply_spam_check(make_check(project, user, 'spam eggs'), True, None)
+        project.reload()
+        assert project.spam_status == SpamStatus.HAM
+
+    @mock.patch('website.mails.send_mail')
+    @mock.patch.object(settings, 'SPAM_ACCOUNT_SUSPENSION_ENABLED', True)
+    def test_spam_user_content_made_private(self, mock_send_mail, project, user):
+        user.date_confirmed = timezone.now()
+        user.save()
+        solo = ProjectFactory(creator=user, is_public=True)
+        shared = ProjectFactory(creator=user, is_public=True)
+        shared.add_contributor(AuthUserFactory())
+        shared.save()
+        preprint = PreprintFactory(creator=user, is_public=True)
+        registration = RegistrationFactory(creator=user, is_public=True)
+        solo_modified = solo.modified
+
+        apply_spam_check(make_check(project, user, 'spam eggs'), True, None)
+
+        user.reload()
+        assert user.is_disabled
+        for resource, is_public in ((project, False), (solo, False), (shared, True), (preprint, False), (registration, True)):
+            resource.reload()
+            assert resource.is_public is is_public
+        # Made private with set_privacy, which saves it
+        assert solo.modified > solo_modified
@@ -0,0 +1,131 @@
+import pytest
+from django.db.models import Sum
+from django.db.models.signals import post_save, pre_save
+
+from addons.osfstorage.tests.factories import FileVersionFactory
+from addons.osfstorage.models import OsfStorageFile
+from osf.models import FileVersion, NodeStorageUsage, Tag
+from osf.models.storage_usage import file_storage_usage_post_save, file_storage_usage_pre_save
+from osf.management.commands.reconcile_storage_usage import reconcile_storage_usage
+from osf_tests.factories import ProjectFactory, RegionFactory, UserFactory
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture()
+def project():
+    return ProjectFactory()
+
+
+@pytest.fixture()
+def root(project):
+    return project.get_addon('osfstorage').get_root()
+
+
+def add_file(root, name, *sizes):
+    test_file = root.append_file(name)
+    for size in sizes:
+        test_file.versions.add(FileVersionFactory(size=size, region=root.target.osfstorage_region))
+    test_file.save()
+    return test_file
+
+
+def aggregate(node):
+    return node.files.aggregate(total=Sum('versions__size'))['total'] or 0
+
+
+class TestNodeStorageUsage:
+
+    def test_versions_are_counted(self, project, root):
+        add_file(root, 'one', 100, 20)
+        add_file(root, 'two', 3)
+        assert project.storage_usage == 123 == aggregate(project)
+
+    def test_create_version(self, project, root):
+        test_file = root.append_file('file')
+        test_file.create_version(UserFactory(), {
+            'object': '06d80e',
+            'service': 'cloud',
+            'bucket': 'us-bucket',
+        }, {
+            'size': 1337,
+            'contentType': 'img/png',
+        }).save()
+        assert project.storage_usage == 1337
+
+    def test_trash_and_restore(self, project, root):
+        test_file = add_file(root, 'file', 100)
+        folder = root.append_folder('folder')
+        add_file(folder, 'nested', 10)
+        assert project.storage_usage == 110
+
+        test_file.delete()
+        assert project.storage_usage == 10
+        folder.delete()
+        assert project.storage_usage == 0
+
+        test_file.reload()
+        test_file.restore()
+        assert project.storage_usage == 100 == aggregate(project)
+
+    def test_trash_and_restore_folder(self, project, root):
+        folder = root.append_folder('folder')
+        add_file(folder.append_folder('nested'), 'deep', 10)
+        add_file(folder, 'shallow', 5)
+
+        folder.delete()
+        assert project.storage_usage == 0
+        folder.restore()
+        assert project.storage_usage == 15 == aggregate(project)
+
+    def test_move_to_other_node(self, project, root):
+        other = ProjectFactory()
+        test_file = add_file(root, 'file', 100)
+        test_file.move_under(other.get_addon('osfstorage').get_root())
+        assert project.storage_usage == 0
+        assert other.storage_usage == 100
+
+    def test_copy(self, project, root):
+        other = ProjectFactory()
+        test_file = add_file(root, 'file', 100)
+        test_file.copy_under(other.get_addon('osfstorage').get_root())
+        assert project.storage_usage == 100
+        assert other.storage_usage == 100 == aggregate(other)
+
+    def test_version_size_update(self, project, root):
+        test_file = add_file(root, 'file', 100)
+        version = test_file.versions.first()
+        version.size = 50
+        version.save()
+        assert project.storage_usage == 50
+
+    def test_region_totals(self, project, root):
+        other_region = RegionFactory()
+        test_file = add_file(root, 'file', 100)
+        test_file.versions.add(FileVersionFactory(size=5, region=other_region))
+        assert NodeStorageUsage.get_region_totals(project.id) == {
+            project.osfstorage_region.id: 100,
+            other_region.id: 5,
+        }
+
+    def test_get_totals_batches(self, project, root):
+        other = ProjectFactory()
+        add_file(root, 'file', 100)
+        assert NodeStorageUsage.get_totals([project.id, other.id]) == {project.id: 100, other.id: 0}
+
+    def test_reconcile(self, project, root):
+        add_file(root, 'file', 100)
+        NodeStorageUsage.objects.filter(node=project).update(total=7)
+
+        assert NodeStorageUsage.reconcile([project.id]) == {(project.id, project.osfstorage_region.id): (7, 100)}
+        assert project.storage_usage == 7
+
+        assert reconcile_storage_usage(100, fix=True, guids=[project._id]) == 1
+        assert project.storage_usage == 100
+        assert NodeStorageUsage.reconcile([project.id]) == {}
+
+    def test_file_receivers_are_scoped_to_file_models(self):
+        assert file_storage_usage_pre_save in pre_save._live_receivers(OsfStorageFile)
+        assert file_storage_usage_post_save in post_save._live_receivers(FileVersion)
+        assert file_storage_usage_pre_save not in pre_save._live_receivers(Tag)
+        assert file_storage_usage_post_save not in post_save._live_receivers(Tag)
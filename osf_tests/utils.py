@@ -2,6 +2,11 @@ import contextlib
 import datetime as dt
 import functools
 import mock
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
 
 from framework.auth import Auth
 from django.utils import timezone
@@ -172,3 +177,78 @@ class MockShareResponse:
     def raise_for_status(self):
         if self.status_code >= 400:
             raise Exception
+
+
+class FakeAkismetServer(ThreadingMixIn, HTTPServer):
+    """A local stand-in for the Akismet API, for use as ``settings.AKISMET_URL``.
+
+    Content is spam if its author is ``viagra-test-123`` or it contains ``spam_marker``, as with
+    Akismet's own test values. Requests are recorded in ``requests`` and the most that were
+    handled at once in ``max_concurrent``; each takes ``delay`` seconds.
+    """
+    daemon_threads = True
+    spam_author = 'viagra-test-123'
+
+    def __init__(self, spam_marker='spam eggs', delay=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _FakeAkismetHandler)
+        self.spam_marker = spam_marker
+        self.delay = delay
+        self.requests = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    def is_spam(self, data):
+        return data.get('comment_author') == self.spam_author or self.spam_marker in data.get('comment_content', '')
+
+
+class _FakeAkismetHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.concurrent += 1
+            server.max_concurrent = max(server.max_concurrent, server.concurrent)
+        try:
+            body = self.rfile.read(int(self.headers.getheader('content-length') or 0))
+            data = {key: values[0] for key, values in urlparse.parse_qs(body).items()}
+            method = self.path.rsplit('/', 1)[-1]
+            with server.lock:
+                server.requests.append((method, data))
+            time.sleep(server.delay)
+            if method == 'verify-key':
+                self._respond('valid')
+            elif method == 'comment-check':
+                self._respond('true' if server.is_spam(data) else 'false')
+            elif method in ('submit-spam', 'submit-ham'):
+                self._respond('Thanks for making the web a better place.')
+            else:
+                self.send_error(404)
+        finally:
+            with server.lock:
+                server.concurrent -= 1
+
+    def _respond(self, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, *args):
+        pass
+
@@ -2,13 +2,16 @@
 import os
 import json
 
+import mock
+from citeproc import CitationStylesStyle
 from django.utils import timezone
 from nose.tools import *  # noqa: F403
 
-from api.citations.utils import render_citation
+from api.citations import utils as citation_utils
+from api.citations.utils import render_citation, render_citations, StyleCache
 from osf_tests.factories import UserFactory, PreprintFactory
 from tests.base import OsfTestCase
-from osf.models import OSFUser
+from osf.models import OSFUser, Preprint
 
 class Node:
     _id = '2nthu'
@@ -16,6 +19,7 @@ class Node:
            'URL': 'localhost:5000/2nthu', 'issued': {'date-parts': [[2016, 12, 6]]},
            'title': u'The study of chocolate in its many forms', 'type': 'webpage', 'id': u'2nthu'}
     visible_contributors = ''
+    modified = timezone.now()
 
 
 class TestCiteprocpy(OsfTestCase):
@@ -172,3 +176,62 @@ class TestCiteprocpyMLA(OsfTestCase):
                 self.preprint.provider.name,
                 self.formated_date)
         )
+
+
+class TestCitationCaches(OsfTestCase):
+
+    def setUp(self):
+        super(TestCitationCaches, self).setUp()
+        citation_utils.style_cache.clear()
+        self.user = UserFactory(fullname='John Tordoff')
+        self.preprint = PreprintFactory(creator=self.user, title='My Preprint')
+        self.other_preprint = PreprintFactory(creator=self.user, title='My Other Preprint')
+
+    def test_styles_are_parsed_once(self):
+        with mock.patch('api.citations.utils.CitationStylesStyle', wraps=CitationStylesStyle) as mock_style:
+            render_citation(self.preprint, 'apa')
+            render_citation(self.other_preprint, 'apa')
+        assert_equal(mock_style.call_count, 1)
+
+    def test_style_cache_evicts_least_recently_used(self):
+        cache = StyleCache(2)
+        with mock.patch('api.citations.utils.load_style', side_effect=lambda style: style.upper()) as mock_load:
+            cache.get('apa')
+            cache.get('mla')
+            cache.get('apa')
+            cache.get('chicago')
+            assert_equal(cache.get('apa')[0], 'APA')
+            assert_equal(mock_load.call_count, 3)
+            cache.get('mla')
+            assert_equal(mock_load.call_count, 4)
+
+    def test_rendered_citations_are_cached(self):
+        citation = render_citation(self.preprint, 'apa')
+        with mock.patch('api.citations.utils.format_citation') as mock_format:
+            assert_equal(render_citation(self.preprint, 'apa'), citation)
+        assert_false(mock_format.called)
+
+        self.preprint.title = 'My Renamed Preprint'
+        self.preprint.save()
+        assert_in('My Renamed Preprint', render_citation(self.preprint, 'apa'))
+
+    def test_contributor_name_change_is_not_served_from_cache(self):
+        render_citation(self.preprint, 'modern-language-association')
+        self.user.given_name = 'Jonathan'
+        self.user.family_name = 'Tordoff'
+        self.user.save()
+        assert_in('Tordoff, Jonathan', render_citation(self.preprint, 'modern-language-association'))
+
+    def test_cache_hits_do_not_build_csl(self):
+        citations = render_citations([self.preprint, self.other_preprint], 'apa')
+        with mock.patch.object(Preprint, 'csl', new_callable=mock.PropertyMock) as mock_csl:
+            assert_equal(render_citations([self.preprint, self.other_preprint], 'apa'), citations)
+        assert_false(mock_csl.called)
+
+    def test_render_citations(self):
+        citations = render_citations([self.preprint, self.other_preprint], 'apa')
+        citation_utils.citation_cache.clear()
+        assert_equal(citations, {
+            self.preprint._id: render_citation(self.preprint, 'apa'),
+            self.other_preprint._id: render_citation(self.other_preprint, 'apa'),
+        })
@@ -16,19 +16,22 @@ import six
 from django.apps import apps
 from django.core.paginator import Paginator
 from django.contrib.contenttypes.models import ContentType
-from django.db.models import Q
+from django.db.models import F, Max, Q
 from elasticsearch2 import (ConnectionError, Elasticsearch, NotFoundError,
                            RequestError, TransportError, helpers)
 from framework.celery_tasks import app as celery_app
 from framework.database import paginated
 from osf.models import AbstractNode
+from osf.models import Contributor
+from osf.models import NodeRelation
+from osf.models import PreprintContributor
 from osf.models import OSFUser
 from osf.models import BaseFileNode
 from osf.models import Institution
 from osf.models import QuickFilesNode
 from osf.models import Preprint
 from osf.models import SpamStatus
-from addons.wiki.models import WikiPage
+from addons.wiki.models import WikiPage, WikiVersion
 from osf.models import CollectionSubmission
 from osf.utils.sanitize import unescape_entities
 from website import settings
@@ -375,6 +378,56 @@ def update_user_async(self, user_id, index=None):
     except Exception as exc:
         self.retry(exc)
 
+def get_search_contributors(obj):
+    search_data = getattr(obj, '_search_data', None)
+    if search_data is not None:
+        return search_data['contributors']
+    if isinstance(obj, Preprint):
+        contributors = obj._contributors.filter(preprintcontributor__visible=True).order_by('preprintcontributor___order')
+    else:
+        contributors = obj._contributors.filter(contributor__visible=True).order_by('contributor___order')
+    return [
+        {
+            'fullname': x['fullname'],
+            'url': '/{}/'.format(x['guids___id']) if x['is_active'] else None
+        }
+        for x in contributors.values('fullname', 'guids___id', 'is_active')
+    ]
+
+def get_search_tags(obj):
+    search_data = getattr(obj, '_search_data', None)
+    if search_data is not None:
+        return search_data['tags']
+    return list(obj.tags.filter(system=False).values_list('name', flat=True))
+
+def get_all_tags(obj):
+    """Return the names of all of ``obj``'s tags, including system tags."""
+    search_data = getattr(obj, '_search_data', None)
+    if search_data is not None:
+        return search_data['all_tags']
+    return list(obj.tags.values_list('name', flat=True))
+
+def get_search_institutions(node):
+    search_data = getattr(node, '_search_data', None)
+    if search_data is not None:
+        return search_data['affiliated_institutions']
+    return list(node.affiliated_institutions.values_list('name', flat=True))
+
+def get_search_wikis(node):
+    search_data = getattr(node, '_search_data', None)
+    if search_data is not None:
+        return search_data['wikis']
+    return WikiPage.objects.get_wiki_pages_latest(node).select_related('wiki_page')
+
+def is_qa_object(obj):
+    return bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(get_all_tags(obj))) or any(substring in obj.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
+
+def should_delete_node_doc(node):
+    return node.is_deleted or not node.is_public or node.archiving or node.is_spam or (node.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or node.is_quickfiles or is_qa_object(node)
+
+def should_delete_preprint_doc(preprint):
+    return not preprint.verified_publishable or preprint.is_spam or (preprint.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or is_qa_object(preprint)
+
 def serialize_node(node, category):
     elastic_document = {}
     parent_id = node.parent_id
@@ -386,19 +439,12 @@ def serialize_node(node, category):
     normalized_title = unicodedata.normalize('NFKD', normalized_title).encode('ascii', 'ignore')
     elastic_document = {
         'id': node._id,
-        'contributors': [
-            {
-                'fullname': x['fullname'],
-                'url': '/{}/'.format(x['guids___id']) if x['is_active'] else None
-            }
-            for x in node._contributors.filter(contributor__visible=True).order_by('contributor___order')
-            .values('fullname', 'guids___id', 'is_active')
-        ],
+        'contributors': get_search_contributors(node),
         'title': node.title,
         'normalized_title': normalized_title,
         'category': category,
         'public': node.is_public,
-        'tags': list(node.tags.filter(system=False).values_list('name', flat=True)),
+        'tags': get_search_tags(node),
         'description': node.description,
         'url': node.url,
         'is_registration': node.is_registration,
@@ -412,12 +458,12 @@ def serialize_node(node, category):
         'parent_id': parent_id,
         'date_created': node.created,
         'license': serialize_node_license_record(node.license),
-        'affiliated_institutions': list(node.affiliated_institutions.values_list('name', flat=True)),
+        'affiliated_institutions': get_search_institutions(node),
         'boost': int(not node.is_registration) + 1,  # This is for making registered projects less relevant
         'extra_search_terms': clean_splitters(node.title),
     }
     if not node.is_retracted:
-        for wiki in WikiPage.objects.get_wiki_pages_latest(node):
+        for wiki in get_search_wikis(node):
             # '.' is not allowed in field names in ES2
             elastic_document['wikis'][wiki.wiki_page.page_name.replace('.', ' ')] = wiki.raw_text(node)
 
@@ -433,21 +479,14 @@ def serialize_preprint(preprint, category):
     normalized_title = unicodedata.normalize('NFKD', normalized_title).encode('ascii', 'ignore')
     elastic_document = {
         'id': preprint._id,
-        'contributors': [
-            {
-                'fullname': x['fullname'],
-                'url': '/{}/'.format(x['guids___id']) if x['is_active'] else None
-            }
-            for x in preprint._contributors.filter(preprintcontributor__visible=True).order_by('preprintcontributor___order')
-            .values('fullname', 'guids___id', 'is_active')
-        ],
+        'contributors': get_search_contributors(preprint),
         'title': preprint.title,
         'normalized_title': normalized_title,
         'category': category,
         'public': preprint.is_public,
         'published': preprint.verified_publishable,
         'is_retracted': preprint.is_retracted,
-        'tags': list(preprint.tags.filter(system=False).values_list('name', flat=True)),
+        'tags': get_search_tags(preprint),
         'description': preprint.description,
         'url': preprint.url,
         'date_created': preprint.created,
@@ -459,14 +498,38 @@ def serialize_preprint(preprint, category):
     return elastic_document
 
 @requires_search
-def update_node(node, index=None, bulk=False, async_update=False):
+def update_target_files(target, index=None):
     from addons.osfstorage.models import OsfStorageFile
     index = index or INDEX
-    for file_ in paginated(OsfStorageFile, Q(target_content_type=ContentType.objects.get_for_model(type(node)), target_object_id=node.id)):
+    for file_ in paginated(OsfStorageFile, Q(target_content_type=ContentType.objects.get_for_model(type(target)), target_object_id=target.id)):
         update_file(file_, index=index)
 
-    is_qa_node = bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(node.tags.all().values_list('name', flat=True))) or any(substring in node.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
-    if node.is_deleted or not node.is_public or node.archiving or node.is_spam or (node.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or node.is_quickfiles or is_qa_node:
+@requires_search
+def update_files(file_pks, index=None):
+    """Reindex the OsfStorage files with primary keys ``file_pks``."""
+    from addons.osfstorage.models import OsfStorageFile
+    index = index or INDEX
+    for file_ in paginated(OsfStorageFile, Q(id__in=file_pks)):
+        update_file(file_, index=index)
+
+@requires_search
+def delete_files(file_ids, index=None):
+    """Remove the files whose ``_id`` is in ``file_ids`` from the index in one request."""
+    index = index or INDEX
+    actions = ({
+        '_op_type': 'delete',
+        '_index': index,
+        '_id': file_id,
+        '_type': 'file',
+    } for file_id in file_ids)
+    helpers.bulk(client(), actions, refresh=True, raise_on_error=False)
+
+@requires_search
+def update_node(node, index=None, bulk=False, async_update=False):
+    index = index or INDEX
+    update_target_files(node, index=index)
+
+    if should_delete_node_doc(node):
         delete_doc(node._id, node, index=index)
     else:
         category = get_doctype_from_node(node)
@@ -478,13 +541,10 @@ def update_node(node, index=None, bulk=False, async_update=False):
 
 @requires_search
 def update_preprint(preprint, index=None, bulk=False, async_update=False):
-    from addons.osfstorage.models import OsfStorageFile
     index = index or INDEX
-    for file_ in paginated(OsfStorageFile, Q(target_content_type=ContentType.objects.get_for_model(type(preprint)), target_object_id=preprint.id)):
-        update_file(file_, index=index)
+    update_target_files(preprint, index=index)
 
-    is_qa_preprint = bool(set(settings.DO_NOT_INDEX_LIST['tags']).intersection(preprint.tags.all().values_list('name', flat=True))) or any(substring in preprint.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
-    if not preprint.verified_publishable or preprint.is_spam or (preprint.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH) or is_qa_preprint:
+    if should_delete_preprint_doc(preprint):
         delete_doc(preprint._id, preprint, category='preprint', index=index)
     else:
         category = 'preprint'
@@ -494,6 +554,145 @@ def update_preprint(preprint, index=None, bulk=False, async_update=False):
         else:
             client().index(index=index, doc_type=category, id=preprint._id, body=elastic_document, refresh=True)
 
+def iter_chunks(queryset, chunk_size):
+    """Yield lists of objects from ``queryset`` in id order, ``chunk_size`` at a time, without OFFSET."""
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+def prefetch_search_data(objects):
+    """Load the related data that serialize_node/serialize_preprint need for a chunk of
+    nodes or preprints, with one query per relation instead of several per object.
+    """
+    if not objects:
+        return
+    model = type(objects[0])
+    is_preprint = isinstance(objects[0], Preprint)
+    ids = [obj.id for obj in objects]
+    search_data = {obj_id: {'contributors': [], 'tags': [], 'all_tags': [], 'affiliated_institutions': [], 'wikis': []} for obj_id in ids}
+
+    if is_preprint:
+        contributors = PreprintContributor.objects.filter(preprint_id__in=ids, visible=True).order_by('preprint_id', '_order')
+        owner_field = 'preprint_id'
+    else:
+        contributors = Contributor.objects.filter(node_id__in=ids, visible=True).order_by('node_id', '_order')
+        owner_field = 'node_id'
+    for x in contributors.values(owner_field, 'user__fullname', 'user__guids___id', 'user__is_active'):
+        search_data[x[owner_field]]['contributors'].append({
+            'fullname': x['user__fullname'],
+            'url': '/{}/'.format(x['user__guids___id']) if x['user__is_active'] else None
+        })
+
+    tag_field = model.tags.field.m2m_field_name()
+    tags = model.tags.through.objects.filter(**{'{}_id__in'.format(tag_field): ids})
+    for obj_id, name, system in tags.values_list('{}_id'.format(tag_field), 'tag__name', 'tag__system'):
+        search_data[obj_id]['all_tags'].append(name)
+        if not system:
+            search_data[obj_id]['tags'].append(name)
+
+    if not is_preprint:
+        institutions = AbstractNode.affiliated_institutions.through.objects.filter(abstractnode_id__in=ids)
+        for obj_id, name in institutions.values_list('abstractnode_id', 'institution__name'):
+            search_data[obj_id]['affiliated_institutions'].append(name)
+
+        wikis = WikiVersion.objects.annotate(
+            newest_version=Max('wiki_page__versions__identifier')
+        ).filter(
+            identifier=F('newest_version'),
+            wiki_page__node_id__in=ids,
+            wiki_page__deleted__isnull=True,
+        ).select_related('wiki_page')
+        for wiki in wikis:
+            search_data[wiki.wiki_page.node_id]['wikis'].append(wiki)
+
+        relations = dict(NodeRelation.objects.filter(child_id__in=ids, is_node_link=False).values_list('child_id', 'parent_id'))
+        parents = {parent.id: parent for parent in AbstractNode.objects.filter(id__in=set(relations.values()))}
+
+    for obj in objects:
+        obj._search_data = search_data[obj.id]
+        if not is_preprint:
+            parent = parents.get(relations.get(obj.id))
+            # Populate the parent_node cached_property and the parent_id annotation
+            obj.__dict__['parent_node'] = parent
+            obj.annotated_parent_id = parent._id if parent else None
+
+def get_node_index_action(node, index):
+    category = get_doctype_from_node(node)
+    if should_delete_node_doc(node):
+        if node.is_registration:
+            category = 'registration'
+        else:
+            category = node.project_or_component
+        return {'_op_type': 'delete', '_index': index, '_type': category, '_id': node._id}
+    return {'_op_type': 'index', '_index': index, '_type': category, '_id': node._id, '_source': serialize_node(node, category)}
+
+def get_preprint_index_action(preprint, index):
+    if should_delete_preprint_doc(preprint):
+        return {'_op_type': 'delete', '_index': index, '_type': 'preprint', '_id': preprint._id}
+    return {'_op_type': 'index', '_index': index, '_type': 'preprint', '_id': preprint._id, '_source': serialize_preprint(preprint, 'preprint')}
+
+def iter_target_file_actions(targets, index):
+    """Yield bulk index/delete actions for the OsfStorage files of a chunk of nodes or preprints."""
+    from addons.osfstorage.models import OsfStorageFile
+    targets_by_id = {target.id: target for target in targets}
+    files = OsfStorageFile.objects.filter(
+        target_content_type=ContentType.objects.get_for_model(type(targets[0])),
+        target_object_id__in=list(targets_by_id),
+    ).prefetch_related('tags').order_by('id')
+    for file_ in files:
+        yield get_file_index_action(file_, index, target=targets_by_id[file_.target_object_id])
+
+def iter_index_actions(queryset, index=None, chunk_size=None, include_files=True):
+    """Yield bulk index/delete actions for every node or preprint in ``queryset``.
+
+    :param bool include_files: Also yield actions for their OsfStorage files, which are
+        indexed or deleted along with the node or preprint they belong to
+    """
+    index = index or INDEX
+    chunk_size = chunk_size or settings.ELASTIC_BULK_CHUNK_SIZE
+    get_action = get_preprint_index_action if issubclass(queryset.model, Preprint) else get_node_index_action
+    for chunk in iter_chunks(queryset, chunk_size):
+        prefetch_search_data(chunk)
+        for obj in chunk:
+            yield get_action(obj, index)
+        if include_files and chunk:
+            for action in iter_target_file_actions(chunk, index):
+                yield action
+
+@requires_search
+def streaming_bulk_index(queryset, index=None, chunk_size=None, workers=None, refresh=False):
+    """Serialize ``queryset`` and its OsfStorage files in chunks and stream the documents to ES.
+
+    Objects and files that should not be in the index are deleted from it. Returns a tuple of
+    (number of successful actions, list of errors), ignoring 404s from deletes.
+    """
+    chunk_size = chunk_size or settings.ELASTIC_BULK_CHUNK_SIZE
+    workers = workers or settings.ELASTIC_BULK_WORKERS
+    actions = iter_index_actions(queryset, index=index, chunk_size=chunk_size)
+    if workers > 1:
+        results = helpers.parallel_bulk(client(), actions, thread_count=workers, chunk_size=chunk_size, raise_on_error=False)
+    else:
+        results = helpers.streaming_bulk(client(), actions, chunk_size=chunk_size, raise_on_error=False)
+    success, errors = 0, []
+    for ok, item in results:
+        if ok:
+            success += 1
+            continue
+        result = item.get('delete', {})
+        if result.get('status') == 404:
+            success += 1
+        else:
+            errors.append(item)
+    if refresh:
+        client().indices.refresh(index=index or INDEX)
+    if errors:
+        logger.error('{} search documents failed to index: {}'.format(len(errors), errors[:10]))
+    return success, errors
+
 def bulk_update_nodes(serialize, nodes, index=None, category=None):
     """Updates the list of input projects
 
@@ -647,39 +846,27 @@ def update_user(user, index=None):
 
     client().index(index=index, doc_type='user', body=user_doc, id=user._id, refresh=True)
 
-@requires_search
-def update_file(file_, index=None, delete=False):
-    index = index or INDEX
-    target = file_.target
+def get_file_index_action(file_, index, target=None, delete=False):
+    """Return the bulk action that indexes ``file_``, or deletes it if it shouldn't be in the index.
+
+    :param target: ``file_.target``, if the caller already has it loaded
+    """
+    target = target or file_.target
+    delete_action = {'_op_type': 'delete', '_index': index, '_type': 'file', '_id': file_._id}
 
     # TODO: Can remove 'not file_.name' if we remove all base file nodes with name=None
+    file_tags = list(file_.tags.all())
     file_node_is_qa = bool(
-        set(settings.DO_NOT_INDEX_LIST['tags']).intersection(file_.tags.all().values_list('name', flat=True))
-    ) or bool(
-        set(settings.DO_NOT_INDEX_LIST['tags']).intersection(target.tags.all().values_list('name', flat=True))
-    ) or any(substring in target.title for substring in settings.DO_NOT_INDEX_LIST['titles'])
+        set(settings.DO_NOT_INDEX_LIST['tags']).intersection(tag.name for tag in file_tags)
+    ) or is_qa_object(target)
     if not file_.name or not target.is_public or delete or file_node_is_qa or getattr(target, 'is_deleted', False) or getattr(target, 'archiving', False) or target.is_spam or (
             target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-        client().delete(
-            index=index,
-            doc_type='file',
-            id=file_._id,
-            refresh=True,
-            ignore=[404]
-        )
-        return
+        return delete_action
 
     if isinstance(target, Preprint):
         if not getattr(target, 'verified_publishable', False) or target.primary_file != file_ or target.is_spam or (
                 target.spam_status == SpamStatus.FLAGGED and settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH):
-            client().delete(
-                index=index,
-                doc_type='file',
-                id=file_._id,
-                refresh=True,
-                ignore=[404]
-            )
-            return
+            return delete_action
 
     # We build URLs manually here so that this function can be
     # run outside of a Flask request context (e.g. in a celery task)
@@ -703,7 +890,7 @@ def update_file(file_, index=None, delete=False):
         'id': file_._id,
         'deep_url': None if isinstance(target, Preprint) else file_deep_url,
         'guid_url': None if isinstance(target, Preprint) else guid_url,
-        'tags': list(file_.tags.filter(system=False).values_list('name', flat=True)),
+        'tags': [tag.name for tag in file_tags if not tag.system],
         'name': file_.name,
         'category': 'file',
         'node_url': node_url,
@@ -713,11 +900,26 @@ def update_file(file_, index=None, delete=False):
         'is_retracted': getattr(target, 'is_retracted', False),
         'extra_search_terms': clean_splitters(file_.name),
     }
+    return {'_op_type': 'index', '_index': index, '_type': 'file', '_id': file_._id, '_source': file_doc}
+
+@requires_search
+def update_file(file_, index=None, delete=False):
+    index = index or INDEX
+    action = get_file_index_action(file_, index, delete=delete)
+    if action['_op_type'] == 'delete':
+        client().delete(
+            index=index,
+            doc_type='file',
+            id=file_._id,
+            refresh=True,
+            ignore=[404]
+        )
+        return
 
     client().index(
         index=index,
         doc_type='file',
-        body=file_doc,
+        body=action['_source'],
         id=file_._id,
         refresh=True
     )
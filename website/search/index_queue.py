@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Debounced queue of node and preprint search index updates.
+
+A save can trigger several reindexes of the same object (on_node_updated, contributor
+changes, tag changes, ...). Instead of sending one ``update_node_async`` task per call, each
+update marks the object as pending in ``SearchIndexQueueEntry`` and schedules a
+``flush_index_updates`` task ``SEARCH_INDEX_SETTLE_SECONDS`` later. Updates to an object that is
+already pending are dropped, and the flush reindexes every pending object in a single bulk
+request, reading whatever state is in the database at that point.
+
+During a request, updates are collected and written after the request's transaction has
+committed, in one statement run in autocommit, so requests don't hold locks on queue rows or
+queue entries for changes that are rolled back.
+
+Deletes are still sent to ES immediately (see ``search.delete_node``); they mark a pending
+update as superseded so it is skipped at flush time, unless another update re-arms it.
+"""
+from __future__ import unicode_literals
+import logging
+import threading
+
+from django.apps import apps
+
+from framework.celery_tasks import app as celery_app
+from framework.celery_tasks.handlers import in_request_context
+from framework.postcommit_tasks.handlers import enqueue_postcommit_task
+from osf.utils.requests import get_request_cache
+from website import settings
+
+logger = logging.getLogger(__name__)
+
+NODE = 'node'
+PREPRINT = 'preprint'
+
+UPDATE = 'update'
+SUPERSEDED = 'superseded'
+
+STAT_NAMES = ('enqueued', 'coalesced', 'superseded', 'executed', 'flushes')
+REQUEST_CACHE_NAMESPACE = 'search_index_queue'
+
+# Counters for this process only, so that counting doesn't write to a shared row on every save
+_stats_lock = threading.Lock()
+_stats = dict.fromkeys(STAT_NAMES, 0)
+
+
+def get_queue_model():
+    return apps.get_model('osf.SearchIndexQueueEntry')
+
+def get_pending_timeout():
+    # Long enough to outlive a slow flush, short enough that an entry orphaned by a lost
+    # task does not block reindexing the object for long
+    return settings.SEARCH_INDEX_SETTLE_SECONDS * 10
+
+def incr_stat(name, delta=1):
+    with _stats_lock:
+        _stats[name] += delta
+
+def get_index_queue_stats():
+    """Return the queue counters of this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_index_queue_stats():
+    with _stats_lock:
+        _stats.update(dict.fromkeys(STAT_NAMES, 0))
+
+
+def apply_queue_operations(operations):
+    """Apply (UPDATE or SUPERSEDED, doc_type, obj_id) operations in order and schedule one flush
+    for the objects that became pending. Returns the (doc_type, obj_id) keys that did.
+    """
+    last = {}
+    for operation, doc_type, obj_id in operations:
+        last[(doc_type, obj_id)] = operation
+    updates = [key for key, operation in last.items() if operation == UPDATE]
+    supersedes = [key for key, operation in last.items() if operation == SUPERSEDED]
+
+    model = get_queue_model()
+    incr_stat('superseded', model.supersede(supersedes))
+    armed = model.arm(updates, get_pending_timeout())
+    incr_stat('coalesced', len(updates) - len(armed))
+    if armed:
+        flush_index_updates.apply_async(
+            kwargs={'keys': [[doc_type, obj_id] for doc_type, obj_id in armed]},
+            countdown=settings.SEARCH_INDEX_SETTLE_SECONDS,
+        )
+    return armed
+
+def _apply_request_operations(batch):
+    apply_queue_operations(batch.pop('operations'))
+
+def queue_operation(operation, doc_type, obj_id):
+    """Apply an operation after the current request has committed, or now outside of a request."""
+    batch = get_request_cache(REQUEST_CACHE_NAMESPACE) if in_request_context() else None
+    if batch is None:
+        return apply_queue_operations([(operation, doc_type, obj_id)])
+    if 'operations' in batch:
+        batch['operations'].append((operation, doc_type, obj_id))
+        return None
+    # Tests run postcommit tasks right away, which pops the operations so the next call starts a new batch
+    batch['operations'] = [(operation, doc_type, obj_id)]
+    enqueue_postcommit_task(_apply_request_operations, (batch, ), {}, celery=False, once_per_request=True)
+    return None
+
+def enqueue_index_update(doc_type, obj_id):
+    """Mark ``obj_id`` as needing a reindex.
+
+    Outside of a request, returns False if an update was already pending. During a request the
+    update is queued when the request's transaction commits and None is returned.
+    """
+    incr_stat('enqueued')
+    armed = queue_operation(UPDATE, doc_type, obj_id)
+    return None if armed is None else bool(armed)
+
+def supersede_index_update(doc_type, obj_id):
+    """Called after a document is deleted from the index, so a pending update does not re-add it."""
+    queue_operation(SUPERSEDED, doc_type, obj_id)
+
+
+def pop_pending(keys):
+    """Claim the pending entries for ``keys``, returning {doc_type: [ids to reindex]}.
+
+    Entries are removed before the database is read, so an update made while the flush is
+    running schedules a new flush instead of being coalesced into this one.
+    """
+    pending = {NODE: [], PREPRINT: []}
+    for doc_type, obj_id in get_queue_model().claim([tuple(key) for key in keys]):
+        pending[doc_type].append(obj_id)
+    return pending
+
+@celery_app.task(bind=True, ignore_results=True, max_retries=5, default_retry_delay=60)
+def flush_index_updates(self, keys):
+    from website.search import search
+
+    AbstractNode = apps.get_model('osf.AbstractNode')
+    Preprint = apps.get_model('osf.Preprint')
+    pending = pop_pending(keys)
+    models = {NODE: AbstractNode, PREPRINT: Preprint}
+    try:
+        for doc_type, ids in pending.items():
+            if not ids:
+                continue
+            # Also reindexes the objects' files
+            search.bulk_index(models[doc_type].objects.filter(id__in=ids), refresh=True)
+    except Exception as exc:
+        # Put the claimed objects back so the retry (or a later flush) picks them up
+        get_queue_model().arm([(doc_type, obj_id) for doc_type, ids in pending.items() for obj_id in ids], get_pending_timeout())
+        self.retry(exc=exc)
+    executed = len(pending[NODE]) + len(pending[PREPRINT])
+    incr_stat('flushes')
+    incr_stat('executed', executed)
+    logger.debug('Flushed {} pending search index updates'.format(executed))
@@ -3,6 +3,7 @@ import logging
 from framework.celery_tasks.handlers import enqueue_task
 
 from website import settings
+from website.search import index_queue
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +37,9 @@ def update_node(node, index=None, bulk=False, async_update=True, saved_fields=No
         # For example, when updating a Node's privacy, is_public must be True in the
         # database in order for method that updates the Node's elastic search document
         # to run correctly.
-        if settings.USE_CELERY:
+        if settings.USE_CELERY and settings.SEARCH_INDEX_DEBOUNCE and not (index or bulk):
+            index_queue.enqueue_index_update(index_queue.NODE, node.id)
+        elif settings.USE_CELERY:
             enqueue_task(search_engine.update_node_async.s(node_id=node_id, **kwargs))
         else:
             search_engine.update_node_async(node_id=node_id, **kwargs)
@@ -53,7 +56,9 @@ def update_preprint(preprint, index=None, bulk=False, async_update=True, saved_f
     if async_update:
         preprint_id = preprint._id
         # We need the transaction to be committed before trying to run celery tasks.
-        if settings.USE_CELERY:
+        if settings.USE_CELERY and settings.SEARCH_INDEX_DEBOUNCE and not (index or bulk):
+            index_queue.enqueue_index_update(index_queue.PREPRINT, preprint.id)
+        elif settings.USE_CELERY:
             enqueue_task(search_engine.update_preprint_async.s(preprint_id=preprint_id, **kwargs))
         else:
             search_engine.update_preprint_async(preprint_id=preprint_id, **kwargs)
@@ -66,6 +71,17 @@ def bulk_update_nodes(serialize, nodes, index=None, category=None):
     index = index or settings.ELASTIC_INDEX
     search_engine.bulk_update_nodes(serialize, nodes, index=index, category=category)
 
+@requires_search
+def bulk_index(queryset, index=None, chunk_size=None, workers=None, refresh=False):
+    """Reindex every node or preprint in ``queryset`` via the streaming bulk indexer."""
+    index = index or settings.ELASTIC_INDEX
+    return search_engine.streaming_bulk_index(queryset, index=index, chunk_size=chunk_size, workers=workers, refresh=refresh)
+
+@requires_search
+def update_target_files(target, index=None):
+    index = index or settings.ELASTIC_INDEX
+    search_engine.update_target_files(target, index=index)
+
 @requires_search
 def delete_node(node, index=None):
     index = index or settings.ELASTIC_INDEX
@@ -73,6 +89,8 @@ def delete_node(node, index=None):
     if node.is_registration:
         doc_type = 'registration'
     search_engine.delete_doc(node._id, node, index=index, category=doc_type)
+    if settings.SEARCH_INDEX_DEBOUNCE:
+        index_queue.supersede_index_update(index_queue.NODE, node.id)
 
 @requires_search
 def update_contributors_async(user_id):
@@ -99,6 +117,16 @@ def update_file(file_, index=None, delete=False):
     index = index or settings.ELASTIC_INDEX
     search_engine.update_file(file_, index=index, delete=delete)
 
+@requires_search
+def update_files(file_pks, index=None):
+    index = index or settings.ELASTIC_INDEX
+    search_engine.update_files(file_pks, index=index)
+
+@requires_search
+def delete_files(file_ids, index=None):
+    index = index or settings.ELASTIC_INDEX
+    search_engine.delete_files(file_ids, index=index)
+
 @requires_search
 def update_institution(institution, index=None):
     index = index or settings.ELASTIC_INDEX
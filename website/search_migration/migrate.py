@@ -2,12 +2,17 @@
 # -*- coding: utf-8 -*-
 """Migration script for Search-enabled Models."""
 from __future__ import absolute_import
-from math import ceil
 import functools
+import json
 import logging
+import multiprocessing
+import os
+import Queue
+import threading
+import time
 
 from django.db import connection
-from django.core.paginator import Paginator
+from django.db.models import Max
 from elasticsearch2 import helpers
 
 import website.search.search as search
@@ -20,6 +25,7 @@ from scripts import utils as script_utils
 from osf.models import OSFUser, Institution, AbstractNode, BaseFileNode, Preprint, CollectionSubmission
 from website import settings
 from website.app import init_app
+from website.search import elastic_search as es_search
 from website.search.elastic_search import client as es_client
 from website.search.elastic_search import bulk_update_cgm
 from website.search.search import update_institution, bulk_update_collected_metadata
@@ -27,7 +33,147 @@ from website.search.search import update_institution, bulk_update_collected_meta
 
 logger = logging.getLogger(__name__)
 
-def sql_migrate(index, sql, max_id, increment, es_args=None, **kwargs):
+
+class MigrationState(object):
+    """Progress of a reindex, saved to a JSON file after every page so that an interrupted run
+    can be resumed into the same index instead of starting over.
+
+    Records the index being built, the steps that are finished and the pages (by their first id)
+    that are done within each step. Without a path nothing is saved.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.data = {'index': None, 'steps': [], 'pages': {}}
+        if path and os.path.exists(path):
+            with open(path) as fp:
+                self.data = json.load(fp)
+
+    @property
+    def index(self):
+        return self.data['index']
+
+    def start(self, index):
+        self.data = {'index': index, 'steps': [], 'pages': {}}
+        self.save()
+
+    def is_step_done(self, step):
+        return step in self.data['steps']
+
+    def finish_step(self, step):
+        self.data['steps'].append(step)
+        self.data['pages'].pop(step, None)
+        self.save()
+
+    def get_remaining_pages(self, step, pages):
+        done = set(self.data['pages'].get(step, []))
+        return [page for page in pages if page[0] not in done]
+
+    def finish_page(self, step, page):
+        self.data['pages'].setdefault(step, []).append(page[0])
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        # Write and rename so a crash can't leave a truncated file behind
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.data, fp)
+        os.rename(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def get_max_id(queryset):
+    return queryset.aggregate(max_id=Max('id'))['max_id'] or 0
+
+def get_pages(max_id, increment):
+    """(page_start, page_end] id ranges covering ``max_id``. An extra page is included for
+    objects created while the migration runs.
+    """
+    return [(page_start, page_start + increment) for page_start in range(0, max_id + increment + 1, increment)]
+
+def _init_worker():
+    # Each process needs its own connections; the parent closes its database connection before forking
+    es_search.CLIENT = None
+
+def prefetched(func, items):
+    """Yield ``(item, func(item))`` for ``items``, calling ``func`` for the next item in a
+    background thread while the caller handles the current result.
+    """
+    results = Queue.Queue(maxsize=1)
+
+    def produce():
+        try:
+            for item in items:
+                results.put((item, func(item), None))
+        except Exception as e:
+            results.put((None, None, e))
+        finally:
+            connection.close()
+            results.put(None)
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    while True:
+        result = results.get()
+        if result is None:
+            return
+        item, value, error = result
+        if error is not None:
+            raise error
+        yield item, value
+
+def fetch_sql_page(page, sql=None, **kwargs):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(page_start=page[0], page_end=page[1], **kwargs))
+        return cursor.fetchone()[0] or []
+
+def send_sql_page(ser_objs, es_args=None):
+    if ser_objs:
+        helpers.bulk(client(), ser_objs, **(es_args or {}))
+    return len(ser_objs)
+
+def migrate_page(page, fetch=None, send=None):
+    return page, send(fetch(page))
+
+def run_pages(step, pages, fetch, send, state=None, workers=1):
+    """Migrate ``pages`` of ids, sending what ``fetch`` returns for each with ``send``, which
+    returns the number of documents. Pages are split across ``workers`` processes; with a single
+    worker the next page is fetched while the current one is being sent. Pages already finished
+    according to ``state`` are skipped.
+
+    :return int: Number of migrated objects
+    """
+    state = state or MigrationState()
+    pages = state.get_remaining_pages(step, pages)
+    total_objs = 0
+    start = time.time()
+    pool = None
+    if workers > 1:
+        connection.close()
+        pool = multiprocessing.Pool(workers, initializer=_init_worker)
+        results = pool.imap_unordered(functools.partial(migrate_page, fetch=fetch, send=send), pages)
+    else:
+        results = ((page, send(fetched)) for page, fetched in prefetched(fetch, pages))
+    try:
+        for done, (page, count) in enumerate(results, 1):
+            total_objs += count
+            state.finish_page(step, page)
+            logger.info('{}: {} / {} pages'.format(step, done, len(pages)))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    elapsed = time.time() - start
+    logger.info('{}: {} documents in {:.1f}s ({:.0f} docs/s)'.format(step, total_objs, elapsed, total_objs / elapsed if elapsed else 0))
+    return total_objs
+
+def sql_migrate(index, sql, max_id, increment, es_args=None, step=None, state=None, workers=1, **kwargs):
     """ Run provided SQL and send output to elastic.
 
     :param str index: Elastic index to update (formatted into `sql`)
@@ -35,124 +181,147 @@ def sql_migrate(index, sql, max_id, increment, es_args=None, **kwargs):
     :param int max_id: Last known object id. Indicates when to stop paging
     :param int increment: Page size
     :param  dict es_args:  Dict or None, to pass to `helpers.bulk`
+    :param str step: Name of the migration step, used for progress and checkpoints
+    :param MigrationState state: Where finished pages are recorded
+    :param int workers: Number of processes
     :kwargs: Additional format arguments for `sql` arg
 
     :return int: Number of migrated objects
     """
-    if es_args is None:
-        es_args = {}
-    total_pages = int(ceil(max_id / float(increment)))
-    total_objs = 0
-    page_start = 0
-    page_end = 0
-    page = 0
-    while page_end <= (max_id + increment):
-        page += 1
-        page_end += increment
-        if page <= total_pages:
-            logger.info('Updating page {} / {}'.format(page_end / increment, total_pages))
-        else:
-            # An extra page is included to cover the edge case where:
-            #       max_id == (total_pages * increment) - 1
-            # and two additional objects are created during runtime.
-            logger.info('Cleaning up...')
-        with connection.cursor() as cursor:
-            cursor.execute(sql.format(
-                index=index,
-                page_start=page_start,
-                page_end=page_end,
-                **kwargs))
-            ser_objs = cursor.fetchone()[0]
-            if ser_objs:
-                total_objs += len(ser_objs)
-                helpers.bulk(client(), ser_objs, **es_args)
-        page_start = page_end
-    return total_objs
-
-def migrate_nodes(index, delete, increment=10000):
+    return run_pages(
+        step or 'sql',
+        get_pages(max_id, increment),
+        functools.partial(fetch_sql_page, sql=sql, index=index, **kwargs),
+        functools.partial(send_sql_page, es_args=es_args),
+        state=state,
+        workers=workers,
+    )
+
+def migrate_nodes(index, delete, increment=10000, state=None, workers=1):
     logger.info('Migrating nodes to index: {}'.format(index))
-    max_nid = AbstractNode.objects.last().id
+    max_nid = get_max_id(AbstractNode.objects.all())
     total_nodes = sql_migrate(
         index,
         JSON_UPDATE_NODES_SQL,
         max_nid,
         increment,
+        step='nodes',
+        state=state,
+        workers=workers,
         spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
     logger.info('{} nodes migrated'.format(total_nodes))
     if delete:
         logger.info('Preparing to delete old node documents')
-        max_nid = AbstractNode.objects.last().id
+        max_nid = get_max_id(AbstractNode.objects.all())
         total_nodes = sql_migrate(
             index,
             JSON_DELETE_NODES_SQL,
             max_nid,
             increment,
             es_args={'raise_on_error': False},  # ignore 404s
+            step='nodes:delete',
+            state=state,
+            workers=workers,
             spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
         logger.info('{} nodes marked deleted'.format(total_nodes))
 
-def migrate_preprints(index, delete):
+def fetch_preprints(page, index=None):
+    return list(es_search.iter_index_actions(Preprint.objects.filter(id__gt=page[0], id__lte=page[1]), index=index, include_files=False))
+
+def send_preprints(actions):
+    success, errors = helpers.bulk(client(), actions, raise_on_error=False)
+    # Preprints that shouldn't be indexed are deleted, which 404s if they were never indexed
+    errors = [error for error in errors if error.get('delete', {}).get('status') != 404]
+    if errors:
+        logger.error('{} preprints failed to index: {}'.format(len(errors), errors[:10]))
+    return len(actions) - len(errors)
+
+def migrate_preprints(index, delete, increment=1000, state=None, workers=1):
     logger.info('Migrating preprints to index: {}'.format(index))
-    preprints = Preprint.objects.all()
-    increment = 100
-    paginator = Paginator(preprints, increment)
-    for page_number in paginator.page_range:
-        logger.info('Updating page {} / {}'.format(page_number, paginator.num_pages))
-        Preprint.bulk_update_search(paginator.page(page_number).object_list, index=index)
-
-def migrate_preprint_files(index, delete):
-    logger.info('Migrating preprint files to index: {}'.format(index))
-    valid_preprints = Preprint.objects.all()
-    valid_preprint_files = BaseFileNode.objects.filter(preprint__in=valid_preprints)
-    paginator = Paginator(valid_preprint_files, 500)
+    total_preprints = run_pages(
+        'preprints',
+        get_pages(get_max_id(Preprint.objects.all()), increment),
+        functools.partial(fetch_preprints, index=index),
+        send_preprints,
+        state=state,
+        workers=workers,
+    )
+    logger.info('{} preprints migrated'.format(total_preprints))
+
+def fetch_preprint_files(page):
+    return list(BaseFileNode.objects.filter(preprint__in=Preprint.objects.all(), id__gt=page[0], id__lte=page[1]))
+
+def send_preprint_files(files, index=None):
     serialize = functools.partial(search.update_file, index=index)
-    for page_number in paginator.page_range:
-        logger.info('Updating page {} / {}'.format(page_number, paginator.num_pages))
-        search.bulk_update_nodes(serialize, paginator.page(page_number).object_list, index=index, category='file')
+    search.bulk_update_nodes(serialize, files, index=index, category='file')
+    return len(files)
 
-def migrate_files(index, delete, increment=10000):
+def migrate_preprint_files(index, delete, increment=5000, state=None, workers=1):
+    logger.info('Migrating preprint files to index: {}'.format(index))
+    run_pages(
+        'preprint_files',
+        get_pages(get_max_id(BaseFileNode.objects.all()), increment),
+        fetch_preprint_files,
+        functools.partial(send_preprint_files, index=index),
+        state=state,
+        workers=workers,
+    )
+
+def migrate_files(index, delete, increment=10000, state=None, workers=1):
     logger.info('Migrating files to index: {}'.format(index))
-    max_fid = BaseFileNode.objects.last().id
+    max_fid = get_max_id(BaseFileNode.objects.all())
     total_files = sql_migrate(
         index,
         JSON_UPDATE_FILES_SQL,
         max_fid,
         increment,
+        step='files',
+        state=state,
+        workers=workers,
         spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
     logger.info('{} files migrated'.format(total_files))
     if delete:
         logger.info('Preparing to delete old file documents')
-        max_fid = BaseFileNode.objects.last().id
+        max_fid = get_max_id(BaseFileNode.objects.all())
         total_files = sql_migrate(
             index,
             JSON_DELETE_FILES_SQL,
             max_fid,
             increment,
             es_args={'raise_on_error': False},  # ignore 404s
+            step='files:delete',
+            state=state,
+            workers=workers,
             spam_flagged_removed_from_search=settings.SPAM_FLAGGED_REMOVE_FROM_SEARCH)
         logger.info('{} files marked deleted'.format(total_files))
 
-def migrate_users(index, delete, increment=10000):
+def migrate_users(index, delete, increment=10000, state=None, workers=1):
     logger.info('Migrating users to index: {}'.format(index))
-    max_uid = OSFUser.objects.last().id
+    max_uid = get_max_id(OSFUser.objects.all())
     total_users = sql_migrate(
         index,
         JSON_UPDATE_USERS_SQL,
         max_uid,
-        increment)
+        increment,
+        step='users',
+        state=state,
+        workers=workers)
     logger.info('{} users migrated'.format(total_users))
     if delete:
         logger.info('Preparing to delete old user documents')
-        max_uid = OSFUser.objects.last().id
+        max_uid = get_max_id(OSFUser.objects.all())
         total_users = sql_migrate(
             index,
             JSON_DELETE_USERS_SQL,
             max_uid,
             increment,
-            es_args={'raise_on_error': False})  # ignore 404s
+            es_args={'raise_on_error': False},  # ignore 404s
+            step='users:delete',
+            state=state,
+            workers=workers)
         logger.info('{} users marked deleted'.format(total_users))
 
-def migrate_collected_metadata(index, delete):
+def migrate_collected_metadata(index, delete, state=None, workers=1):
     cgms = CollectionSubmission.objects.filter(
         collection__provider__isnull=False,
         collection__is_public=True,
@@ -177,17 +346,20 @@ def migrate_collected_metadata(index, delete):
     bulk_update_collected_metadata(cgms, index=index)
     logger.info('{} collection submissions migrated'.format(cgms.count()))
 
-def migrate_institutions(index):
+def migrate_institutions(index, delete, state=None, workers=1):
     for inst in Institution.objects.filter(is_deleted=False):
         update_institution(inst, index)
 
-def migrate(delete, remove=False, index=None, app=None):
+def migrate(delete, remove=False, index=None, app=None, workers=1, state_file=None):
     """Reindexes relevant documents in ES
 
     :param bool delete: Delete documents that should not be indexed
     :param bool remove: Removes old index after migrating
     :param str index: index alias to version and migrate
     :param App app: Flask app for context
+    :param int workers: Number of processes migrating pages of each document type
+    :param str state_file: Path where progress is saved. If it holds the progress of an
+        interrupted migration, that migration is resumed. Removed once the migration is done.
     """
     index = index or settings.ELASTIC_INDEX
     app = app or init_app('website.settings', set_backends=True, routes=True)
@@ -199,22 +371,36 @@ def migrate(delete, remove=False, index=None, app=None):
     ctx = app.test_request_context()
     ctx.push()
 
-    new_index = set_up_index(index)
-
+    state = MigrationState(state_file)
+    if state.index:
+        new_index = state.index
+        logger.info('Resuming migration to {}, finished steps: {}'.format(new_index, ', '.join(state.data['steps']) or 'none'))
+    else:
+        new_index = set_up_index(index)
+        state.start(new_index)
+
+    steps = [
+        ('nodes', migrate_nodes),
+        ('files', migrate_files),
+        ('users', migrate_users),
+        ('preprints', migrate_preprints),
+        ('preprint_files', migrate_preprint_files),
+        ('collected_metadata', migrate_collected_metadata),
+    ]
     if settings.ENABLE_INSTITUTIONS:
-        migrate_institutions(new_index)
-    migrate_nodes(new_index, delete=delete)
-    migrate_files(new_index, delete=delete)
-    migrate_users(new_index, delete=delete)
-    migrate_preprints(new_index, delete=delete)
-    migrate_preprint_files(new_index, delete=delete)
-    migrate_collected_metadata(new_index, delete=delete)
+        steps.insert(0, ('institutions', migrate_institutions))
+    for step, migrate_step in steps:
+        if state.is_step_done(step):
+            continue
+        migrate_step(new_index, delete=delete, state=state, workers=workers)
+        state.finish_step(step)
 
     set_up_alias(index, new_index)
 
     if remove:
         remove_old_index(new_index)
 
+    state.clear()
     ctx.pop()
 
 def set_up_index(idx):
@@ -112,6 +112,21 @@ ELASTIC_KWARGS = {
     # 'client_cert': None,
     # 'client_key': None
 }
+# Number of objects serialized per database round trip and sent per ES bulk request
+ELASTIC_BULK_CHUNK_SIZE = 500
+# Number of threads sending bulk requests to ES concurrently; 1 streams from the current thread
+ELASTIC_BULK_WORKERS = 1
+# Coalesce async node/preprint reindexes: updates to the same object within the settle window are
+# collapsed into a single bulk reindex. Only used when USE_CELERY is on.
+SEARCH_INDEX_DEBOUNCE = True
+SEARCH_INDEX_SETTLE_SECONDS = 5
+
+# Buffer page view/download counter increments in each process and apply them in batches instead
+# of one locked row update per hit. Buffered increments are applied when the buffer holds
+# PAGE_COUNTER_BUFFER_SIZE pages/days or PAGE_COUNTER_FLUSH_INTERVAL seconds after the oldest one.
+PAGE_COUNTER_WRITE_BEHIND = False
+PAGE_COUNTER_BUFFER_SIZE = 1000
+PAGE_COUNTER_FLUSH_INTERVAL = 10
 
 # Sessions
 COOKIE_NAME = 'osf'
@@ -389,6 +404,7 @@ class CeleryConfig:
         'scripts.populate_new_and_noteworthy_projects',
         'scripts.populate_popular_projects_and_registrations',
         'website.search.elastic_search',
+        'website.search.index_queue',
         'scripts.generate_sitemap',
         'scripts.generate_prereg_csv',
         'scripts.analytics.run_keen_summaries',
@@ -455,6 +471,7 @@ class CeleryConfig:
         'website.notifications.tasks',
         'website.archiver.tasks',
         'website.search.search',
+        'website.search.index_queue',
         'website.project.tasks',
         'scripts.populate_new_and_noteworthy_projects',
         'scripts.populate_popular_projects_and_registrations',
@@ -611,9 +628,18 @@ assert (DRAFT_REGISTRATION_APPROVAL_PERIOD > EMBARGO_END_DATE_MIN), 'The draft r
 # TODO: Remove references to this flag
 ENABLE_INSTITUTIONS = True
 
+# Non-celery postcommit tasks run on a bounded gevent pool shared across requests
+POSTCOMMIT_POOL_SIZE = 30
+# Seconds to wait for a request's postcommit tasks before returning the response
+POSTCOMMIT_TIMEOUT = 5.0
+# If True, return the response without waiting for postcommit tasks to finish
+POSTCOMMIT_FIRE_AND_FORGET = False
+
 ENABLE_VARNISH = False
 ENABLE_ESI = False
 VARNISH_SERVERS = []  # This should be set in local.py or cache invalidation won't work
+VARNISH_BAN_TIMEOUT = 0.3  # seconds
+VARNISH_BAN_CONCURRENCY = 10  # max simultaneous BAN requests across all Varnish servers
 ESI_MEDIA_TYPES = {'application/vnd.api+json', 'application/json'}
 
 # Used for gathering meta information about the current build
@@ -1807,7 +1833,13 @@ RECAPTCHA_VERIFY_URL = 'https://recaptcha.net/recaptcha/api/siteverify'
 
 # akismet spam check
 AKISMET_APIKEY = None
+# Base URL to use instead of the Akismet API, e.g. a local fake server
+AKISMET_URL = None
+# Akismet requests in flight at once per process, and connections kept open
+AKISMET_MAX_CONCURRENT_REQUESTS = 4
 SPAM_CHECK_ENABLED = False
+# Check nodes and preprints in a celery task after the request instead of while saving them
+SPAM_CHECK_ASYNC = False
 SPAM_CHECK_PUBLIC_ONLY = True
 SPAM_ACCOUNT_SUSPENSION_ENABLED = False
 SPAM_ACCOUNT_SUSPENSION_THRESHOLD = timedelta(hours=24)